@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+"""
+Price alert rules evaluated on every published snapshot.
+
+Rules are compiled once into arrays: conditions are grouped by (column,
+operator, baseline window) so each group is a single broadcast comparison
+of thresholds x companies, and per-rule AND is a reduceat over the
+condition rows. Sector and company scopes are lookup tables indexed by the
+companies' codes. Matches are edge-triggered (a rule fires for a company
+when it starts matching) and delivered in batches per webhook through a
+pooled requests session with retries.
+
+Rules file (JSON list), e.g.:
+    [
+      {"id": "banks-down-5", "sector": "بنوك",
+       "conditions": [{"field": "change_pct", "op": "lt", "value": -5}]},
+      {"id": "volume-spike",
+       "conditions": [{"field": "volume", "op": "gt", "times": 3, "avg_days": 20}]}
+    ]
+
+Usage:
+    python alerts.py receive [--port 9009]          # stand-in webhook receiver
+    python alerts.py bench [--rules 5000] [--rows 220]
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from history import NUMERIC_COLUMNS
+from query import QueryError, resolve_column
+from targets import COLUMNS
+
+logger = logging.getLogger(__name__)
+
+ALERT_RULES_PATH = Path(os.getenv('ALERT_RULES_PATH', 'data/alert_rules.json'))
+ALERT_WEBHOOK_URL = os.getenv('ALERT_WEBHOOK_URL', '')
+ALERT_BATCH_SIZE = int(os.getenv('ALERT_BATCH_SIZE', '500'))
+
+OPERATORS = {
+    'gt': np.greater,
+    'ge': np.greater_equal,
+    'lt': np.less,
+    'le': np.less_equal,
+    'eq': np.equal,
+    'ne': np.not_equal,
+}
+
+# Recent matches kept for /alerts
+RECENT_MATCHES = 200
+
+
+@dataclass(frozen=True)
+class Condition:
+    """column <op> value, or column <op> times x its average over avg_days days"""
+    column: str
+    op: str
+    value: Optional[float] = None
+    times: Optional[float] = None
+    avg_days: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class AlertRule:
+    id: str
+    conditions: Tuple[Condition, ...]
+    sectors: Tuple[str, ...] = ()
+    companies: Tuple[str, ...] = ()
+    webhook: Optional[str] = None
+    repeat: bool = False  # notify on every snapshot while matching, not only when it starts
+
+
+def parse_rule(spec):
+    """Validate a rule dict (see module docstring) into an AlertRule"""
+    try:
+        rule_id = str(spec['id'])
+        raw_conditions = spec['conditions']
+    except (KeyError, TypeError):
+        raise ValueError(f"Rule needs 'id' and 'conditions': {spec!r}")
+    if not raw_conditions:
+        raise ValueError(f"Rule {rule_id} has no conditions")
+
+    conditions = []
+    for raw in raw_conditions:
+        try:
+            column = resolve_column(raw['field'])
+        except (KeyError, QueryError) as e:
+            raise ValueError(f"Rule {rule_id}: {e}")
+        if column not in NUMERIC_COLUMNS:
+            raise ValueError(f"Rule {rule_id}: {raw['field']} is not numeric")
+        op = raw.get('op', 'gt')
+        if op not in OPERATORS:
+            raise ValueError(f"Rule {rule_id}: unknown operator {op!r}")
+        if 'times' in raw:
+            conditions.append(Condition(column, op, times=float(raw['times']), avg_days=int(raw.get('avg_days', 20))))
+        elif 'value' in raw:
+            conditions.append(Condition(column, op, value=float(raw['value'])))
+        else:
+            raise ValueError(f"Rule {rule_id}: condition needs 'value' or 'times'")
+
+    def as_tuple(value):
+        if value is None:
+            return ()
+        return (value,) if isinstance(value, str) else tuple(value)
+
+    return AlertRule(
+        id=rule_id,
+        conditions=tuple(conditions),
+        sectors=as_tuple(spec.get('sector', spec.get('sectors'))),
+        companies=as_tuple(spec.get('company', spec.get('companies'))),
+        webhook=spec.get('webhook'),
+        repeat=bool(spec.get('repeat', False)),
+    )
+
+
+def load_rules(path=ALERT_RULES_PATH):
+    """Rules from a JSON file; an absent file means no rules"""
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [parse_rule(spec) for spec in json.load(f)]
+
+
+def _scope_table(rules, attribute):
+    """
+    (vocabulary, allowed) where allowed[rule, code] says whether a company
+    with that code is in the rule's scope; the last code is 'anything else'.
+    """
+    vocabulary = sorted({value for rule in rules for value in getattr(rule, attribute)})
+    codes = {value: i for i, value in enumerate(vocabulary)}
+    allowed = np.zeros((len(rules), len(vocabulary) + 1), dtype=bool)
+    for i, rule in enumerate(rules):
+        values = getattr(rule, attribute)
+        if values:
+            allowed[i, [codes[v] for v in values]] = True
+        else:
+            allowed[i, :] = True
+    return pd.Index(vocabulary), allowed
+
+
+class CompiledRules:
+    """Rules laid out as arrays for vectorized evaluation"""
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        conditions = [c for rule in self.rules for c in rule.conditions]
+        counts = [len(rule.conditions) for rule in self.rules]
+        self.starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.intp) if counts else np.zeros(0, np.intp)
+        self.condition_count = len(conditions)
+
+        groups = collections.defaultdict(list)
+        for i, c in enumerate(conditions):
+            groups[(c.column, c.op, c.avg_days)].append(i)
+        self.groups = []
+        for (column, op, avg_days), indices in groups.items():
+            thresholds = np.array(
+                [conditions[i].times if avg_days else conditions[i].value for i in indices], dtype='float64'
+            )
+            self.groups.append((column, op, avg_days, np.array(indices, dtype=np.intp), thresholds))
+
+        self.baseline_needs = sorted({(c.column, c.avg_days) for c in conditions if c.avg_days})
+        self.sector_vocabulary, self.sector_allowed = _scope_table(self.rules, 'sectors')
+        self.company_vocabulary, self.company_allowed = _scope_table(self.rules, 'companies')
+        self.repeat = np.array([rule.repeat for rule in self.rules], dtype=bool)
+        self.fields = [
+            sorted({c.column for c in rule.conditions}, key=COLUMNS.index) for rule in self.rules
+        ]
+
+    def _codes(self, vocabulary, values):
+        codes = vocabulary.get_indexer(values)
+        codes[codes < 0] = len(vocabulary)
+        return codes
+
+    def evaluate(self, frame, baselines=None):
+        """Boolean matrix rules x companies of current matches"""
+        n = len(frame)
+        if not self.rules or not n:
+            return np.zeros((len(self.rules), n), dtype=bool)
+        baselines = baselines or {}
+        names = frame[COLUMNS[0]]
+
+        matrix = np.empty((self.condition_count, n), dtype=bool)
+        for column, op, avg_days, indices, thresholds in self.groups:
+            values = frame[column].to_numpy(dtype='float64')
+            if avg_days:
+                base = baselines.get((column, avg_days))
+                base = base.reindex(names).to_numpy(dtype='float64') if base is not None else np.full(n, np.nan)
+                rhs = thresholds[:, None] * base[None, :]
+                valid = ~np.isnan(values)[None, :] & ~np.isnan(base)[None, :]
+            else:
+                rhs = thresholds[:, None]
+                valid = ~np.isnan(values)[None, :]
+            # Missing values never match, not even 'ne'
+            matrix[indices] = OPERATORS[op](values[None, :], rhs) & valid
+
+        matches = np.logical_and.reduceat(matrix, self.starts, axis=0)
+        matches &= self.sector_allowed[:, self._codes(self.sector_vocabulary, frame[COLUMNS[1]])]
+        matches &= self.company_allowed[:, self._codes(self.company_vocabulary, names)]
+        return matches
+
+
+def compute_baselines(store, needs, snapshot_ts):
+    """
+    Per-company daily averages for (column, days) pairs, from the close of
+    each of the previous `days` days in the history store.
+    """
+    if not needs or store is None:
+        return {}
+    longest = max(days for _, days in needs)
+    end = pd.Timestamp(snapshot_ts).normalize() - pd.Timedelta(microseconds=1)
+    start = end.normalize() - timedelta(days=longest * 2)  # calendar days cover trading days
+    columns = sorted({column for column, _ in needs}, key=COLUMNS.index)
+    history = store.read_range(start, end, columns=['snapshot_ts', COLUMNS[0], *columns])
+    if history.empty:
+        return {}
+
+    history['day'] = history['snapshot_ts'].dt.normalize()
+    daily = history.sort_values('snapshot_ts').groupby(['day', COLUMNS[0]], sort=True)[columns].last()
+    baselines = {}
+    for column, days in needs:
+        wide = daily[column].unstack(COLUMNS[0])
+        baselines[(column, days)] = wide.tail(days).mean()
+    return baselines
+
+
+class WebhookDispatcher:
+    """Batched webhook delivery over a pooled session with retries"""
+
+    def __init__(self, default_url=ALERT_WEBHOOK_URL, batch_size=ALERT_BATCH_SIZE, timeout=10, retries=3):
+        self.default_url = default_url
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['POST']),
+        )
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.sent = 0
+        self.failed = 0
+        self.requests = 0
+
+    def dispatch(self, alerts, snapshot_id=None):
+        """POST alerts grouped by webhook, batch_size per request. Returns (sent, failed)."""
+        by_url = collections.defaultdict(list)
+        for alert in alerts:
+            url = alert.pop('webhook', None) or self.default_url
+            if url:
+                by_url[url].append(alert)
+
+        sent = failed = 0
+        for url, items in by_url.items():
+            for offset in range(0, len(items), self.batch_size):
+                batch = items[offset:offset + self.batch_size]
+                payload = {'batch_id': uuid.uuid4().hex, 'snapshot_id': snapshot_id, 'alerts': batch}
+                self.requests += 1
+                try:
+                    response = self.session.post(url, json=payload, timeout=self.timeout)
+                    response.raise_for_status()
+                    sent += len(batch)
+                except requests.RequestException as e:
+                    logger.warning(f"Alert delivery to {url} failed: {e}")
+                    failed += len(batch)
+        self.sent += sent
+        self.failed += failed
+        return sent, failed
+
+    def info(self):
+        return {'sent': self.sent, 'failed': self.failed, 'requests': self.requests}
+
+
+class AlertEngine:
+    """Compiled rules plus match state across snapshots"""
+
+    def __init__(self, rules=(), store=None, dispatcher=None):
+        self.store = store
+        self.dispatcher = dispatcher
+        self.recent = collections.deque(maxlen=RECENT_MATCHES)
+        self.last_evaluation = None
+        self._baseline_cache = (None, {})
+        self.set_rules(rules)
+
+    def set_rules(self, rules):
+        self.compiled = CompiledRules(rules)
+        self._previous = None  # (company index, match matrix) of the last snapshot
+        logger.info(f"Loaded {len(self.compiled.rules)} alert rule(s)")
+
+    def _baselines(self, snapshot_ts):
+        day = pd.Timestamp(snapshot_ts).normalize()
+        cached_day, cached = self._baseline_cache
+        if cached_day == day and all(need in cached for need in self.compiled.baseline_needs):
+            return cached
+        baselines = compute_baselines(self.store, self.compiled.baseline_needs, snapshot_ts)
+        self._baseline_cache = (day, baselines)
+        return baselines
+
+    def load_previous(self, store=None):
+        """
+        Seed the match state from the latest snapshot of the history store, so
+        rules that already matched before a restart do not fire again.
+        Returns the snapshot id, or None when there is nothing to seed from.
+        """
+        store = store or self.store
+        if store is None or not self.compiled.rules:
+            return None
+        for day, _ in reversed(store.partitions()):
+            end = pd.Timestamp(day) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+            for _, frame in store.iter_days(start=day, end=end):
+                if frame.empty:
+                    continue
+                frame = frame[frame['snapshot_ts'] == frame['snapshot_ts'].max()]
+                frame = frame.drop_duplicates(COLUMNS[0], keep='last')
+                matches = self.compiled.evaluate(frame, self._baselines(frame['snapshot_ts'].iat[0]))
+                self._previous = (pd.Index(frame[COLUMNS[0]]), matches)
+                return frame['snapshot_id'].iat[0]
+        return None
+
+    def evaluate(self, frame):
+        """New matches for a normalized snapshot, as alert dicts"""
+        started = time.perf_counter()
+        # Matches are tracked per company name, which must be unique
+        frame = frame.drop_duplicates(COLUMNS[0], keep='last')
+        snapshot_ts = frame['snapshot_ts'].iat[0] if len(frame) else pd.Timestamp.now()
+        baselines = self._baselines(snapshot_ts)
+        baseline_seconds = time.perf_counter() - started
+
+        matches = self.compiled.evaluate(frame, baselines)
+        companies = pd.Index(frame[COLUMNS[0]])
+
+        fresh = matches.copy()
+        if self._previous is not None:
+            previous_companies, previous = self._previous
+            positions = previous_companies.get_indexer(companies)
+            known = positions >= 0
+            was_matching = np.zeros_like(matches)
+            was_matching[:, known] = previous[:, positions[known]]
+            fresh &= ~was_matching | self.compiled.repeat[:, None]
+        self._previous = (companies, matches)
+        evaluate_seconds = time.perf_counter() - started - baseline_seconds
+
+        alerts = []
+        snapshot_id = frame['snapshot_id'].iat[0] if len(frame) else None
+        for rule_index, row in zip(*np.nonzero(fresh)):
+            rule = self.compiled.rules[rule_index]
+            alerts.append({
+                'rule': rule.id,
+                'company': frame[COLUMNS[0]].iat[row],
+                'sector': frame[COLUMNS[1]].iat[row],
+                'values': {
+                    column: (None if pd.isna(frame[column].iat[row]) else float(frame[column].iat[row]))
+                    for column in self.compiled.fields[rule_index]
+                },
+                'snapshot_id': snapshot_id,
+                'webhook': rule.webhook,
+            })
+
+        self.last_evaluation = {
+            'snapshot_id': snapshot_id,
+            'rules': len(self.compiled.rules),
+            'companies': len(frame),
+            'matching': int(matches.sum()),
+            'new_matches': len(alerts),
+            'baseline_ms': round(baseline_seconds * 1000, 2),
+            'evaluate_ms': round(evaluate_seconds * 1000, 2),
+        }
+        return alerts
+
+    def process(self, frame):
+        """Evaluate a snapshot and deliver its new matches"""
+        alerts = self.evaluate(frame)
+        self.recent.extend({k: v for k, v in alert.items() if k != 'webhook'} for alert in alerts)
+        if alerts and self.dispatcher is not None:
+            started = time.perf_counter()
+            sent, failed = self.dispatcher.dispatch(alerts, self.last_evaluation['snapshot_id'])
+            self.last_evaluation.update({
+                'sent': sent,
+                'failed': failed,
+                'dispatch_ms': round((time.perf_counter() - started) * 1000, 2),
+            })
+        return self.last_evaluation
+
+    def info(self, recent=50):
+        return {
+            'rules': len(self.compiled.rules),
+            'conditions': self.compiled.condition_count,
+            'last_evaluation': self.last_evaluation,
+            'delivery': self.dispatcher.info() if self.dispatcher else None,
+            'recent_matches': list(self.recent)[-recent:],
+        }
+
+
+# Stand-in receiver and benchmark
+
+class _ReceiverHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        payload = json.loads(body or b'{}')
+        self.server.received.append(payload)
+        logger.info(f"Received batch {payload.get('batch_id')} with {len(payload.get('alerts', []))} alert(s)")
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_receiver(port=9009):
+    """Local stand-in webhook receiver in a background thread. Returns the server."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), _ReceiverHandler)
+    server.received = []
+    threading.Thread(target=server.serve_forever, name='alert-receiver', daemon=True).start()
+    return server
+
+
+def random_rules(count, seed=0):
+    """Synthetic rule set mixing absolute, relative and sector-scoped rules"""
+    from fixtures import SECTORS
+
+    rng = np.random.default_rng(seed)
+    rules = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            conditions = [{'field': 'change_pct', 'op': 'lt', 'value': float(-rng.uniform(1, 8))}]
+        elif kind == 1:
+            conditions = [{'field': 'volume', 'op': 'gt', 'times': float(rng.uniform(1.5, 4)), 'avg_days': 20}]
+        else:
+            conditions = [
+                {'field': 'change_pct', 'op': 'gt', 'value': float(rng.uniform(1, 5))},
+                {'field': 'value', 'op': 'gt', 'value': float(rng.uniform(1e5, 1e7))},
+            ]
+        spec = {'id': f"rule-{i}", 'conditions': conditions}
+        if rng.random() < 0.5:
+            spec['sector'] = str(rng.choice(SECTORS))
+        rules.append(parse_rule(spec))
+    return rules
+
+
+def bench(rule_count, rows, port):
+    from fixtures import synthetic_prices
+    from history import normalize_snapshot
+
+    receiver = start_receiver(port)
+    started = time.perf_counter()
+    rules = random_rules(rule_count)
+    engine = AlertEngine(rules, dispatcher=WebhookDispatcher(f"http://127.0.0.1:{port}/alerts"))
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    # Baselines as if 20 days of history were stored
+    frames = [normalize_snapshot(synthetic_prices(rows, seed=0, drift=d * 0.1), pd.Timestamp('2026-01-01 14:00'))
+              for d in range(2)]
+    engine._baseline_cache = (pd.Timestamp('2026-01-01'), {
+        ('الكمية', 20): frames[0].set_index(COLUMNS[0])['الكمية'] * 0.8,
+    })
+    for frame in frames:
+        result = engine.process(frame)
+        logger.info(f"Snapshot: {result}")
+    receiver.shutdown()
+    logger.info(f"Compiled {rule_count} rules in {compile_ms:.1f} ms; "
+                f"receiver got {sum(len(p['alerts']) for p in receiver.received)} alert(s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Alert rules tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    receive = sub.add_parser('receive', help="Run a stand-in webhook receiver")
+    receive.add_argument('--port', type=int, default=9009)
+    benchmark = sub.add_parser('bench', help="Evaluate synthetic rules against synthetic snapshots")
+    benchmark.add_argument('--rules', type=int, default=5000)
+    benchmark.add_argument('--rows', type=int, default=220)
+    benchmark.add_argument('--port', type=int, default=9009)
+    args = parser.parse_args(argv)
+
+    if args.command == 'receive':
+        server = start_receiver(args.port)
+        logger.info(f"Receiving alerts on http://127.0.0.1:{args.port}/ (Ctrl+C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        bench(args.rules, args.rows, args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Raw page archive and offline re-parsing.
+
+Every run stores the HTML of each target's table, as it was after the click
+and row repair, under data/archive/objects/. Files are brotli-compressed and
+named by the SHA-256 of the HTML, so identical tables are stored once. A
+daily JSON-lines index (data/archive/index/YYYY-MM-DD.jsonl) maps snapshot
+ids, targets and header texts to objects. Background pre-scrapes are
+indexed too, under their snapshot id with a "-background" suffix, since
+they are not published as snapshots.
+
+The reparse command reads archived pages back and runs them through the
+current table parser. The parser is the same cell/selector schema the
+browser reads, applied to the stored HTML without a browser. The pages are
+spread across a process pool, and the regenerated snapshots are written to
+a history store. Snapshots already in that store are skipped, so a re-run
+only adds what is missing. Background captures are left out unless
+--background is given:
+
+    python archive.py reparse --start 2026-01-01 --end 2026-01-31 \\
+        [--target egx_prices] [--workers 8] [--output data/reparsed] [--background]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from html.parser import HTMLParser
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+import gzip
+
+logger = logging.getLogger(__name__)
+
+PAGE_ARCHIVE = os.getenv('PAGE_ARCHIVE', 'true').lower() in ('1', 'true', 'yes')
+ARCHIVE_DIR = Path(os.getenv('ARCHIVE_DIR', 'data/archive'))
+
+BROTLI_QUALITY = 6
+
+# Snapshot id suffix of pages captured by background pre-scrapes
+BACKGROUND_SUFFIX = '-background'
+
+
+# Storage
+
+def _object_path(root, digest, suffix):
+    return Path(root) / 'objects' / digest[:2] / f"{digest}.html{suffix}"
+
+
+def store_page(html, root=ARCHIVE_DIR):
+    """Write a page under its content hash (once). Returns its digest and sizes."""
+    data = html.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    suffix = '.br' if brotli is not None else '.gz'
+    path = _object_path(root, digest, suffix)
+    if path.exists():
+        return {'digest': digest, 'bytes': len(data), 'stored_bytes': path.stat().st_size, 'new': False}
+    compressed = brotli.compress(data, quality=BROTLI_QUALITY) if brotli is not None else gzip.compress(data, 6)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + f'.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(compressed)
+    os.replace(tmp_path, path)
+    return {'digest': digest, 'bytes': len(data), 'stored_bytes': len(compressed), 'new': True}
+
+
+def capture(archived, target_name, html, root=ARCHIVE_DIR):
+    """Store a target's table HTML and note it in archived; a failure only logs"""
+    if not html:
+        return None
+    try:
+        archived[target_name] = store_page(html, root)
+    except OSError as e:
+        logger.warning(f"[{target_name}] Page not archived: {e}")
+        return None
+    return archived[target_name]
+
+
+def load_page(digest, root=ARCHIVE_DIR):
+    for suffix, decompress in (('.br', brotli and brotli.decompress), ('.gz', gzip.decompress)):
+        path = _object_path(root, digest, suffix)
+        if decompress and path.exists():
+            return decompress(path.read_bytes()).decode('utf-8')
+    raise FileNotFoundError(f"Archived page {digest} not found")
+
+
+def record(snapshot_id, snapshot_ts, target, page, header_text, root=ARCHIVE_DIR):
+    """Add an index entry linking a snapshot's target to its archived page"""
+    entry = {
+        'snapshot_id': snapshot_id,
+        'snapshot_ts': pd.Timestamp(snapshot_ts).isoformat(),
+        'target': target,
+        'digest': page['digest'],
+        'bytes': page['bytes'],
+        'stored_bytes': page['stored_bytes'],
+        'header_text': header_text,
+    }
+    index_dir = Path(root) / 'index'
+    index_dir.mkdir(parents=True, exist_ok=True)
+    with open(index_dir / f"{pd.Timestamp(snapshot_ts):%Y-%m-%d}.jsonl", 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    return entry
+
+
+def entries(start=None, end=None, target=None, root=ARCHIVE_DIR):
+    """Index entries in [start, end], oldest first"""
+    index_dir = Path(root) / 'index'
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    # A date-only end includes that whole day
+    if end is not None and end == end.normalize():
+        end = end + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+    found = []
+    for path in sorted(index_dir.glob('*.jsonl')):
+        day = pd.Timestamp(path.stem)
+        if (start is not None and day < start.normalize()) or (end is not None and day > end):
+            continue
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line of an interrupted write
+                ts = pd.Timestamp(entry['snapshot_ts'])
+                if target and entry['target'] != target:
+                    continue
+                if (start is not None and ts < start) or (end is not None and ts > end):
+                    continue
+                found.append(entry)
+    return sorted(found, key=lambda e: e['snapshot_ts'])
+
+
+# Offline table parsing
+
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+
+class _Node:
+    __slots__ = ('tag', 'attrs', 'children', 'parent')
+
+    def __init__(self, tag, attrs=(), parent=None):
+        self.tag = tag
+        self.attrs = dict(attrs)
+        self.children = []
+        self.parent = parent
+
+    def elements(self, *tags):
+        return [c for c in self.children if isinstance(c, _Node) and (not tags or c.tag in tags)]
+
+    def text(self):
+        """Approximation of innerText: descendant text with whitespace collapsed"""
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+            else:
+                if node.tag == 'br':
+                    parts.append('\n')
+                stack.extend(reversed(node.children))
+        return ' '.join(''.join(parts).split())
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _Node('#root')
+        self.current = self.root
+
+    def handle_starttag(self, tag, attrs):
+        node = _Node(tag, attrs, self.current)
+        self.current.children.append(node)
+        if tag not in VOID_ELEMENTS:
+            self.current = node
+
+    def handle_startendtag(self, tag, attrs):
+        self.current.children.append(_Node(tag, attrs, self.current))
+
+    def handle_endtag(self, tag):
+        node = self.current
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:
+            self.current = node.parent
+
+    def handle_data(self, data):
+        self.current.children.append(data)
+
+
+def parse_html(html):
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+def _parse_selector(selector):
+    """':scope > div > div:nth-of-type(2) > a > span' -> [(tag, nth or None)]"""
+    parts = [p.strip() for p in selector.split('>')]
+    if parts and parts[0] == ':scope':
+        parts = parts[1:]
+    steps = []
+    for part in parts:
+        tag, nth = part, None
+        if ':nth-of-type(' in part:
+            tag, _, rest = part.partition(':nth-of-type(')
+            nth = int(rest.rstrip(')'))
+        if not tag.isalnum():
+            raise ValueError(f"Unsupported selector for offline parsing: {selector!r}")
+        steps.append((tag.lower(), nth))
+    return steps
+
+
+def _select(node, steps):
+    """First element in document order matching child-combinator steps"""
+    if not steps:
+        return node
+    tag, nth = steps[0]
+    matches = node.elements(tag)
+    if nth is not None:
+        matches = matches[nth - 1:nth]
+    for child in matches:
+        found = _select(child, steps[1:])
+        if found is not None:
+            return found
+    return None
+
+
+def find_all(node, tag):
+    """Descendant elements with a tag, in document order"""
+    found = []
+    stack = list(reversed(node.elements()))
+    while stack:
+        element = stack.pop()
+        if element.tag == tag:
+            found.append(element)
+        stack.extend(reversed(element.elements()))
+    return found
+
+
+def select_path(node, path):
+    """
+    Element at a simple XPath ('/html/body/table/tbody/tr[2]/td', absolute or
+    relative to node). Parsers only add tbody in browsers, so a tbody step
+    missing from the source is skipped.
+    """
+    for step in path.strip('/').split('/'):
+        tag, _, index = step.partition('[')
+        index = int(index.rstrip(']')) if index else 1
+        children = node.elements(tag)
+        if not children and tag == 'tbody':
+            continue
+        if len(children) < index:
+            return None
+        node = children[index - 1]
+    return node
+
+
+def table_rows(table, target):
+    """
+    Rows of a parsed table, read the way TABLE_ROWS_JS reads the live page:
+    rows of the first tbody after the header row, one cell per column spec
+    """
+    bodies = table.elements('tbody')
+    body = bodies[0] if bodies else table
+    rows = body.elements('tr')
+    end = min(len(rows), target.max_rows + 1) if target.max_rows else len(rows)
+    specs = [(c.cell, _parse_selector(c.selector) if c.selector else None) for c in target.columns]
+    result = []
+    for row in rows[1:end]:
+        cells = row.elements('td', 'th')
+        values = []
+        for cell, steps in specs:
+            if cell >= len(cells):
+                values.append('')
+                continue
+            node = _select(cells[cell], steps) if steps else None
+            values.append((node or cells[cell]).text())
+        result.append(values)
+    return result
+
+
+def parse_table(html, target):
+    """Rows of an archived table (the first table of the HTML)"""
+    tables = find_all(parse_html(html), 'table')
+    return table_rows(tables[0], target) if tables else []
+
+
+# Re-parse
+
+def _reparse_entry(args):
+    """Worker: archived page -> normalized snapshot (or an error)"""
+    entry, root = args
+    from history import normalize_snapshot
+    from scraper import rows_to_dataframe
+    from targets import TARGETS
+
+    try:
+        target = TARGETS[entry['target']]
+        rows = parse_table(load_page(entry['digest'], root), target)
+        df = rows_to_dataframe(rows, target.columns)
+        return entry, normalize_snapshot(df, pd.Timestamp(entry['snapshot_ts']).to_pydatetime()), None
+    except Exception as e:
+        return entry, None, f"{type(e).__name__}: {e}"
+
+
+def _existing_snapshots(store, selected):
+    """Snapshot ids of the store in the time span of the selected entries"""
+    if not selected:
+        return set()
+    existing = set()
+    first, last = selected[0]['snapshot_ts'], selected[-1]['snapshot_ts']
+    for _, frame in store.iter_days(first, last, columns=['snapshot_id', 'snapshot_ts']):
+        existing.update(frame['snapshot_id'])
+    return existing
+
+
+def reparse(start=None, end=None, target='egx_prices', workers=None, output='data/reparsed', root=ARCHIVE_DIR,
+            batch_size=200, background=False):
+    """Regenerate snapshots from archived pages in parallel. Returns a report."""
+    from history import HistoryStore, snapshot_id_for
+
+    selected = entries(start, end, target, root)
+    if not background:
+        selected = [e for e in selected if not e['snapshot_id'].endswith(BACKGROUND_SUFFIX)]
+    store = HistoryStore(output)
+    existing = _existing_snapshots(store, selected)
+    skipped = len(selected)
+    selected = [e for e in selected if snapshot_id_for(pd.Timestamp(e['snapshot_ts'])) not in existing]
+    skipped -= len(selected)
+    started = time.perf_counter()
+    frames, failed, rows = [], [], 0
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(selected) // (workers * 8))
+        for entry, frame, error in pool.map(_reparse_entry, [(e, root) for e in selected], chunksize=chunksize):
+            if error or frame is None or frame.empty:
+                failed.append({'snapshot_id': entry['snapshot_id'], 'error': error or 'No rows parsed'})
+                continue
+            frames.append(frame)
+            rows += len(frame)
+            if len(frames) >= batch_size:
+                store.append(frames, batch_id=f"reparse-{datetime.now():%Y%m%d%H%M%S%f}")
+                frames = []
+    if frames:
+        store.append(frames, batch_id=f"reparse-{datetime.now():%Y%m%d%H%M%S%f}")
+    seconds = time.perf_counter() - started
+    return {
+        'pages': len(selected),
+        'skipped': skipped,
+        'parsed': len(selected) - len(failed),
+        'failed': failed,
+        'rows': rows,
+        'seconds': round(seconds, 2),
+        'pages_per_second': round(len(selected) / seconds, 1) if seconds else None,
+        'workers': workers,
+        'output': str(output),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Page archive tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    again = sub.add_parser('reparse', help="Regenerate snapshots from archived pages with the current parser")
+    again.add_argument('--start', help="First day or timestamp (default: oldest)")
+    again.add_argument('--end', help="Last day or timestamp (default: newest)")
+    again.add_argument('--target', default='egx_prices')
+    again.add_argument('--workers', type=int, default=None)
+    again.add_argument('--output', default='data/reparsed', help="History store written with the snapshots")
+    again.add_argument('--archive', default=str(ARCHIVE_DIR))
+    again.add_argument('--background', action='store_true', help="Include pages of background pre-scrapes")
+    args = parser.parse_args(argv)
+
+    report = reparse(
+        args.start, args.end, args.target, args.workers, args.output, Path(args.archive), background=args.background
+    )
+    logger.info(
+        f"Re-parsed {report['parsed']}/{report['pages']} page(s), {report['rows']} rows in {report['seconds']}s "
+        f"({report['pages_per_second']} pages/s, {report['workers']} workers) into {report['output']}, "
+        f"{report['skipped']} already there"
+    )
+    for failure in report['failed'][:20]:
+        logger.warning(f"{failure['snapshot_id']}: {failure['error']}")
+    return 1 if report['failed'] else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,314 @@
+"""
+Download artifacts: precompressed variants, validators and ranged responses.
+
+When an export is published, it is frozen under a content-addressed name
+(a hard link, so no copy) and gzip/brotli variants are written next to it
+once, with the content hash as the ETag. Published files never change, so
+a download in flight is not affected by the next publish.
+Downloads then negotiate Accept-Encoding, answer If-None-Match with 304,
+honour single byte ranges, and stream the file in large chunks read off the
+event loop. The ASGI zero-copy/pathsend extensions are used when a server
+offers them, but uvicorn offers neither, so under uvicorn every download
+is streamed in chunks.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+
+import anyio
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Variants that do not save at least this fraction are not kept
+# (e.g. XLSX is already deflate-compressed)
+MIN_SAVING = 0.10
+
+CHUNK_SIZE = 256 * 1024
+
+# Preference when the client accepts several encodings equally
+ENCODING_PREFERENCE = ['br', 'gzip', 'identity']
+ENCODING_SUFFIX = {'br': '.br', 'gzip': '.gz'}
+
+
+# Per-directory folder holding the content-addressed files
+ARTIFACT_DIRNAME = '.artifacts'
+
+# Published metadata by export path
+_published = {}
+
+
+def _artifact_dir(path):
+    return path.parent / ARTIFACT_DIRNAME
+
+
+def _meta_path(path):
+    return _artifact_dir(path) / f"{path.name}.meta.json"
+
+
+def _atomic_write(path, data):
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def publish_artifact(path):
+    """
+    Freeze a freshly written export and its compressed variants.
+    Returns the metadata dict.
+    """
+    path = Path(path)
+    data = path.read_bytes()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    stat = path.stat()
+    directory = _artifact_dir(path)
+    directory.mkdir(exist_ok=True)
+    base = f"{path.name}.{digest}"
+
+    frozen = directory / base
+    if not frozen.exists():
+        try:
+            os.link(path, frozen)
+        except OSError:
+            _atomic_write(frozen, data)
+
+    compressors = {'gzip': lambda d: gzip.compress(d, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors['br'] = lambda d: brotli.compress(d, quality=11)
+
+    variants = {'identity': {'file': base, 'size': len(data), 'etag': f'"{digest}"'}}
+    for encoding, compress in compressors.items():
+        compressed = compress(data)
+        if len(compressed) <= len(data) * (1 - MIN_SAVING):
+            name = base + ENCODING_SUFFIX[encoding]
+            _atomic_write(directory / name, compressed)
+            variants[encoding] = {'file': name, 'size': len(compressed), 'etag': f'"{digest}-{encoding}"'}
+
+    previous = _published.get(str(path)) or _read_meta(path)
+    meta = {
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'digest': digest,
+        'previous_digest': previous['digest'] if previous and previous['digest'] != digest else None,
+        'variants': variants,
+    }
+    _atomic_write(_meta_path(path), json.dumps(meta).encode())
+    _published[str(path)] = meta
+
+    # Keep the current and previous versions, so downloads in flight can finish
+    keep = {digest, meta['previous_digest']}
+    for old in directory.glob(f"{path.name}.*"):
+        if old.name.endswith('.meta.json'):
+            continue
+        if old.name[len(path.name) + 1:].split('.')[0] not in keep:
+            old.unlink(missing_ok=True)
+
+    logger.info(
+        f"Published {path.name}: "
+        + ", ".join(f"{encoding} {variant['size']} bytes" for encoding, variant in variants.items())
+    )
+    return meta
+
+
+def _read_meta(path):
+    try:
+        return json.loads(_meta_path(path).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def get_artifact(path):
+    """
+    Published metadata of an export. Served from memory; on a miss (first
+    use after a restart) the stored metadata is validated against the file
+    and the export is republished if it changed.
+    """
+    path = Path(path)
+    meta = _published.get(str(path))
+    if meta is not None:
+        return meta
+    meta = _read_meta(path)
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    if meta is None or meta['mtime'] != stat.st_mtime or meta['size'] != stat.st_size:
+        return publish_artifact(path)
+    _published[str(path)] = meta
+    return meta
+
+
+def cached_artifact(path):
+    """Published metadata if it is already in memory (no disk access)"""
+    return _published.get(str(Path(path)))
+
+
+def parse_accept_encoding(header):
+    """{encoding: q} from an Accept-Encoding header"""
+    accepted = {}
+    for part in (header or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(';')
+        q = 1.0
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header, available):
+    """Best available encoding for the client; identity unless refused"""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*')
+
+    def quality(encoding):
+        if encoding in accepted:
+            return accepted[encoding]
+        if wildcard is not None:
+            return wildcard
+        return 1.0 if encoding == 'identity' else 0.0
+
+    candidates = [e for e in ENCODING_PREFERENCE if e in available and quality(e) > 0]
+    if not candidates:
+        return 'identity'
+    return max(candidates, key=lambda e: (quality(e), -ENCODING_PREFERENCE.index(e)))
+
+
+def etag_matches(header, etag):
+    """If-None-Match comparison (weak, as RFC 9110 requires for this header)"""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    tags = [t.strip() for t in header.split(',')]
+    return any(t.removeprefix('W/') == etag for t in tags)
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single 'bytes=' range, None when absent or
+    ignored (multiple ranges), or 'invalid' when unsatisfiable.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    spec = header[len('bytes='):].strip()
+    if ',' in spec:
+        return None
+    start, _, end = spec.partition('-')
+    try:
+        if start == '':
+            length = int(end)
+            if length <= 0:
+                return 'invalid'
+            return max(0, size - length), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return 'invalid'
+    return start, min(end, size - 1)
+
+
+class FileRangeResponse(Response):
+    """
+    Sends [offset, offset + length) of a file in chunks read in a worker
+    thread. Servers offering the ASGI zero-copy (sendfile) or pathsend
+    extension get the file handed over instead; uvicorn offers neither.
+    """
+
+    def __init__(self, path, offset, length, status_code=200, headers=None, media_type=None, send_body=True):
+        super().__init__(content=None, status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.send_body = send_body
+        self.headers['content-length'] = str(length)
+
+    async def __call__(self, scope, receive, send):
+        extensions = scope.get('extensions') or {}
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+
+        if not self.send_body or self.length == 0:
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        if 'http.response.zerocopy' in extensions:
+            with open(self.path, 'rb') as f:
+                await send({
+                    'type': 'http.response.zerocopy',
+                    'file': f.fileno(),
+                    'offset': self.offset,
+                    'count': self.length,
+                })
+            return
+
+        if 'http.response.pathsend' in extensions and self.offset == 0 and self.length == os.path.getsize(self.path):
+            await send({'type': 'http.response.pathsend', 'path': str(self.path)})
+            return
+
+        async with await anyio.open_file(self.path, 'rb') as f:
+            await f.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+            if remaining > 0:
+                await send({'type': 'http.response.body', 'body': b''})
+
+
+def artifact_response(request, path, meta, filename, media_type, max_age=0):
+    """Build the negotiated (possibly 304 or 206) response for an artifact"""
+    encoding = choose_encoding(request.headers.get('accept-encoding'), meta['variants'])
+    variant = meta['variants'][encoding]
+    variant_path = _artifact_dir(Path(path)) / variant['file']
+    size = variant['size']
+
+    headers = {
+        'etag': variant['etag'],
+        'vary': 'Accept-Encoding',
+        'cache-control': f"public, max-age={max(0, int(max_age))}, must-revalidate",
+        'accept-ranges': 'bytes',
+        'content-disposition': f'attachment; filename="{filename}"',
+    }
+    if encoding != 'identity':
+        headers['content-encoding'] = encoding
+
+    if etag_matches(request.headers.get('if-none-match'), variant['etag']):
+        return Response(status_code=304, headers={k: v for k, v in headers.items() if k != 'content-disposition'})
+
+    send_body = request.method != 'HEAD'
+    byte_range = parse_range(request.headers.get('range'), size)
+    if_range = request.headers.get('if-range')
+    if byte_range is not None and if_range and if_range != variant['etag']:
+        byte_range = None
+
+    if byte_range == 'invalid':
+        headers['content-range'] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    if byte_range is not None:
+        start, end = byte_range
+        headers['content-range'] = f"bytes {start}-{end}/{size}"
+        return FileRangeResponse(variant_path, start, end - start + 1, 206, headers, media_type, send_body)
+
+    return FileRangeResponse(variant_path, 0, size, 200, headers, media_type, send_body)
@@ -0,0 +1,474 @@
+"""
+asyncio-native scraping engine speaking the Chrome DevTools Protocol.
+
+Chromium is launched in new headless mode with a remote debugging port and
+driven over a single websocket from the event loop, so a scrape does not hold
+an executor thread, every wait is a cancellable await and each phase runs
+under its own asyncio.timeout. Several pages (CDP sessions) can be scraped
+concurrently over one browser connection.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import websockets
+
+import archive
+from network_capture import AsyncNetworkCapture, network_extraction_enabled
+from network_shaping import get_blocked_urls, resource_blocking_enabled
+from scraper import (
+    TABLE_ROWS_JS,
+    MARK_TABLE_JS,
+    TABLE_READY_JS,
+    CLICK_JS,
+    TEXT_JS,
+    TABLE_CELLS_JS,
+    TABLE_HTML_JS,
+    column_specs,
+    rows_to_dataframe,
+)
+from targets import EGX_PRICES, plan_navigation
+from validation import async_repair_table
+
+logger = logging.getLogger(__name__)
+
+CHROMIUM_PATH = os.getenv('CHROMIUM_PATH', '/usr/bin/chromium')
+
+# Seconds allowed for each phase of a scrape
+PHASE_TIMEOUTS = {
+    'launch': 30,
+    'navigate': 60,
+    'click': 45,
+    'table': 60,
+    'extract': 30,
+}
+
+# Poll interval while waiting for page state
+POLL_INTERVAL = 0.5
+
+CHROMIUM_ARGS = [
+    '--headless=new',
+    '--remote-debugging-port=0',
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--disable-extensions',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--disable-translate',
+    '--disable-background-networking',
+    '--disable-breakpad',
+    '--mute-audio',
+    '--no-first-run',
+    '--disable-blink-features=AutomationControlled',
+    '--window-size=1280,720',
+]
+
+
+class CDPError(Exception):
+    """Error returned by the browser for a DevTools command"""
+
+
+class CDPConnection:
+    """
+    One websocket to the browser. Commands are matched to responses by id and
+    events are routed to waiters by (session, method).
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._waiters = []
+        self._handlers = {}
+        self._reader = asyncio.create_task(self._read_loop())
+
+    @classmethod
+    async def connect(cls, url):
+        ws = await websockets.connect(url, max_size=None, ping_interval=None)
+        return cls(ws)
+
+    async def send(self, method, params=None, session_id=None):
+        message_id = next(self._ids)
+        message = {'id': message_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            await self.ws.send(json.dumps(message))
+            return await future
+        except websockets.ConnectionClosed:
+            raise CDPError("Browser connection closed")
+        finally:
+            self._pending.pop(message_id, None)
+
+    def on(self, method, handler, session_id=None):
+        """Register a callback for every occurrence of an event"""
+        self._handlers.setdefault((session_id, method), []).append(handler)
+
+    def off(self, method, handler, session_id=None):
+        """Remove a callback registered with on()"""
+        handlers = self._handlers.get((session_id, method), [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def wait_for(self, method, session_id=None, predicate=None):
+        """Future resolved with the params of the next matching event"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((session_id, method, predicate, future))
+        return future
+
+    async def _read_loop(self):
+        try:
+            async for raw in self.ws:
+                message = json.loads(raw)
+                if 'id' in message:
+                    future = self._pending.get(message['id'])
+                    if future and not future.done():
+                        if 'error' in message:
+                            future.set_exception(CDPError(message['error'].get('message')))
+                        else:
+                            future.set_result(message.get('result', {}))
+                    continue
+                self._dispatch(message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            error = CDPError("Browser connection closed")
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            for _, _, _, future in self._waiters:
+                if not future.done():
+                    future.set_exception(error)
+
+    def _dispatch(self, message):
+        session_id = message.get('sessionId')
+        method = message.get('method')
+        params = message.get('params', {})
+
+        for handler in self._handlers.get((session_id, method), []):
+            try:
+                handler(params)
+            except Exception as e:
+                logger.warning(f"CDP handler for {method} failed: {e}")
+
+        remaining = []
+        for waiter in self._waiters:
+            waiter_session, waiter_method, predicate, future = waiter
+            if future.done():
+                continue
+            if waiter_session == session_id and waiter_method == method and (predicate is None or predicate(params)):
+                future.set_result(params)
+            else:
+                remaining.append(waiter)
+        self._waiters = remaining
+
+    async def close(self):
+        await self.ws.close()
+        self._reader.cancel()
+
+
+class AsyncPage:
+    """A browser tab attached as a flattened CDP session"""
+
+    def __init__(self, browser, target_id, session_id):
+        self.browser = browser
+        self.conn = browser.conn
+        self.target_id = target_id
+        self.session_id = session_id
+
+    async def send(self, method, params=None):
+        return await self.conn.send(method, params, session_id=self.session_id)
+
+    async def setup(self):
+        await self.send('Page.enable')
+        await self.send('Runtime.enable')
+        if resource_blocking_enabled() or network_extraction_enabled():
+            await self.send('Network.enable')
+        if resource_blocking_enabled():
+            await self.send('Network.setBlockedURLs', {'urls': get_blocked_urls()})
+        # Accept alerts as soon as they open, like the Selenium path does
+        self.conn.on('Page.javascriptDialogOpening', self._accept_dialog, session_id=self.session_id)
+
+    def _accept_dialog(self, params):
+        logger.info(f"Alert detected: {params.get('message')}")
+        asyncio.ensure_future(self.send('Page.handleJavaScriptDialog', {'accept': True}))
+
+    async def navigate(self, url):
+        loaded = self.conn.wait_for('Page.loadEventFired', session_id=self.session_id)
+        try:
+            result = await self.send('Page.navigate', {'url': url})
+            if result.get('errorText'):
+                raise CDPError(f"Navigation failed: {result['errorText']}")
+            await loaded
+        finally:
+            loaded.cancel()
+
+    async def evaluate(self, expression):
+        result = await self.send('Runtime.evaluate', {
+            'expression': expression,
+            'returnByValue': True,
+            'awaitPromise': True,
+        })
+        if 'exceptionDetails' in result:
+            raise CDPError(result['exceptionDetails'].get('text', 'Evaluation failed'))
+        return result.get('result', {}).get('value')
+
+    async def call(self, script, *args):
+        """Evaluate a Selenium-style script body with JSON arguments"""
+        expression = f"(function() {{ {script} }}).apply(null, {json.dumps(list(args))})"
+        return await self.evaluate(expression)
+
+    async def wait_until(self, script, *args):
+        """Poll a script until it returns a truthy value; transient errors while the page reloads are retried"""
+        while True:
+            try:
+                value = await self.call(script, *args)
+                if value:
+                    return value
+            except CDPError:
+                pass
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def close(self):
+        try:
+            await self.conn.send('Target.closeTarget', {'targetId': self.target_id})
+        except CDPError:
+            pass
+
+
+class AsyncBrowser:
+    """Chromium process plus its DevTools connection"""
+
+    def __init__(self, binary=CHROMIUM_PATH):
+        self.binary = binary
+        self.process = None
+        self.conn = None
+        self.user_data_dir = None
+        self._stderr_task = None
+
+    async def start(self):
+        try:
+            self.user_data_dir = tempfile.mkdtemp(prefix='egx-chromium-')
+            self.process = await asyncio.create_subprocess_exec(
+                self.binary, *CHROMIUM_ARGS, f'--user-data-dir={self.user_data_dir}', 'about:blank',
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            ws_url = await self._read_ws_url()
+            # Keep reading stderr so a chatty Chromium never blocks on a full pipe
+            self._stderr_task = asyncio.create_task(self._drain_stderr())
+            self.conn = await CDPConnection.connect(ws_url)
+        except BaseException:
+            # Failed or timed out launch: no process or profile directory is left behind
+            if self.process and self.process.returncode is None and self.conn is None:
+                self.process.kill()
+            await self.close()
+            raise
+        logger.info(f"Headless Chromium started (pid {self.process.pid})")
+        return self
+
+    async def _read_ws_url(self):
+        while True:
+            line = await self.process.stderr.readline()
+            if not line:
+                raise CDPError("Chromium exited before exposing DevTools")
+            match = re.search(rb'DevTools listening on (ws://\S+)', line)
+            if match:
+                return match.group(1).decode()
+
+    async def _drain_stderr(self):
+        while True:
+            line = await self.process.stderr.readline()
+            if not line:
+                return
+            logger.debug(f"Chromium: {line.decode(errors='replace').rstrip()}")
+
+    async def new_page(self):
+        target = await self.conn.send('Target.createTarget', {'url': 'about:blank'})
+        attached = await self.conn.send('Target.attachToTarget', {
+            'targetId': target['targetId'],
+            'flatten': True,
+        })
+        page = AsyncPage(self, target['targetId'], attached['sessionId'])
+        await page.setup()
+        return page
+
+    async def close(self):
+        if self.conn:
+            try:
+                async with asyncio.timeout(5):
+                    await self.conn.send('Browser.close')
+            except (CDPError, TimeoutError):
+                pass
+            await self.conn.close()
+        if self.process and self.process.returncode is None:
+            try:
+                async with asyncio.timeout(5):
+                    await self.process.wait()
+            except TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        if self._stderr_task:
+            self._stderr_task.cancel()
+            self._stderr_task = None
+        if self.user_data_dir:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+            self.user_data_dir = None
+
+    async def __aenter__(self):
+        async with asyncio.timeout(PHASE_TIMEOUTS['launch']):
+            return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+async def _timed(phases, name, coro):
+    """Await one phase under its timeout, adding its duration to phases"""
+    started = time.perf_counter()
+    async with asyncio.timeout(PHASE_TIMEOUTS[name]):
+        result = await coro
+    phases[name] = round(phases.get(name, 0) + time.perf_counter() - started, 3)
+    return result
+
+
+async def _click(page, step, table_xpath):
+    await page.call(MARK_TABLE_JS, table_xpath)
+    await page.wait_until(CLICK_JS, step.xpath)
+
+
+async def _run_page_group(browser, group, phases, expected_rows, repairs, archived, extraction, run):
+    """Run targets that share one page: navigate once, then their steps and reads"""
+    page = await browser.new_page()
+    results = {}
+    try:
+        for target, steps, reload in group:
+            if reload:
+                logger.info(f"Navigating to {target.url}...")
+                await _timed(phases, 'navigate', page.navigate(target.url))
+            else:
+                logger.info(f"[{target.name}] Reusing loaded page")
+
+            capture = AsyncNetworkCapture(page, target) if steps and network_extraction_enabled() else None
+            for step in steps:
+                logger.info("Clicking the button...")
+                if capture is not None:
+                    capture.arm()
+                await _timed(phases, 'click', _click(page, step, target.table_xpath))
+                if capture is not None:
+                    logger.info("Waiting for the table response...")
+                    if await _timed(phases, 'table', capture.wait(step.wait)):
+                        continue
+                    logger.info(f"Network capture fell back to the DOM ({capture.fallback_reason})")
+                logger.info("Waiting for table to load...")
+                await _timed(phases, 'table', page.wait_until(TABLE_READY_JS, target.table_xpath))
+            captured = capture.result if capture else None
+            extraction[target.name] = capture.report() if capture else {'mode': 'dom'}
+
+            specs = column_specs(target)
+            if captured is not None:
+                rows = captured.rows
+            else:
+                rows = await _timed(phases, 'extract', page.call(
+                    TABLE_ROWS_JS, target.table_xpath, specs, target.max_rows
+                ))
+            rows, repairs[target.name] = await async_repair_table(
+                rows or [], target,
+                lambda positions: page.call(TABLE_CELLS_JS, target.table_xpath, specs, positions),
+                expected_rows.get(target.name),
+            )
+            if archive.PAGE_ARCHIVE:
+                html = captured.table_html if captured else await page.call(TABLE_HTML_JS, target.table_xpath)
+                await run(archive.capture, archived, target.name, html)
+            header_text = "Not found"
+            if captured is not None and captured.header_text:
+                header_text = captured.header_text
+            elif target.header_xpath:
+                header_text = await page.call(TEXT_JS, target.header_xpath) or header_text
+
+            df = rows_to_dataframe(rows, target.columns)
+            logger.info(f"[{target.name}] Total rows scraped: {len(df)}")
+            results[target.name] = (df, header_text)
+    finally:
+        await page.close()
+    return results
+
+
+async def async_run_targets(targets, browser=None, stats=None, expected_rows=None, run=asyncio.to_thread):
+    """
+    Scrape several targets through one browser. Targets sharing a page reuse
+    its navigation; different pages run concurrently as separate sessions.
+    Blocking calls (page archiving) go through run(fn, *args).
+    Returns: {target name: (DataFrame, header_text)}
+    """
+    if browser is None:
+        async with AsyncBrowser() as own_browser:
+            return await async_run_targets(targets, own_browser, stats, expected_rows, run)
+
+    groups = []
+    for entry in plan_navigation(targets):
+        reload = entry[2]
+        if reload or not groups:
+            groups.append([])
+        groups[-1].append(entry)
+
+    phases = {}
+    results = {}
+    repairs = {}
+    archived = {}
+    extraction = {}
+    pages = (
+        _run_page_group(browser, g, phases, expected_rows or {}, repairs, archived, extraction, run)
+        for g in groups
+    )
+    for group_results in await asyncio.gather(*pages):
+        results.update(group_results)
+    logger.info(f"Scraped {len(results)} target(s) (phases: {phases})")
+
+    if stats is not None:
+        stats['engine'] = 'async'
+        stats['phases'] = phases
+        stats['rows'] = {name: len(df) for name, (df, _) in results.items()}
+        stats['repair'] = repairs
+        stats['repaired_rows'] = sum(r.get('repaired_rows', 0) for r in repairs.values())
+        stats['extraction'] = extraction
+        if archived:
+            stats['archive'] = archived
+    return results
+
+
+async def async_scrape_egx_stocks(browser=None, stats=None):
+    """
+    Scrape the EGX prices page without blocking the event loop.
+    Pass a started AsyncBrowser to share it between concurrent scrapes.
+    Returns: (DataFrame, header_text)
+    """
+    results = await async_run_targets([EGX_PRICES], browser, stats)
+    return results[EGX_PRICES.name]
+
+
+async def scrape_concurrently(count):
+    """Run several scrapes as concurrent sessions of one browser"""
+    async with AsyncBrowser() as browser:
+        return await asyncio.gather(
+            *(async_scrape_egx_stocks(browser) for _ in range(count)),
+            return_exceptions=True,
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    df, header = asyncio.run(async_scrape_egx_stocks())
+    logger.info(f"Header: {header}")
+    logger.info(f"Rows: {len(df)}")
@@ -1,222 +1,80 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-import pandas as pd
+#!/usr/bin/env python3
+"""
+Standalone scrape with a local Chrome, saved as timestamped Excel files.
+
+Runs the registered targets (targets.py) through scraper.run_targets, so it
+uses the same navigation, XPaths, extraction and repair as the service.
+Each table is written next to the script (or to --output-dir) as its
+target's output filename with "latest" replaced by the run's timestamp,
+e.g. egx_stocks_YYYYMMDD_HHMMSS.xlsx, the naming import_history.py reads.
+
+Usage:
+    python backup.py [target ...] [--output-dir DIR]
+"""
+import argparse
+import logging
+import sys
 import time
+from pathlib import Path
+
+from scraper import get_local_driver, run_targets
+from targets import EGX_PRICES, TARGETS, get_targets
+
+logger = logging.getLogger(__name__)
 
-def scrape_egx_stocks():
+
+def backup_filename(target, stamp):
+    """Output filename of a target, timestamped instead of "latest" """
+    name = target.output_filename
+    if '_latest' in name:
+        return name.replace('_latest', f'_{stamp}')
+    path = Path(name)
+    return f"{path.stem}_{stamp}{path.suffix}"
+
+
+def backup_targets(targets=(EGX_PRICES,), output_dir='.'):
     """
-    Scrapes stock data from Egyptian Exchange website
+    Scrape the targets with a local Chrome and save each to Excel.
+    Returns: {target name: (DataFrame, header_text)}
     """
-    # URL to scrape
-    url = "https://www.egx.com.eg/ar/prices.aspx"
-    
-    # Column names in Arabic
-    columns = [
-        'اسم الشركة',
-        'القطاع',
-        'الإقفال السابق',
-        'سعر الفتح',
-        'سعر الاغلاق',
-        'نسبة التغير%',
-        'آخر سعر',
-        'اعلى سعر',
-        'اقل سعر',
-        'القيمة (جنيه)',
-        'الكمية',
-        'عدد العمليات',
-        'رأس المال السوقى (مليون جنيه)'
-    ]
-    
-    # Initialize Chrome driver
-    print("Initializing Chrome driver...")
-    options = webdriver.ChromeOptions()
-    options.add_argument('--disable-blink-features=AutomationControlled')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    
-    driver = webdriver.Chrome(options=options)
-    
+    driver = get_local_driver()
     try:
-        # Navigate to the URL
-        print(f"Navigating to {url}...")
-        driver.get(url)
-        
-        # Wait for page to load
-        print("Waiting for page to load (10 seconds)...")
-        time.sleep(10)
-        
-        # Click the button using XPath
-        button_xpath = "/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/table[1]/tbody/tr[2]/td/div/div/ul/li[1]/a"
-        print("Clicking the button...")
-        
-        # Try multiple times in case of alert errors
-        max_attempts = 3
-        for attempt in range(max_attempts):
-            try:
-                button = WebDriverWait(driver, 15).until(
-                    EC.element_to_be_clickable((By.XPATH, button_xpath))
-                )
-                
-                # Use JavaScript click as alternative
-                driver.execute_script("arguments[0].click();", button)
-                print(f"Button clicked (attempt {attempt + 1})")
-                
-                # Wait a moment for any alerts
-                time.sleep(2)
-                
-                # Check for and dismiss any alerts
-                try:
-                    alert = driver.switch_to.alert
-                    alert_text = alert.text
-                    print(f"Alert detected: {alert_text}")
-                    alert.accept()
-                    print("Alert dismissed, retrying...")
-                    time.sleep(2)
-                    continue
-                except:
-                    # No alert, success
-                    break
-                    
-            except Exception as e:
-                print(f"Attempt {attempt + 1} failed: {str(e)}")
-                if attempt < max_attempts - 1:
-                    print("Retrying...")
-                    time.sleep(3)
-                else:
-                    raise
-        
-        # Wait for table to appear
-        print("Waiting for table to load (20 seconds)...")
-        time.sleep(20)
-        
-        # Check for any remaining alerts
-        try:
-            alert = driver.switch_to.alert
-            print(f"Alert found: {alert.text}")
-            alert.accept()
-            time.sleep(2)
-        except:
-            pass
-        
-        # Scrape the header text
-        header_xpath = "/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table/tbody/tr[1]/td[2]/p"
-        try:
-            header_text = driver.find_element(By.XPATH, header_xpath).text
-            print(f"Header text: {header_text}")
-        except NoSuchElementException:
-            header_text = "Not found"
-            print("Header text not found")
-        
-        # Initialize data storage
-        stock_data = []
-        
-        # Scrape rows from 2 to 220
-        print("Scraping stock data...")
-        consecutive_empty = 0
-        
-        for i in range(2, 221):
-            try:
-                row_data = {}
-                
-                # Scrape company name (column 2)
-                company_xpath = f"/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table/tbody/tr[{i}]/td[2]/div/div[2]/a/span"
-                try:
-                    company_name = driver.find_element(By.XPATH, company_xpath).text
-                    row_data['اسم الشركة'] = company_name
-                except NoSuchElementException:
-                    # Try alternative xpath without div/div[2]
-                    try:
-                        alt_company_xpath = f"/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table/tbody/tr[{i}]/td[2]"
-                        company_name = driver.find_element(By.XPATH, alt_company_xpath).text
-                        row_data['اسم الشركة'] = company_name
-                    except:
-                        row_data['اسم الشركة'] = ""
-                
-                # Scrape sector (column 3)
-                sector_xpath = f"/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table/tbody/tr[{i}]/td[3]/div"
-                try:
-                    sector = driver.find_element(By.XPATH, sector_xpath).text
-                    row_data['القطاع'] = sector
-                except NoSuchElementException:
-                    # Try without div
-                    try:
-                        alt_sector_xpath = f"/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table/tbody/tr[{i}]/td[3]"
-                        sector = driver.find_element(By.XPATH, alt_sector_xpath).text
-                        row_data['القطاع'] = sector
-                    except:
-                        row_data['القطاع'] = ""
-                
-                # Scrape remaining columns (4 to 14) - Total 11 columns
-                #Columns map: 4-الإقفال السابق, 5-سعر الفتح, 6-سعر الاغلاق, 7-نسبة التغير%
-                # 8-آخر سعر, 9-اعلى سعر, 10-اقل سعر, 11-القيمة, 12-الكمية, 13-عدد العمليات, 14-رأس المال
-                for col_num in range(4, 15):  # 4 to 14 inclusive
-                    col_index = col_num - 2  # Convert to column name index (4->2, 5->3, etc.)
-                    col_name = columns[col_index]
-                    
-                    cell_xpath = f"/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table/tbody/tr[{i}]/td[{col_num}]"
-                    try:
-                        cell_value = driver.find_element(By.XPATH, cell_xpath).text
-                        row_data[col_name] = cell_value
-                    except NoSuchElementException:
-                        row_data[col_name] = ""
-                
-                # Check if row has any data
-                if row_data['اسم الشركة'] or any(row_data.get(col, "") for col in columns):
-                    stock_data.append(row_data)
-                    consecutive_empty = 0
-                    if len(stock_data) % 20 == 0:
-                        print(f"Scraped {len(stock_data)} stocks... (current row: {i})")
-                else:
-                    consecutive_empty += 1
-                    if consecutive_empty > 5:
-                        print(f"Reached end of table at row {i} (5 consecutive empty rows)")
-                        break
-                
-            except Exception as e:
-                consecutive_empty += 1
-                if consecutive_empty > 5:
-                    print(f"Reached end of table at row {i}")
-                    break
-        
-        print(f"Total stocks scraped: {len(stock_data)}")
-        
-        # Create DataFrame
-        df = pd.DataFrame(stock_data, columns=columns)
-        
-        # Save to Excel
-        filename = f"egx_stocks_{time.strftime('%Y%m%d_%H%M%S')}.xlsx"
-        df.to_excel(filename, index=False, engine='openpyxl')
-        print(f"\nData saved to {filename}")
-        print(f"Total rows: {len(df)}")
-        
-        # Display first few rows
-        print("\nFirst 5 rows:")
-        print(df.head())
-        
-        return df, header_text
-        
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-        raise
-        
+        results = run_targets(list(targets), driver)
     finally:
-        # Close the browser
-        print("\nClosing browser...")
+        logger.info("Closing browser...")
         driver.quit()
 
-if __name__ == "__main__":
-    print("=" * 60)
-    print("EGX Stock Data Scraper")
-    print("=" * 60)
-    
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for target in targets:
+        df, header_text = results[target.name]
+        path = output_dir / backup_filename(target, stamp)
+        df.to_excel(path, index=False, engine='openpyxl')
+        logger.info(f"[{target.name}] {len(df)} rows saved to {path} (header: {header_text})")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape with a local Chrome and save timestamped Excel files")
+    parser.add_argument('targets', nargs='*', default=[EGX_PRICES.name],
+                        help=f"Targets to scrape (registered: {', '.join(TARGETS)})")
+    parser.add_argument('--output-dir', default='.', help="Where to write the Excel files")
+    args = parser.parse_args(argv)
+
     try:
-        df, header = scrape_egx_stocks()
-        print("\n" + "=" * 60)
-        print("Scraping completed successfully!")
-        print("=" * 60)
+        targets = get_targets(args.targets)
+    except KeyError as e:
+        logger.error(f"Unknown target {e}")
+        return 2
+    try:
+        backup_targets(targets, args.output_dir)
     except Exception as e:
-        print(f"\nScraping failed: {str(e)}")
-        print("Please check your internet connection and try again.")
\ No newline at end of file
+        logger.error(f"Scraping failed: {str(e)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
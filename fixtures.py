@@ -0,0 +1,141 @@
+"""
+Synthetic EGX-shaped data for load and scale testing.
+
+Snapshots look like what the scrapers return: every value is text, numbers
+carry thousands separators and the change column a trailing '%'. Any
+number of rows can be generated (names stay unique), and snapshot_stream
+gives consecutive snapshots of the same companies. prices_table_html
+renders the table as the site serves it, and prices_page_html renders a
+snapshot as a page with the EGX prices page's layout (same XPaths, cell
+selectors and postback-style table swap), so browsers can be exercised
+without the network.
+"""
+from html import escape
+
+import numpy as np
+import pandas as pd
+
+from targets import COLUMNS
+
+SECTORS = [
+    'بنوك',
+    'عقارات',
+    'اتصالات وإعلام وتكنولوجيا المعلومات',
+    'خدمات مالية غير مصرفية',
+    'أغذية ومشروبات وتبغ',
+    'موارد أساسية',
+    'مواد البناء',
+    'رعاية صحية وأدوية',
+    'سياحة وترفيه',
+    'مقاولات وإنشاءات هندسية',
+    'كيماويات',
+    'تجارة وموزعون',
+]
+
+NAME_PARTS = [
+    'مصر', 'القاهرة', 'الإسكندرية', 'العربية', 'الدولية', 'الوطنية', 'المتحدة',
+    'للاستثمار', 'للتنمية', 'للصناعات', 'القابضة', 'للإسكان', 'للأسمدة', 'للأغذية',
+]
+
+
+def company_names(rows, seed=0):
+    """Deterministic, unique Arabic-looking company names"""
+    rng = np.random.default_rng(seed)
+    names = []
+    for i in range(rows):
+        words = rng.choice(NAME_PARTS, size=3, replace=False)
+        names.append(f"{' '.join(words)} {i + 1}")
+    return names
+
+
+def _format(values, decimals=2):
+    return [f"{v:,.{decimals}f}" for v in values]
+
+
+def synthetic_prices(rows=220, seed=0, drift=0.0):
+    """
+    A raw prices snapshot of `rows` companies as the scrapers produce it.
+    The same seed gives the same companies; `drift` shifts prices so
+    consecutive snapshots of a stream differ.
+    """
+    rng = np.random.default_rng(seed)
+    prev_close = np.round(rng.lognormal(2.0, 1.0, rows), 2)
+    change = rng.normal(drift, 2.0, rows)
+    close = np.round(prev_close * (1 + change / 100), 2)
+    open_ = np.round(prev_close * (1 + rng.normal(0, 0.5, rows) / 100), 2)
+    high = np.maximum.reduce([open_, close]) * (1 + rng.uniform(0, 0.02, rows))
+    low = np.minimum.reduce([open_, close]) * (1 - rng.uniform(0, 0.02, rows))
+    volume = rng.integers(1_000, 20_000_000, rows)
+    trades = rng.integers(1, 5_000, rows)
+
+    return pd.DataFrame({
+        COLUMNS[0]: company_names(rows, seed),
+        COLUMNS[1]: rng.choice(SECTORS, size=rows),
+        COLUMNS[2]: _format(prev_close),
+        COLUMNS[3]: _format(open_),
+        COLUMNS[4]: _format(close),
+        COLUMNS[5]: [f"{v:.2f}%" for v in (close / prev_close - 1) * 100],
+        COLUMNS[6]: _format(close),
+        COLUMNS[7]: _format(high),
+        COLUMNS[8]: _format(low),
+        COLUMNS[9]: _format(volume * close),
+        COLUMNS[10]: _format(volume, 0),
+        COLUMNS[11]: _format(trades, 0),
+        COLUMNS[12]: _format(prev_close * rng.uniform(50, 5_000, rows)),
+    })
+
+
+def snapshot_stream(rows=220, count=24, seed=0, start='2026-01-04 10:00', every='1h'):
+    """(timestamp, raw snapshot) pairs of the same companies, prices drifting from one to the next"""
+    start = pd.Timestamp(start)
+    for i in range(count):
+        yield start + i * pd.Timedelta(every), synthetic_prices(rows, seed, drift=i * 0.1)
+
+
+def prices_table_html(frame, header_text='Fixture prices'):
+    """The prices table of a snapshot, shaped like the site's (header row, then one row per company)"""
+    rows = [f'<tr><td></td><td><p>{escape(header_text)}</p></td></tr>']
+    for values in frame.itertuples(index=False):
+        name, sector, *numbers = values
+        # Change values are published without the % sign
+        numbers[3] = numbers[3].rstrip('%')
+        rows.append(
+            '<tr><td></td>'
+            f'<td><div><div></div><div><a href="#"><span>{escape(name)}</span></a></div></div></td>'
+            f'<td><div>{escape(sector)}</div></td>'
+            + ''.join(f'<td>{escape(v)}</td>' for v in numbers)
+            + '</tr>'
+        )
+    return '<table><tbody>' + ''.join(rows) + '</tbody></table>'
+
+
+def prices_page_html(frame, header_text='Fixture prices', delay_ms=300):
+    """
+    A static page shaped like the EGX prices page. It starts with a
+    placeholder table; clicking the prices tab swaps in the snapshot's table
+    after delay_ms, the way the site's postback does.
+    """
+    table = prices_table_html(frame, header_text)
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>EGX prices fixture</title></head><body>'
+        '<form><table><tbody>'
+        '<tr><td></td></tr>'
+        '<tr><td><center><center><div><table><tbody>'
+        '<tr><td></td></tr><tr><td></td></tr><tr><td></td></tr>'
+        '<tr><td>'
+        '<table><tbody><tr><td></td></tr><tr><td><div><div><ul>'
+        '<li><a href="#" onclick="showPrices(); return false;">الأسعار</a></li>'
+        '</ul></div></div></td></tr></tbody></table>'
+        '<div><div id="prices"><table><tbody><tr><td></td><td><p></p></td></tr></tbody></table></div></div>'
+        '</td></tr>'
+        '</tbody></table></div></center></center></td></tr>'
+        '</tbody></table></form>'
+        f'<template id="snapshot">{table}</template>'
+        '<script>'
+        'function showPrices() { setTimeout(function () {'
+        ' document.getElementById("prices").replaceChildren('
+        'document.getElementById("snapshot").content.cloneNode(true)); }, '
+        f'{int(delay_ms)}); }}'
+        '</script>'
+        '</body></html>'
+    )
@@ -0,0 +1,202 @@
+"""
+Remote WebDriver sessions on a Selenium Grid.
+
+Before each session the hub's /status is read to find the free slots per
+browser type. Browser types are tried in order of free capacity, then
+configured preference. The first one the hub accepts is used, so a
+missing or saturated browser type fails over to the next. Within a
+browser type the hub's distributor places the session on the least loaded
+node. The node that got the session and the acquisition time are recorded
+with the run's stats.
+
+Chrome and Edge sessions keep DevTools access (resource blocking and the
+performance log) through the vendor CDP endpoint the nodes expose.
+"""
+import logging
+import os
+import time
+
+import requests
+from selenium import webdriver
+from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+
+logger = logging.getLogger(__name__)
+
+SELENIUM_GRID_URL = os.getenv('SELENIUM_GRID_URL', '').rstrip('/')
+
+# Browser types tried on the grid, in order of preference
+GRID_BROWSERS = [
+    b.strip().lower() for b in os.getenv('GRID_BROWSERS', 'chrome,edge,firefox').split(',') if b.strip()
+]
+
+GRID_STATUS_TIMEOUT = 5
+
+# Grid stereotype browserName, CDP vendor prefix (None: no DevTools) per browser type
+BROWSERS = {
+    'chrome': ('chrome', 'goog'),
+    'edge': ('MicrosoftEdge', 'ms'),
+    'firefox': ('firefox', None),
+}
+
+CHROMIUM_ARGUMENTS = [
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-sync',
+    '--mute-audio',
+    '--no-first-run',
+    '--disable-blink-features=AutomationControlled',
+    '--window-size=1280,720',
+]
+
+
+class GridChromiumDriver(webdriver.Remote):
+    """Remote Chrome/Edge session with execute_cdp_cmd, like the local ChromiumDriver"""
+
+    def execute_cdp_cmd(self, cmd, cmd_args):
+        return self.execute("executeCdpCommand", {"cmd": cmd, "params": cmd_args})["value"]
+
+
+class GridUnavailable(Exception):
+    """No browser type on the grid could start a session"""
+
+
+def grid_status(url=SELENIUM_GRID_URL, timeout=GRID_STATUS_TIMEOUT):
+    """The hub's /status payload ('value')"""
+    response = requests.get(f"{url}/status", timeout=timeout)
+    response.raise_for_status()
+    return response.json()['value']
+
+
+def node_capacity(status):
+    """
+    Free and total slots per browser type over the nodes that are up:
+    {browser: {'free': n, 'total': n, 'nodes': [{'uri', 'free', 'total'}]}}
+    """
+    names = {grid_name.lower(): browser for browser, (grid_name, _) in BROWSERS.items()}
+    capacity = {}
+    for node in status.get('nodes', []):
+        if node.get('availability', 'UP') != 'UP':
+            continue
+        per_browser = {}
+        for slot in node.get('slots', []):
+            browser = names.get(str(slot.get('stereotype', {}).get('browserName', '')).lower())
+            if browser is None:
+                continue
+            counts = per_browser.setdefault(browser, [0, 0])
+            counts[1] += 1
+            if slot.get('session') is None:
+                counts[0] += 1
+        max_sessions = node.get('maxSessions')
+        busy = sum(1 for slot in node.get('slots', []) if slot.get('session') is not None)
+        for browser, (free, total) in per_browser.items():
+            # Slots share the node's session limit, so free slots can exceed what it will start
+            if max_sessions:
+                free = max(0, min(free, max_sessions - busy))
+            entry = capacity.setdefault(browser, {'free': 0, 'total': 0, 'nodes': []})
+            entry['free'] += free
+            entry['total'] += total
+            entry['nodes'].append({'uri': node.get('uri'), 'free': free, 'total': total})
+    return capacity
+
+
+def browser_order(capacity, preferences=GRID_BROWSERS):
+    """
+    Browser types to try: those with free slots, most free first, then ones
+    that are only busy (the hub queues the request); absent types are skipped
+    """
+    known = [b for b in preferences if b in BROWSERS and capacity.get(b, {}).get('total')]
+    return sorted(known, key=lambda b: (capacity[b]['free'] == 0, -capacity[b]['free'], preferences.index(b)))
+
+
+def session_node(status, session_id):
+    """URI of the node running a session, if listed"""
+    for node in status.get('nodes', []):
+        for slot in node.get('slots', []):
+            session = slot.get('session') or {}
+            if session.get('sessionId') == session_id:
+                return node.get('uri')
+    return None
+
+
+def browser_options(browser):
+    if browser == 'firefox':
+        options = webdriver.FirefoxOptions()
+        options.add_argument('--width=1280')
+        options.add_argument('--height=720')
+        return options
+    options = webdriver.EdgeOptions() if browser == 'edge' else webdriver.ChromeOptions()
+    for argument in CHROMIUM_ARGUMENTS:
+        options.add_argument(argument)
+    # Performance log feeds the per-run network accounting
+    prefix = BROWSERS[browser][1]
+    options.set_capability(f'{prefix}:loggingPrefs', {'performance': 'ALL'})
+    return options
+
+
+def create_session(browser, url=SELENIUM_GRID_URL):
+    """Start a session of one browser type on the grid"""
+    grid_name, vendor_prefix = BROWSERS[browser]
+    options = browser_options(browser)
+    if vendor_prefix:
+        executor = ChromiumRemoteConnection(url, vendor_prefix, grid_name, keep_alive=True)
+        return GridChromiumDriver(command_executor=executor, options=options)
+    return webdriver.Remote(command_executor=RemoteConnection(url, keep_alive=True), options=options)
+
+
+def get_grid_driver(url=SELENIUM_GRID_URL, preferences=GRID_BROWSERS, report=None):
+    """
+    A session on the grid, failing over between browser types. If a dict is
+    passed as report it receives the browser, node, acquisition time and
+    the attempts made.
+    """
+    if not url:
+        raise GridUnavailable("SELENIUM_GRID_URL is not set")
+    started = time.perf_counter()
+    try:
+        capacity = node_capacity(grid_status(url))
+    except (requests.RequestException, KeyError, ValueError) as e:
+        raise GridUnavailable(f"Grid status unavailable at {url}: {e}")
+    order = browser_order(capacity, preferences)
+    if not order:
+        raise GridUnavailable(f"No nodes for {', '.join(preferences)} on the grid")
+
+    attempts = []
+    for browser in order:
+        attempt_started = time.perf_counter()
+        try:
+            driver = create_session(browser, url)
+        except Exception as e:
+            attempts.append({
+                'browser': browser,
+                'error': str(e).splitlines()[0] if str(e) else type(e).__name__,
+                'ms': round((time.perf_counter() - attempt_started) * 1000, 1),
+            })
+            logger.warning(f"Grid session for {browser} failed, trying the next browser: {attempts[-1]['error']}")
+            continue
+
+        acquire_ms = round((time.perf_counter() - started) * 1000, 1)
+        try:
+            node = session_node(grid_status(url), driver.session_id)
+        except (requests.RequestException, KeyError, ValueError):
+            node = None
+        attempts.append({'browser': browser, 'ms': round((time.perf_counter() - attempt_started) * 1000, 1)})
+        logger.info(f"Grid session {driver.session_id} ({browser}) on {node or 'unknown node'} in {acquire_ms:.0f} ms")
+        if report is not None:
+            report.update({
+                'backend': 'grid',
+                'browser': browser,
+                'node': node,
+                'acquire_ms': acquire_ms,
+                'attempts': attempts,
+                'free_slots': {b: c['free'] for b, c in capacity.items()},
+            })
+        return driver
+
+    raise GridUnavailable(
+        "No browser type could start a session: "
+        + "; ".join(f"{a['browser']}: {a['error']}" for a in attempts)
+    )
@@ -0,0 +1,182 @@
+"""
+Snapshot history store.
+
+Every published snapshot is kept as Parquet, partitioned by day in the
+Hive layout (data/history/date=YYYY-MM-DD/part-*.parquet) so that range
+reads only touch the days they need. Rows carry the snapshot id and
+timestamp plus the 13 scraped columns, with the numeric columns parsed
+to floats.
+"""
+import logging
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from targets import COLUMNS
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIR = Path("data") / "history"
+
+TEXT_COLUMNS = COLUMNS[:2]
+NUMERIC_COLUMNS = COLUMNS[2:]
+SNAPSHOT_COLUMNS = ['snapshot_id', 'snapshot_ts'] + COLUMNS
+
+# Sources (e.g. imported Excel files) already in the store, one per line
+MANIFEST_NAME = "_ingested.tsv"
+
+
+def snapshot_id_for(snapshot_ts):
+    return snapshot_ts.strftime('%Y%m%dT%H%M%S')
+
+
+def parse_numbers(values):
+    """Vectorized parse of scraped numbers like '1,234.50' or '-0.35%'"""
+    cleaned = (
+        pd.Series(values, dtype='object')
+        .astype(str)
+        .str.replace(r'[,%\s]', '', regex=True)
+    )
+    return pd.to_numeric(cleaned, errors='coerce')
+
+
+def normalize_snapshot(df, snapshot_ts):
+    """
+    Convert a scraped (all text) snapshot into the history schema.
+    Missing columns are added empty so older exports line up.
+    """
+    df = df.reindex(columns=COLUMNS)
+    out = pd.DataFrame({
+        'snapshot_id': snapshot_id_for(snapshot_ts),
+        'snapshot_ts': pd.Series([pd.Timestamp(snapshot_ts)] * len(df), dtype='datetime64[ns]'),
+    })
+    for column in TEXT_COLUMNS:
+        out[column] = df[column].fillna('').astype(str).str.strip().values
+    for column in NUMERIC_COLUMNS:
+        out[column] = parse_numbers(df[column].values).astype('float64').values
+    return out
+
+
+class HistoryStore:
+    """Append-only Parquet store of normalized snapshots"""
+
+    def __init__(self, root=HISTORY_DIR):
+        self.root = Path(root)
+
+    def append(self, frames, batch_id=None):
+        """
+        Write one or more normalized snapshots in a single batch, one file per
+        day touched. Files are written to a temporary name and renamed, so
+        readers never see partial files. Returns the batch id.
+        """
+        if isinstance(frames, pd.DataFrame):
+            frames = [frames]
+        frames = [f for f in frames if len(f)]
+        batch_id = batch_id or f"live-{uuid.uuid4().hex[:12]}"
+        if not frames:
+            return batch_id
+
+        data = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        for day, part in data.groupby(data['snapshot_ts'].dt.strftime('%Y-%m-%d'), sort=True):
+            directory = self.root / f"date={day}"
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f"part-{batch_id}.parquet"
+            tmp_path = directory / f".{path.name}.tmp"
+            part.sort_values('snapshot_ts', kind='stable').to_parquet(
+                tmp_path, index=False, engine='pyarrow', compression='zstd', row_group_size=100_000
+            )
+            os.replace(tmp_path, path)
+        return batch_id
+
+    def partitions(self, start=None, end=None):
+        """Day partitions, oldest first, optionally limited to [start, end]"""
+        if not self.root.exists():
+            return []
+        days = []
+        for directory in sorted(self.root.glob('date=*')):
+            day = datetime.strptime(directory.name[5:], '%Y-%m-%d').date()
+            if start is not None and day < pd.Timestamp(start).date():
+                continue
+            if end is not None and day > pd.Timestamp(end).date():
+                continue
+            days.append((day, sorted(directory.glob('part-*.parquet'))))
+        return days
+
+    def iter_days(self, start=None, end=None, columns=None):
+        """Yield (day, DataFrame) per partition without loading the whole range"""
+        for day, files in self.partitions(start, end):
+            if not files:
+                continue
+            frame = pd.concat(
+                [pd.read_parquet(f, columns=columns, engine='pyarrow') for f in files],
+                ignore_index=True,
+            )
+            if 'snapshot_ts' in frame:
+                if start is not None:
+                    frame = frame[frame['snapshot_ts'] >= pd.Timestamp(start)]
+                if end is not None:
+                    frame = frame[frame['snapshot_ts'] <= pd.Timestamp(end)]
+                frame = frame.sort_values('snapshot_ts', kind='stable')
+            yield day, frame
+
+    def read_range(self, start=None, end=None, columns=None):
+        frames = [frame for _, frame in self.iter_days(start, end, columns)]
+        if not frames:
+            return pd.DataFrame(columns=columns or SNAPSHOT_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    # Import bookkeeping
+
+    @property
+    def manifest_path(self):
+        return self.root / MANIFEST_NAME
+
+    def ingested_sources(self):
+        """Names of sources already ingested"""
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return {line.rstrip('\n').split('\t', 1)[1] for line in f if '\t' in line}
+        except FileNotFoundError:
+            return set()
+
+    def import_marker(self):
+        """Size and mtime of the import manifest; changes with every committed import"""
+        try:
+            stat = self.manifest_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def mark_ingested(self, batch_id, sources):
+        """Record the sources of a written batch; this commits the batch"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.manifest_path, 'a', encoding='utf-8') as f:
+            f.writelines(f"{batch_id}\t{source}\n" for source in sources)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remove_uncommitted_imports(self):
+        """
+        Delete import batches written without a manifest entry (an import
+        interrupted between writing and committing), so resuming does not
+        duplicate their snapshots.
+        """
+        committed = set()
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                committed = {line.split('\t', 1)[0] for line in f if '\t' in line}
+        except FileNotFoundError:
+            pass
+
+        removed = 0
+        for path in self.root.glob('date=*/part-import-*.parquet'):
+            batch_id = path.stem[len('part-'):]
+            if batch_id not in committed:
+                path.unlink()
+                removed += 1
+        if removed:
+            logger.info(f"Removed {removed} uncommitted import file(s)")
+        return removed
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Streaming export of the snapshot history.
+
+The export is produced one day partition at a time, as the client reads:
+
+    csv      one CSV document (UTF-8 with BOM for Excel), a chunk per day
+    parquet  one Parquet file, a row group per day
+    zip      a ZIP of per-day CSV files, written in streaming mode (data
+             descriptors, no seeking)
+
+Only one day is held in memory at a time, so memory stays flat whatever
+the range. The generator checks a stop event between days, and the API
+sets it when the client goes away.
+
+Usage:
+    python history_export.py bench [--years 3] [--rows 220] [--per-day 6] [--formats csv,parquet,zip]
+"""
+import argparse
+import io
+import logging
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from history import HistoryStore, NUMERIC_COLUMNS, SNAPSHOT_COLUMNS, TEXT_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Media type and file extension per format
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'zip': ('application/zip', 'zip'),
+}
+
+SCHEMA = pa.schema(
+    [('snapshot_id', pa.string()), ('snapshot_ts', pa.timestamp('s'))]
+    + [(column, pa.string()) for column in TEXT_COLUMNS]
+    + [(column, pa.float64()) for column in NUMERIC_COLUMNS]
+)
+
+UTF8_BOM = b'\xef\xbb\xbf'
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file that hands out what was written since the last drain"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def export_schema(columns=None):
+    """Schema of an export: snapshot id and time plus the selected columns (default all)"""
+    if columns is None:
+        return SCHEMA
+    return pa.schema([SCHEMA.field(name) for name in SNAPSHOT_COLUMNS if name in columns or name in SCHEMA.names[:2]])
+
+
+def _second(ts):
+    return pa.scalar(pd.Timestamp(ts).floor('s').to_pydatetime(), pa.timestamp('s'))
+
+
+def iter_day_tables(store, start=None, end=None, schema=SCHEMA):
+    """(day, Arrow table) per day partition in [start, end]"""
+    for day, files in store.partitions(start, end):
+        if not files:
+            continue
+        table = pa.concat_tables([pq.read_table(f, columns=schema.names) for f in files])
+        # Scraped snapshots carry microseconds; exports are to the second.
+        # Only the timestamp is truncated, every other cast stays checked.
+        table = table.select(schema.names)
+        seconds = pc.floor_temporal(table['snapshot_ts'], unit='second')
+        column = schema.get_field_index('snapshot_ts')
+        table = table.set_column(column, 'snapshot_ts', seconds).cast(schema)
+        if start is not None:
+            table = table.filter(pc.greater_equal(table['snapshot_ts'], _second(start)))
+        if end is not None:
+            table = table.filter(pc.less_equal(table['snapshot_ts'], _second(end)))
+        if table.num_rows:
+            yield day, table.sort_by('snapshot_ts')
+
+
+def export_chunks(store, fmt, start=None, end=None, columns=None, stop=None):
+    """Generator of the export's bytes, one or more chunks per day"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    schema = export_schema(columns)
+    sink = _ChunkSink()
+    days = iter_day_tables(store, start, end, schema)
+
+    if fmt == 'csv':
+        yield UTF8_BOM
+        with pa_csv.CSVWriter(sink, schema) as writer:
+            for _, table in days:
+                if stop is not None and stop.is_set():
+                    return
+                writer.write_table(table)
+                yield sink.drain()
+        yield sink.drain()
+
+    elif fmt == 'parquet':
+        with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+            for _, table in days:
+                if stop is not None and stop.is_set():
+                    return
+                writer.write_table(table, row_group_size=max(1, table.num_rows))
+                yield sink.drain()
+        # Footer
+        yield sink.drain()
+
+    else:
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+            for day, table in days:
+                if stop is not None and stop.is_set():
+                    return
+                with archive.open(f'egx_history_{day}.csv', 'w', force_zip64=True) as member:
+                    member.write(UTF8_BOM)
+                    pa_csv.write_csv(table, member)
+                yield sink.drain()
+        # Central directory
+        yield sink.drain()
+
+
+# Benchmark
+
+def trading_days(start, count):
+    """EGX trades Sunday to Thursday"""
+    return pd.bdate_range(start, periods=count, freq='C', weekmask='Sun Mon Tue Wed Thu')
+
+
+def build_synthetic_store(root, years, rows, per_day, seed=0):
+    """A history store of `years` of trading days with per_day snapshots each; returns the row count"""
+    from fixtures import synthetic_prices
+    from history import normalize_snapshot
+
+    base = normalize_snapshot(synthetic_prices(rows, seed), pd.Timestamp('2024-01-01').to_pydatetime())
+    rng = np.random.default_rng(seed)
+    store = HistoryStore(root)
+    total = 0
+    batch = []
+    level = np.ones(rows)
+    for day in trading_days('2024-01-01', years * 250):
+        times = day + pd.Timedelta(hours=10) + pd.to_timedelta(np.arange(per_day) * (270 // per_day), unit='min')
+        frame = pd.DataFrame({
+            'snapshot_id': np.repeat([t.strftime('%Y%m%dT%H%M%S') for t in times], rows),
+            'snapshot_ts': np.repeat(times.values, rows),
+        })
+        for column in TEXT_COLUMNS:
+            frame[column] = np.tile(base[column].to_numpy(), per_day)
+        steps = rng.lognormal(0, 0.005, (per_day, rows))
+        factors = (level * np.cumprod(steps, axis=0)).reshape(-1)
+        level = level * np.prod(steps, axis=0)
+        for column in NUMERIC_COLUMNS:
+            frame[column] = np.tile(base[column].to_numpy(), per_day) * factors
+        batch.append(frame)
+        total += len(frame)
+        if len(batch) == 50:
+            store.append(batch)
+            batch = []
+    store.append(batch)
+    return total
+
+
+class PeakRSS:
+    """Samples this process's RSS in a thread and keeps the peak"""
+
+    def __init__(self, interval=0.02):
+        import psutil
+
+        self.process = psutil.Process()
+        self.interval = interval
+        self.baseline = self.peak = self.process.memory_info().rss
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def bench(years, rows, per_day, formats):
+    root = tempfile.mkdtemp(prefix='egx-export-')
+    try:
+        started = time.perf_counter()
+        total = build_synthetic_store(root, years, rows, per_day)
+        logger.info(f"Synthetic store: {total:,} rows over {years} year(s) in {time.perf_counter() - started:.1f}s")
+        store = HistoryStore(root)
+        results = {}
+        for fmt in formats:
+            written = 0
+            largest = 0
+            with PeakRSS() as rss:
+                started = time.perf_counter()
+                for chunk in export_chunks(store, fmt):
+                    written += len(chunk)
+                    largest = max(largest, len(chunk))
+                seconds = time.perf_counter() - started
+            results[fmt] = {
+                'bytes': written,
+                'seconds': round(seconds, 2),
+                'mb_per_s': round(written / seconds / 1e6, 1),
+                'rows_per_s': round(total / seconds),
+                'largest_chunk': largest,
+                'peak_rss_growth_mb': round((rss.peak - rss.baseline) / 1e6, 1),
+            }
+            logger.info(f"{fmt:<8} {results[fmt]}")
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="History export tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    benchmark = sub.add_parser('bench', help="Export throughput and memory on a synthetic multi-year store")
+    benchmark.add_argument('--years', type=int, default=3)
+    benchmark.add_argument('--rows', type=int, default=220)
+    benchmark.add_argument('--per-day', type=int, default=6, help="Snapshots per trading day")
+    benchmark.add_argument('--formats', default=','.join(FORMATS))
+    args = parser.parse_args(argv)
+    bench(args.years, args.rows, args.per_day, [f.strip() for f in args.formats.split(',') if f.strip()])
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
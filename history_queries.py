@@ -0,0 +1,97 @@
+"""
+Queries over the snapshot history behind /history, answered from the
+Parquet store and cached in a ResultCache (see resultcache.py).
+"""
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from query import COLUMN_ALIASES, QueryError, resolve_column
+
+NAME = COLUMN_ALIASES['name']
+SECTOR = COLUMN_ALIASES['sector']
+VALUE = COLUMN_ALIASES['value']
+
+ALIAS_OF = {column: alias for alias, column in COLUMN_ALIASES.items()}
+
+DEFAULT_FIELDS = ['last', 'volume']
+
+
+def parse_range(start=None, end=None, days=None, now=None):
+    """
+    (start, end) timestamps from ISO dates/times; an end given as a date
+    covers that whole day. days=N is the last N calendar days (up to now,
+    open-ended). Missing bounds stay None.
+    """
+    try:
+        if days is not None:
+            if start is not None:
+                raise QueryError("Use either days or start")
+            today = pd.Timestamp(now or datetime.now()).normalize()
+            start = today - pd.Timedelta(days=days - 1)
+        start = pd.Timestamp(start) if start is not None else None
+        if end is not None:
+            day_only = len(str(end)) <= 10
+            end = pd.Timestamp(end)
+            if day_only:
+                end = end + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+    except ValueError as e:
+        raise QueryError(f"Invalid range: {e}")
+    if start is not None and end is not None and start > end:
+        raise QueryError("start is after end")
+    return start, end
+
+
+def encode(result):
+    """Response body of a result (NaN as null)"""
+    return json.dumps(result, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _floats(values):
+    return [None if np.isnan(v) else float(v) for v in np.asarray(values, dtype=np.float64)]
+
+
+def company_history(store, company, fields=None, start=None, end=None):
+    """Every snapshot of one company in [start, end]"""
+    columns = [resolve_column(f) for f in (fields or DEFAULT_FIELDS)]
+    if any(c in (NAME, SECTOR) for c in columns):
+        raise QueryError("Only numeric fields have a history")
+    timestamps = []
+    values = {column: [] for column in columns}
+    for _, frame in store.iter_days(start, end, columns=['snapshot_ts', NAME, *columns]):
+        frame = frame[frame[NAME] == company]
+        timestamps.extend(ts.isoformat() for ts in frame['snapshot_ts'])
+        for column in columns:
+            values[column].extend(_floats(frame[column]))
+    return {
+        'company': company,
+        'start': start.isoformat() if start is not None else None,
+        'end': end.isoformat() if end is not None else None,
+        'timestamps': timestamps,
+        'fields': {ALIAS_OF.get(column, column): series for column, series in values.items()},
+    }
+
+
+def sector_turnover(store, start=None, end=None):
+    """
+    Traded value per sector and day. The published value is cumulative over
+    the session, so each company's last snapshot of the day counts.
+    """
+    days = []
+    per_day = []
+    for day, frame in store.iter_days(start, end, columns=['snapshot_ts', NAME, SECTOR, VALUE]):
+        if frame.empty:
+            continue
+        last = frame.drop_duplicates(NAME, keep='last')
+        per_day.append(last.groupby(SECTOR)[VALUE].sum(min_count=1))
+        days.append(str(day))
+    table = pd.concat(per_day, axis=1).T if per_day else pd.DataFrame()
+    return {
+        'start': start.isoformat() if start is not None else None,
+        'end': end.isoformat() if end is not None else None,
+        'days': days,
+        'sectors': {str(sector): _floats(table[sector]) for sector in table.columns},
+        'total': _floats(table.sum(axis=1, min_count=1)) if len(table) else [],
+    }
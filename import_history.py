@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Bulk import of historical egx_stocks_YYYYMMDD_HHMMSS.xlsx exports into the
+snapshot history store.
+
+Files are discovered recursively, their timestamp is taken from the name,
+and they are parsed in parallel across a process pool with a streaming
+XLSX reader (openpyxl is only used as a fallback). Normalized snapshots are
+written in large batches, and every batch is committed to the store's
+manifest, so an interrupted import resumes where it stopped.
+
+Usage:
+    python import_history.py /backups/egx [more dirs...] [--workers 8] [--batch-size 500]
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from xml.etree.ElementTree import iterparse
+
+import pandas as pd
+
+from history import HistoryStore, HISTORY_DIR, normalize_snapshot
+
+logger = logging.getLogger(__name__)
+
+FILENAME_PATTERN = re.compile(r'^egx_stocks_(\d{8})_(\d{6})\.xlsx$')
+
+_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+def discover(directories):
+    """Yield (path, timestamp) for every timestamped export under the directories"""
+    for directory in directories:
+        for path in Path(directory).rglob('egx_stocks_*.xlsx'):
+            match = FILENAME_PATTERN.match(path.name)
+            if match:
+                yield path, datetime.strptime(match.group(1) + match.group(2), '%Y%m%d%H%M%S')
+
+
+def _column_index(ref):
+    """'C7' -> 2"""
+    index = 0
+    for char in ref:
+        if not char.isalpha():
+            break
+        index = index * 26 + (ord(char.upper()) - 64)
+    return index - 1
+
+
+def read_xlsx_fast(path):
+    """
+    Read the first sheet of a simple XLSX (as written by pandas/openpyxl)
+    into a DataFrame of strings, streaming the XML instead of building an
+    openpyxl workbook.
+    """
+    with zipfile.ZipFile(path) as archive:
+        shared = []
+        if 'xl/sharedStrings.xml' in archive.namelist():
+            with archive.open('xl/sharedStrings.xml') as f:
+                for _, elem in iterparse(f):
+                    if elem.tag == _NS + 'si':
+                        shared.append(''.join(t.text or '' for t in elem.iter(_NS + 't')))
+                        elem.clear()
+
+        rows = []
+        with archive.open('xl/worksheets/sheet1.xml') as f:
+            for _, elem in iterparse(f):
+                if elem.tag != _NS + 'row':
+                    continue
+                row = {}
+                for cell in elem.iter(_NS + 'c'):
+                    kind = cell.get('t')
+                    if kind == 'inlineStr':
+                        value = ''.join(t.text or '' for t in cell.iter(_NS + 't'))
+                    else:
+                        v = cell.find(_NS + 'v')
+                        value = v.text if v is not None else ''
+                        if kind == 's' and value:
+                            value = shared[int(value)]
+                    row[_column_index(cell.get('r', ''))] = value or ''
+                rows.append(row)
+                elem.clear()
+
+    if not rows:
+        return pd.DataFrame()
+    width = max((max(r) + 1 for r in rows if r), default=0)
+    header = [rows[0].get(i, '') for i in range(width)]
+    data = [[r.get(i, '') for i in range(width)] for r in rows[1:]]
+    return pd.DataFrame(data, columns=header)
+
+
+def load_export(path, snapshot_ts):
+    """Worker: parse one export and normalize it. Returns (name, frame or None, error)"""
+    try:
+        try:
+            df = read_xlsx_fast(path)
+        except (KeyError, ValueError, zipfile.BadZipFile):
+            df = pd.read_excel(path, engine='openpyxl', dtype=str)
+        return path.name, normalize_snapshot(df, snapshot_ts), None
+    except Exception as e:
+        return path.name, None, str(e)
+
+
+def import_exports(directories, store=None, workers=None, batch_size=500):
+    """
+    Ingest every export not yet in the store. Returns a summary dict.
+    """
+    store = store or HistoryStore()
+    store.remove_uncommitted_imports()
+    done = store.ingested_sources()
+
+    pending = {}
+    for path, snapshot_ts in discover(directories):
+        if path.name not in done and path.name not in pending:
+            pending[path.name] = (path, snapshot_ts)
+    jobs = sorted(pending.values(), key=lambda job: job[1])
+    logger.info(f"{len(jobs)} file(s) to import ({len(done)} already ingested)")
+
+    started = time.perf_counter()
+    imported = rows = 0
+    errors = []
+    frames, names = [], []
+
+    def flush():
+        nonlocal imported, rows
+        if not names:
+            return
+        batch_id = f"import-{uuid.uuid4().hex[:12]}"
+        store.append(frames, batch_id=batch_id)
+        store.mark_ingested(batch_id, names)
+        imported += len(names)
+        rows += sum(len(f) for f in frames)
+        elapsed = time.perf_counter() - started
+        logger.info(f"Imported {imported}/{len(jobs)} files ({imported / elapsed:.1f} files/s)")
+        frames.clear()
+        names.clear()
+
+    workers = workers or os.cpu_count()
+    chunksize = max(1, batch_size // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # One window per batch keeps at most one batch of frames in memory
+        for offset in range(0, len(jobs), batch_size):
+            window = jobs[offset:offset + batch_size]
+            paths = [path for path, _ in window]
+            timestamps = [snapshot_ts for _, snapshot_ts in window]
+            for name, frame, error in pool.map(load_export, paths, timestamps, chunksize=chunksize):
+                if error:
+                    logger.warning(f"Skipping {name}: {error}")
+                    errors.append(name)
+                    continue
+                frames.append(frame)
+                names.append(name)
+            flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        'files': imported,
+        'rows': rows,
+        'skipped': len(done),
+        'errors': errors,
+        'seconds': round(elapsed, 2),
+        'files_per_second': round(imported / elapsed, 1) if elapsed and imported else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import timestamped EGX Excel exports into the history store")
+    parser.add_argument('directories', nargs='+', help="Directories searched recursively for egx_stocks_*.xlsx")
+    parser.add_argument('--store', default=str(HISTORY_DIR), help="History store directory")
+    parser.add_argument('--workers', type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument('--batch-size', type=int, default=500, help="Files per write batch")
+    args = parser.parse_args(argv)
+
+    summary = import_exports(args.directories, HistoryStore(args.store), args.workers, args.batch_size)
+    logger.info(f"Import finished: {summary}")
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Technical indicators of the last price, updated incrementally.
+
+Per company the state keeps a ring buffer of recent prices and of recent
+log returns in NumPy arrays, plus running sums. Each published snapshot
+updates every indicator for all companies with a few vectorized array
+operations, independent of how much history there is:
+
+    sma_N          simple moving average of the last N prices
+    vwap           session VWAP (last price weighted by the volume traded
+                   since the previous snapshot of the same day)
+    rsi_14         Wilder's RSI
+    volatility_20  standard deviation of the last 20 log returns
+
+A company's series is the snapshots in which it has a price. The state is
+checkpointed to an .npz file after each update. At startup only the
+snapshots newer than the checkpoint are read from the history store.
+`verify` recomputes everything from scratch with pandas and compares.
+
+Usage:
+    python indicators.py verify [--history data/history]
+    python indicators.py bench [--rows 220] [--snapshots 2000]
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from query import COLUMN_ALIASES
+
+logger = logging.getLogger(__name__)
+
+INDICATORS_PATH = Path(os.getenv('INDICATORS_PATH', 'data/indicators.npz'))
+
+SMA_WINDOWS = (10, 20, 50)
+RSI_PERIOD = 14
+VOLATILITY_WINDOW = 20
+
+# Running sums are recomputed from the ring buffers this often (in updates)
+# so floating point error cannot accumulate
+RESUM_INTERVAL = 1000
+
+NAME = COLUMN_ALIASES['name']
+PRICE = COLUMN_ALIASES['last']
+VOLUME = COLUMN_ALIASES['volume']
+
+CHECKPOINT_VERSION = 1
+
+INDICATOR_COLUMNS = [f'sma_{w}' for w in SMA_WINDOWS] + [
+    'vwap', f'rsi_{RSI_PERIOD}', f'volatility_{VOLATILITY_WINDOW}'
+]
+
+# Per-company arrays, as (name, trailing shape, dtype, fill value)
+_ARRAYS = [
+    ('count', (), np.int64, 0),
+    ('prices', (max(SMA_WINDOWS),), np.float64, np.nan),
+    ('sums', (len(SMA_WINDOWS),), np.float64, 0.0),
+    ('last_price', (), np.float64, np.nan),
+    ('return_count', (), np.int64, 0),
+    ('returns', (VOLATILITY_WINDOW,), np.float64, np.nan),
+    ('return_sum', (), np.float64, 0.0),
+    ('return_sumsq', (), np.float64, 0.0),
+    ('avg_gain', (), np.float64, 0.0),
+    ('avg_loss', (), np.float64, 0.0),
+    ('vwap_day', (), np.int64, -1),
+    ('cum_pv', (), np.float64, 0.0),
+    ('cum_volume', (), np.float64, 0.0),
+    ('last_volume', (), np.float64, 0.0),
+]
+
+
+def _day_number(ts):
+    return int(pd.Timestamp(ts).normalize().value // 86_400_000_000_000)
+
+
+class IndicatorState:
+    """Rolling indicator state for every company seen so far"""
+
+    def __init__(self, capacity=256):
+        self.names = []
+        self.index = {}
+        self.arrays = {
+            name: np.full((capacity,) + shape, fill, dtype=dtype) for name, shape, dtype, fill in _ARRAYS
+        }
+        self.last_snapshot_id = None
+        self.last_snapshot_ts = None
+        self.updates = 0
+        self.last_update_ms = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        arrays = self.__dict__.get('arrays')
+        if arrays is not None and name in arrays:
+            return arrays[name]
+        raise AttributeError(name)
+
+    # Updates
+
+    def _rows_for(self, names):
+        """Array rows of the companies, adding new ones (doubling capacity when full)"""
+        new = [n for n in dict.fromkeys(names) if n not in self.index]
+        if new:
+            needed = len(self.names) + len(new)
+            capacity = len(self.count)
+            if needed > capacity:
+                while capacity < needed:
+                    capacity *= 2
+                for name, shape, dtype, fill in _ARRAYS:
+                    grown = np.full((capacity,) + shape, fill, dtype=dtype)
+                    grown[:len(self.names)] = self.arrays[name][:len(self.names)]
+                    self.arrays[name] = grown
+            for n in new:
+                self.index[n] = len(self.names)
+                self.names.append(n)
+        return np.fromiter((self.index[n] for n in names), dtype=np.int64, count=len(names))
+
+    def update(self, frame):
+        """
+        Apply one normalized snapshot. Snapshots not newer than the last one
+        applied are ignored, so replays are harmless. Returns True if applied.
+        """
+        if frame.empty:
+            return False
+        snapshot_ts = pd.Timestamp(frame['snapshot_ts'].iloc[0])
+        if self.last_snapshot_ts is not None and snapshot_ts <= self.last_snapshot_ts:
+            return False
+        started = time.perf_counter()
+
+        frame = frame.drop_duplicates(NAME, keep='last')
+        price = frame[PRICE].to_numpy(dtype=np.float64)
+        priced = np.isfinite(price)
+        names = frame[NAME].to_numpy()[priced]
+        x = price[priced]
+        volume = frame[VOLUME].to_numpy(dtype=np.float64)[priced]
+
+        with self._lock:
+            r = self._rows_for(names)
+            self._push_prices(r, x)
+            self._push_vwap(r, x, volume, _day_number(snapshot_ts))
+            self.updates += 1
+            if self.updates % RESUM_INTERVAL == 0:
+                self._resum()
+            self.last_snapshot_id = str(frame['snapshot_id'].iloc[0])
+            self.last_snapshot_ts = snapshot_ts
+            self.last_update_ms = round((time.perf_counter() - started) * 1000, 3)
+        return True
+
+    def _push_prices(self, r, x):
+        count = self.count[r]
+        prev = self.last_price[r]
+        has_prev = count > 0
+
+        # Moving averages: add the new price, drop the one leaving each window
+        width = self.prices.shape[1]
+        for k, window in enumerate(SMA_WINDOWS):
+            leaving = self.prices[r, (count - window) % width]
+            self.sums[r, k] += x - np.where(count >= window, leaving, 0.0)
+        self.prices[r, count % width] = x
+        self.count[r] = count + 1
+        self.last_price[r] = x
+
+        # Wilder's RSI: simple mean of the first period changes, then smoothing
+        m = has_prev
+        rm, changes = r[m], count[m]
+        delta = x[m] - prev[m]
+        gain, loss = np.maximum(delta, 0.0), np.maximum(-delta, 0.0)
+        seeding = changes <= RSI_PERIOD
+        self.avg_gain[rm] = np.where(
+            seeding, self.avg_gain[rm] + gain / RSI_PERIOD, (self.avg_gain[rm] * (RSI_PERIOD - 1) + gain) / RSI_PERIOD
+        )
+        self.avg_loss[rm] = np.where(
+            seeding, self.avg_loss[rm] + loss / RSI_PERIOD, (self.avg_loss[rm] * (RSI_PERIOD - 1) + loss) / RSI_PERIOD
+        )
+
+        # Log returns for volatility (only between positive prices)
+        m = has_prev & (prev > 0) & (x > 0)
+        rm = r[m]
+        ret = np.log(x[m] / prev[m])
+        rcount = self.return_count[rm]
+        slot = rcount % VOLATILITY_WINDOW
+        full = rcount >= VOLATILITY_WINDOW
+        leaving = np.where(full, self.returns[rm, slot], 0.0)
+        self.return_sum[rm] += ret - leaving
+        self.return_sumsq[rm] += ret * ret - leaving * leaving
+        self.returns[rm, slot] = ret
+        self.return_count[rm] = rcount + 1
+
+    def _push_vwap(self, r, x, volume, day):
+        # Volume is cumulative for the trading day; a new day starts from zero
+        new_day = self.vwap_day[r] != day
+        self.cum_pv[r[new_day]] = 0.0
+        self.cum_volume[r[new_day]] = 0.0
+        self.last_volume[r[new_day]] = 0.0
+        self.vwap_day[r] = day
+        known = np.isfinite(volume)
+        rk = r[known]
+        traded = np.maximum(volume[known] - self.last_volume[rk], 0.0)
+        self.cum_pv[rk] += x[known] * traded
+        self.cum_volume[rk] += traded
+        self.last_volume[rk] = volume[known]
+
+    def _resum(self):
+        n = len(self.names)
+        count = self.count[:n]
+        width = self.prices.shape[1]
+        for k, window in enumerate(SMA_WINDOWS):
+            # The last `window` prices sit at (count - 1 - i) % width; unfilled slots are NaN
+            slots = (count[:, None] - 1 - np.arange(window)) % width
+            self.sums[:n, k] = np.nan_to_num(np.take_along_axis(self.prices[:n], slots, axis=1)).sum(axis=1)
+        returns = np.nan_to_num(self.returns[:n])
+        self.return_sum[:n] = returns.sum(axis=1)
+        self.return_sumsq[:n] = (returns * returns).sum(axis=1)
+
+    # Reads
+
+    def values(self, names=None):
+        """Current indicators per company as a DataFrame"""
+        with self._lock:
+            n = len(self.names)
+            count = self.count[:n]
+            out = {'name': list(self.names), 'last': self.last_price[:n].copy(), 'samples': count.copy()}
+            for k, window in enumerate(SMA_WINDOWS):
+                out[f'sma_{window}'] = np.where(count >= window, self.sums[:n, k] / window, np.nan)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cum_volume = self.cum_volume[:n]
+                out['vwap'] = np.where(cum_volume > 0, self.cum_pv[:n] / cum_volume, np.nan)
+                gain, loss = self.avg_gain[:n], self.avg_loss[:n]
+                rsi = np.where(loss > 0, 100.0 - 100.0 / (1.0 + gain / loss), np.where(gain > 0, 100.0, 50.0))
+                out[f'rsi_{RSI_PERIOD}'] = np.where(count > RSI_PERIOD, rsi, np.nan)
+                v = VOLATILITY_WINDOW
+                variance = (self.return_sumsq[:n] - self.return_sum[:n] ** 2 / v) / (v - 1)
+                out[f'volatility_{v}'] = np.where(
+                    self.return_count[:n] >= v, np.sqrt(np.maximum(variance, 0.0)), np.nan
+                )
+        frame = pd.DataFrame(out)
+        if names is not None:
+            frame = frame[frame['name'].isin(set(names))]
+        return frame.reset_index(drop=True)
+
+    def info(self):
+        return {
+            'companies': len(self.names),
+            'updates': self.updates,
+            'snapshot_id': self.last_snapshot_id,
+            'snapshot_ts': self.last_snapshot_ts.isoformat() if self.last_snapshot_ts is not None else None,
+            'last_update_ms': self.last_update_ms,
+            'sma_windows': list(SMA_WINDOWS),
+            'rsi_period': RSI_PERIOD,
+            'volatility_window': VOLATILITY_WINDOW,
+        }
+
+    # Checkpoints
+
+    def save(self, path=INDICATORS_PATH):
+        """Write the state atomically"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with self._lock:
+            n = len(self.names)
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    version=CHECKPOINT_VERSION,
+                    config=np.array(SMA_WINDOWS + (RSI_PERIOD, VOLATILITY_WINDOW)),
+                    names=np.array(self.names, dtype=str),
+                    snapshot_id=np.array(self.last_snapshot_id or ''),
+                    snapshot_ts=np.int64(self.last_snapshot_ts.value if self.last_snapshot_ts is not None else -1),
+                    updates=np.int64(self.updates),
+                    **{name: array[:n] for name, array in self.arrays.items()},
+                )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=INDICATORS_PATH):
+        """State from a checkpoint, or None if missing or written with other windows"""
+        try:
+            data = np.load(path, allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        with data:
+            config = tuple(int(v) for v in data['config'])
+            if int(data['version']) != CHECKPOINT_VERSION or config != SMA_WINDOWS + (RSI_PERIOD, VOLATILITY_WINDOW):
+                logger.info("Indicator checkpoint uses other settings, rebuilding")
+                return None
+            names = [str(n) for n in data['names']]
+            state = cls(capacity=max(256, len(names)))
+            state._rows_for(names)
+            for name, _, _, _ in _ARRAYS:
+                state.arrays[name][:len(names)] = data[name]
+            state.last_snapshot_id = str(data['snapshot_id']) or None
+            ts = int(data['snapshot_ts'])
+            state.last_snapshot_ts = pd.Timestamp(ts) if ts >= 0 else None
+            state.updates = int(data['updates'])
+        return state
+
+    def catch_up(self, store):
+        """Apply the stored snapshots newer than the state, a day at a time. Returns the count."""
+        applied = 0
+        for _, frame in store.iter_days(start=self.last_snapshot_ts):
+            for _, snapshot in frame.groupby('snapshot_ts', sort=True):
+                applied += self.update(snapshot)
+        return applied
+
+
+def load_or_build(store, path=INDICATORS_PATH):
+    """Checkpointed state brought up to date with the history store"""
+    state = IndicatorState.load(path)
+    if state is None:
+        state = IndicatorState()
+    started = time.perf_counter()
+    applied = state.catch_up(store)
+    if applied:
+        logger.info(f"Applied {applied} snapshot(s) to indicators in {time.perf_counter() - started:.2f}s")
+        state.save(path)
+    return state
+
+
+# Reference implementation
+
+def _wilder_rsi(prices):
+    deltas = np.diff(prices)
+    if len(deltas) < RSI_PERIOD:
+        return np.nan
+    gains, losses = np.maximum(deltas, 0), np.maximum(-deltas, 0)
+    avg_gain, avg_loss = gains[:RSI_PERIOD].mean(), losses[:RSI_PERIOD].mean()
+    for gain, loss in zip(gains[RSI_PERIOD:], losses[RSI_PERIOD:]):
+        avg_gain = (avg_gain * (RSI_PERIOD - 1) + gain) / RSI_PERIOD
+        avg_loss = (avg_loss * (RSI_PERIOD - 1) + loss) / RSI_PERIOD
+    if avg_loss > 0:
+        return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    return 100.0 if avg_gain > 0 else 50.0
+
+
+def batch_indicators(history):
+    """The same indicators computed from scratch over the full history"""
+    history = history[np.isfinite(history[PRICE].astype('float64'))]
+    history = history.sort_values('snapshot_ts', kind='stable').drop_duplicates(['snapshot_ts', NAME], keep='last')
+    rows = []
+    for name, group in history.groupby(NAME, sort=False):
+        prices = group[PRICE].to_numpy(dtype=np.float64)
+        row = {'name': name, 'last': prices[-1], 'samples': len(prices)}
+        for window in SMA_WINDOWS:
+            row[f'sma_{window}'] = prices[-window:].mean() if len(prices) >= window else np.nan
+
+        day = group['snapshot_ts'].dt.normalize()
+        today = group[day == day.iloc[-1]]
+        volume = today[VOLUME].astype('float64').ffill().fillna(0.0).to_numpy()
+        traded = np.maximum(np.diff(volume, prepend=0.0), 0.0)
+        row['vwap'] = (today[PRICE].to_numpy() * traded).sum() / traded.sum() if traded.sum() > 0 else np.nan
+
+        row[f'rsi_{RSI_PERIOD}'] = _wilder_rsi(prices)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pairs = (prices[:-1] > 0) & (prices[1:] > 0)
+            returns = np.log(prices[1:] / prices[:-1])[pairs]
+        v = VOLATILITY_WINDOW
+        row[f'volatility_{v}'] = returns[-v:].std(ddof=1) if len(returns) >= v else np.nan
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def compare(state, history):
+    """Largest absolute difference per indicator between the state and a batch recompute"""
+    expected = batch_indicators(history).set_index('name').sort_index()
+    actual = state.values().set_index('name').sort_index()
+    if list(expected.index) != list(actual.index):
+        raise AssertionError("Company sets differ")
+    result = {}
+    for column in ['last', 'samples'] + INDICATOR_COLUMNS:
+        a, e = actual[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float)
+        if not np.array_equal(np.isnan(a), np.isnan(e)):
+            raise AssertionError(f"{column}: missing values differ")
+        both = ~np.isnan(a)
+        result[column] = float(np.max(np.abs(a[both] - e[both]), initial=0.0))
+    return result
+
+
+def _synthetic_history(rows, snapshots, seed=0):
+    """Random-walk snapshots (5 per day) with occasional missing prices and late listings"""
+    from fixtures import company_names
+    from history import snapshot_id_for
+
+    rng = np.random.default_rng(seed)
+    names = np.array(company_names(rows, seed))
+    listed = np.where(rng.random(rows) < 0.05, rng.integers(0, snapshots, rows), 0)
+    price = rng.lognormal(2.0, 1.0, rows)
+    volume = np.zeros(rows)
+    start = pd.Timestamp('2026-01-04 10:00')
+    frames = []
+    for i in range(snapshots):
+        ts = start + pd.Timedelta(days=i // 5, hours=i % 5)
+        if i % 5 == 0:
+            volume[:] = 0
+        price = np.round(price * np.exp(rng.normal(0, 0.02, rows)), 3)
+        volume += rng.integers(0, 100_000, rows)
+        shown = (listed <= i) & (rng.random(rows) > 0.02)
+        last = np.where(rng.random(rows) < 0.01, np.nan, price)
+        frames.append(pd.DataFrame({
+            'snapshot_id': snapshot_id_for(ts),
+            'snapshot_ts': ts,
+            NAME: names[shown],
+            PRICE: last[shown],
+            VOLUME: np.where(rng.random(rows) < 0.01, np.nan, volume)[shown],
+        }))
+    return frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Indicator state tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    check = sub.add_parser('verify', help="Replay the history store and compare with a batch recompute")
+    check.add_argument('--history', default='data/history')
+    benchmark = sub.add_parser('bench', help="Time incremental updates against batch recomputes")
+    benchmark.add_argument('--rows', type=int, default=220)
+    benchmark.add_argument('--snapshots', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'verify':
+        from history import HistoryStore
+        store = HistoryStore(args.history)
+        history = store.read_range()
+        state = IndicatorState()
+        state.catch_up(store)
+        logger.info(f"{len(state.names)} companies, {state.updates} snapshots")
+    else:
+        frames = _synthetic_history(args.rows, args.snapshots)
+        state = IndicatorState()
+        timings = []
+        for frame in frames:
+            started = time.perf_counter()
+            state.update(frame)
+            timings.append(time.perf_counter() - started)
+        history = pd.concat(frames, ignore_index=True)
+        started = time.perf_counter()
+        batch_indicators(history)
+        batch_seconds = time.perf_counter() - started
+        timings = np.array(timings[len(timings) // 2:]) * 1000
+        logger.info(
+            f"Incremental update: p50 {np.percentile(timings, 50):.3f} ms, p99 {np.percentile(timings, 99):.3f} ms "
+            f"per snapshot; batch recompute over {len(frames)} snapshots: {batch_seconds * 1000:.0f} ms"
+        )
+
+    differences = compare(state, history)
+    for column, difference in differences.items():
+        logger.info(f"{column:>16}: max abs difference {difference:.3g}")
+    worst = max(differences.values(), default=0.0)
+    if worst > 1e-6:
+        logger.error("Incremental indicators do not match the batch computation")
+        return 1
+    logger.info("Incremental indicators match the batch computation")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
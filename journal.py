@@ -0,0 +1,217 @@
+"""
+Durable run journal.
+
+Every scrape run is recorded in an embedded SQLite database (WAL mode):
+trigger source, start and finish times, status, per-phase timings, row
+count, snapshot id and error. The dashboard state and the scheduler cadence
+are rebuilt from it at startup instead of being guessed from file times.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH = Path("data") / "journal.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    trigger TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    duration_seconds REAL,
+    rows INTEGER,
+    snapshot_id TEXT,
+    filename TEXT,
+    error TEXT,
+    phases TEXT,
+    stats TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_started_at ON runs (started_at);
+CREATE INDEX IF NOT EXISTS runs_status_started_at ON runs (status, started_at);
+"""
+
+# Run statuses
+RUNNING = 'running'
+SUCCESS = 'success'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+INTERRUPTED = 'interrupted'
+
+# Triggers whose start times define the hourly cadence
+CADENCE_TRIGGERS = ('startup', 'scheduled')
+
+
+def _row_to_dict(row):
+    run = dict(row)
+    for key in ('phases', 'stats'):
+        run[key] = json.loads(run[key]) if run[key] else None
+    for key in ('started_at', 'finished_at'):
+        if run[key] is not None:
+            run[key] = datetime.fromtimestamp(run[key]).isoformat()
+    return run
+
+
+class RunJournal:
+    """SQLite-backed journal of scrape runs; safe to use from worker threads"""
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # Writes
+
+    def start_run(self, trigger, status=RUNNING):
+        """Record the start of a run. Returns its id."""
+        cursor = self._execute(
+            "INSERT INTO runs (trigger, status, started_at) VALUES (?, ?, ?)",
+            (trigger, status, time.time()),
+        )
+        return cursor.lastrowid
+
+    def finish_run(self, run_id, status, rows=None, snapshot_id=None, filename=None, error=None, stats=None,
+                   phases=None):
+        """Record the outcome of a run; phases defaults to the engine's phase timings"""
+        stats = stats or {}
+        phases = phases or stats.get('phases')
+        finished_at = time.time()
+        self._execute(
+            """
+            UPDATE runs SET status = ?, finished_at = ?, duration_seconds = ? - started_at,
+                rows = ?, snapshot_id = ?, filename = ?, error = ?, phases = ?, stats = ?
+            WHERE id = ?
+            """,
+            (
+                status, finished_at, finished_at, rows, snapshot_id, filename, error,
+                json.dumps(phases) if phases else None,
+                json.dumps(stats, default=str) if stats else None,
+                run_id,
+            ),
+        )
+
+    def record_skipped(self, trigger, reason):
+        run_id = self.start_run(trigger, status=SKIPPED)
+        self.finish_run(run_id, SKIPPED, error=reason)
+        return run_id
+
+    def recover(self):
+        """Mark runs left 'running' by a crash or restart as interrupted"""
+        cursor = self._execute(
+            "UPDATE runs SET status = ?, error = 'Process stopped during the run' WHERE status = ?",
+            (INTERRUPTED, RUNNING),
+        )
+        if cursor.rowcount:
+            logger.warning(f"Marked {cursor.rowcount} unfinished run(s) as interrupted")
+        return cursor.rowcount
+
+    # Reads
+
+    def get_run(self, run_id):
+        rows = self._query("SELECT * FROM runs WHERE id = ?", (run_id,))
+        return _row_to_dict(rows[0]) if rows else None
+
+    def recent_runs(self, limit=50, status=None, trigger=None):
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if trigger:
+            clauses.append("trigger = ?")
+            params.append(trigger)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._query(f"SELECT * FROM runs {where} ORDER BY id DESC LIMIT ?", (*params, limit))
+        return [_row_to_dict(row) for row in rows]
+
+    def last_run(self, statuses=(SUCCESS, FAILED, INTERRUPTED), published=False):
+        """
+        Latest finished run with one of the statuses, ignoring background
+        pre-scrapes; published=True only considers runs that saved a snapshot.
+        """
+        placeholders = ",".join("?" * len(statuses))
+        extra = " AND snapshot_id IS NOT NULL" if published else ""
+        rows = self._query(
+            f"SELECT * FROM runs WHERE status IN ({placeholders}) AND trigger != 'background'{extra} "
+            f"ORDER BY started_at DESC LIMIT 1",
+            statuses,
+        )
+        return rows[0] if rows else None
+
+    def last_cadence_start(self):
+        """Start time of the latest startup/scheduled run, anchoring the hourly cadence"""
+        placeholders = ",".join("?" * len(CADENCE_TRIGGERS))
+        rows = self._query(
+            f"SELECT MAX(started_at) FROM runs WHERE trigger IN ({placeholders}) AND status != ?",
+            (*CADENCE_TRIGGERS, SKIPPED),
+        )
+        value = rows[0][0]
+        return datetime.fromtimestamp(value) if value else None
+
+    def restore_state(self):
+        """
+        Dashboard state from the journal: last successful update, current
+        file, the error of the latest run if it failed, and its stats.
+        """
+        success = self.last_run((SUCCESS,), published=True)
+        latest = self.last_run()
+        state = {
+            'last_update': datetime.fromtimestamp(success['finished_at']) if success else None,
+            'current_file': success['filename'] if success else None,
+            'snapshot_id': success['snapshot_id'] if success else None,
+            'last_run_stats': json.loads(success['stats']) if success and success['stats'] else None,
+            'error_message': None,
+        }
+        if latest is not None and latest['status'] != SUCCESS:
+            state['error_message'] = latest['error']
+        return state
+
+    def summary(self, windows=(('24h', 86400), ('7d', 7 * 86400), ('all', None))):
+        """Run counts, success rate and durations per time window"""
+        now = time.time()
+        result = {}
+        for name, seconds in windows:
+            since = now - seconds if seconds else 0
+            rows = self._query(
+                """
+                SELECT status, COUNT(*) AS runs, AVG(duration_seconds) AS avg_seconds,
+                       MAX(duration_seconds) AS max_seconds, AVG(rows) AS avg_rows
+                FROM runs WHERE started_at >= ? AND status != ? GROUP BY status
+                """,
+                (since, SKIPPED),
+            )
+            by_status = {row['status']: dict(row) for row in rows}
+            total = sum(row['runs'] for row in by_status.values())
+            success = by_status.get(SUCCESS, {})
+            result[name] = {
+                'runs': total,
+                'by_status': {status: row['runs'] for status, row in by_status.items()},
+                'success_rate': round(success.get('runs', 0) / total, 4) if total else None,
+                'avg_success_seconds': round(success['avg_seconds'], 2) if success.get('avg_seconds') else None,
+                'max_success_seconds': round(success['max_seconds'], 2) if success.get('max_seconds') else None,
+                'avg_rows': round(success['avg_rows'], 1) if success.get('avg_rows') else None,
+            }
+        return result
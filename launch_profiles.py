@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Chromium launch profiles for the Selenium engine, and a benchmark of them.
+
+    compatibility   windowed Chromium on a 1920x1080 Xvfb display (the original setup)
+    headless-new    Chrome's new headless mode; no X server
+    minimal-memory  new headless with one renderer process, no disk/media
+                    cache, a capped JS heap and a small viewport
+
+BROWSER_PROFILE selects the profile used by scraper.get_local_driver. The
+benchmark launches each profile in a fresh process against a local fixture
+page (fixtures.prices_page_html). It records the launch time, the time from
+navigation to a ready table, the peak RSS of all processes it started
+(chromedriver, Chromium and Xvfb), and whether every row was read intact.
+
+Usage:
+    python launch_profiles.py bench [--profiles compatibility,headless-new,minimal-memory]
+                                    [--repeats 3] [--rows 220] [--output launch_profiles.json]
+"""
+import argparse
+import dataclasses
+import functools
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+from selenium import webdriver
+
+logger = logging.getLogger(__name__)
+
+BROWSER_PROFILE = os.getenv('BROWSER_PROFILE', 'compatibility')
+CHROMIUM_PATH = os.getenv('CHROMIUM_PATH', '/usr/bin/chromium')
+
+# Flags every profile needs to run in a container
+BASE_ARGUMENTS = (
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--disable-software-rasterizer',
+    '--disable-extensions',
+    '--disable-plugins',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--disable-translate',
+    '--disable-background-networking',
+    '--disable-breakpad',
+    '--disable-component-extensions-with-background-pages',
+    '--disable-preconnect',
+    '--memory-pressure-off',
+    '--metrics-recording-only',
+    '--mute-audio',
+    '--no-first-run',
+    '--disable-blink-features=AutomationControlled',
+)
+
+
+@dataclass(frozen=True)
+class LaunchProfile:
+    name: str
+    xvfb: bool                     # needs the virtual display (windowed browser)
+    arguments: Tuple[str, ...] = ()
+    window_size: str = '1280,720'
+
+
+PROFILES = {
+    profile.name: profile for profile in (
+        LaunchProfile('compatibility', xvfb=True),
+        LaunchProfile('headless-new', xvfb=False, arguments=('--headless=new',)),
+        LaunchProfile(
+            'minimal-memory',
+            xvfb=False,
+            window_size='1024,600',
+            arguments=(
+                '--headless=new',
+                '--renderer-process-limit=1',
+                '--disable-features=site-per-process,Translate,OptimizationHints,MediaRouter',
+                '--disk-cache-size=1',
+                '--media-cache-size=1',
+                '--aggressive-cache-discard',
+                '--disable-back-forward-cache',
+                '--js-flags=--max-old-space-size=256',
+            ),
+        ),
+    )
+}
+
+
+def get_profile(name=None):
+    """Launch profile by name (default BROWSER_PROFILE), raising ValueError for unknown names"""
+    name = name or BROWSER_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown browser profile {name!r}, expected one of {', '.join(PROFILES)}")
+
+
+def chrome_options(profile):
+    options = webdriver.ChromeOptions()
+    for argument in BASE_ARGUMENTS + profile.arguments:
+        options.add_argument(argument)
+    options.add_argument(f'--window-size={profile.window_size}')
+    options.binary_location = CHROMIUM_PATH
+    # Performance log feeds the per-run network accounting
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    return options
+
+
+# Benchmark
+
+def _children_rss_mb():
+    """Resident memory of every process started by this one, in MB"""
+    import psutil
+    total = 0
+    for proc in psutil.Process().children(recursive=True):
+        try:
+            total += proc.memory_info().rss
+        except psutil.Error:
+            pass
+    return total / (1024 * 1024)
+
+
+class PeakRSS:
+    """Samples the RSS of child processes in a thread and keeps the peak"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, _children_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, _children_rss_mb())
+
+
+def serve_fixture(rows, delay_ms):
+    """Serve a fixture prices page on a local port. Returns (server, url)."""
+    from fixtures import prices_page_html, synthetic_prices
+
+    directory = tempfile.mkdtemp(prefix='egx-fixture-')
+    with open(os.path.join(directory, 'prices.html'), 'w', encoding='utf-8') as f:
+        f.write(prices_page_html(synthetic_prices(rows), delay_ms=delay_ms))
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/prices.html"
+
+
+def measure(profile_name, url, rows, table_timeout=30):
+    """One launch of a profile against the fixture page, in this process"""
+    import scraper
+    from targets import EGX_PRICES
+    from validation import find_issues
+
+    profile = get_profile(profile_name)
+    target = dataclasses.replace(EGX_PRICES, url=url)
+    result = {'profile': profile.name}
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        driver = scraper.get_local_driver(profile.name)
+        result['launch_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        try:
+            started = time.perf_counter()
+            driver.get(target.url)
+            driver.execute_script(scraper.MARK_TABLE_JS, target.table_xpath)
+            driver.execute_script(scraper.CLICK_JS, target.steps[0].xpath)
+            deadline = time.monotonic() + table_timeout
+            while not scraper._table_ready(driver, target.table_xpath):
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Table did not render")
+                time.sleep(0.05)
+            result['time_to_table_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            table = driver.execute_script(
+                scraper.TABLE_ROWS_JS, target.table_xpath, scraper.column_specs(target), None
+            ) or []
+            invalid, missing = find_issues(table, target.columns, expected_rows=rows)
+            result['rows'] = len(table)
+            result['renders_table'] = len(table) == rows and not invalid and not missing
+        finally:
+            driver.quit()
+    result['peak_rss_mb'] = round(rss.peak_mb, 1)
+    return result
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+def summarize(results):
+    """Median/max per profile and the cheapest profile that rendered the table every time"""
+    summary = {}
+    for name in dict.fromkeys(r['profile'] for r in results):
+        runs = [r for r in results if r['profile'] == name]
+        ok = [r for r in runs if r.get('renders_table')]
+        summary[name] = {
+            'runs': len(runs),
+            'rendered': len(ok),
+            'errors': [r['error'] for r in runs if 'error' in r],
+        }
+        for key in ('launch_ms', 'time_to_table_ms', 'peak_rss_mb'):
+            values = [r[key] for r in ok if r.get(key) is not None]
+            summary[name][f'{key}_p50'] = _percentile(values, 0.5)
+            summary[name][f'{key}_max'] = max(values) if values else None
+    candidates = [n for n, s in summary.items() if s['runs'] and s['rendered'] == s['runs']]
+    recommended = min(
+        candidates, key=lambda n: (summary[n]['peak_rss_mb_p50'], summary[n]['launch_ms_p50']), default=None
+    )
+    return summary, recommended
+
+
+def bench(profiles, repeats, rows, delay_ms):
+    server, url = serve_fixture(rows, delay_ms)
+    results = []
+    try:
+        for repeat in range(repeats):
+            for name in profiles:
+                # A fresh process per launch, so the display and caches of one run do not help the next
+                process = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), 'measure', name, url, str(rows)],
+                    capture_output=True, text=True, timeout=180,
+                )
+                try:
+                    result = json.loads(process.stdout.strip().splitlines()[-1])
+                except (IndexError, ValueError):
+                    error = (process.stderr.strip().splitlines() or ['no output'])[-1]
+                    result = {'profile': name, 'error': error}
+                logger.info(f"[{repeat + 1}/{repeats}] {json.dumps(result, ensure_ascii=False)}")
+                results.append(result)
+    finally:
+        server.shutdown()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Browser launch profile tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    benchmark = sub.add_parser('bench', help="Compare profiles against a local fixture page")
+    benchmark.add_argument('--profiles', default=','.join(PROFILES))
+    benchmark.add_argument('--repeats', type=int, default=3)
+    benchmark.add_argument('--rows', type=int, default=220)
+    benchmark.add_argument('--delay-ms', type=int, default=300, help="Fixture postback delay")
+    benchmark.add_argument('--output', help="Write results and summary as JSON")
+    single = sub.add_parser('measure', help=argparse.SUPPRESS)
+    single.add_argument('profile')
+    single.add_argument('url')
+    single.add_argument('rows', type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == 'measure':
+        try:
+            result = measure(args.profile, args.url, args.rows)
+        except Exception as e:
+            result = {'profile': args.profile, 'error': str(e).splitlines()[0] if str(e) else type(e).__name__}
+        print(json.dumps(result, ensure_ascii=False))
+        return 0
+
+    profiles = [p.strip() for p in args.profiles.split(',') if p.strip()]
+    for name in profiles:
+        get_profile(name)
+    results = bench(profiles, args.repeats, args.rows, args.delay_ms)
+    summary, recommended = summarize(results)
+
+    logger.info(f"{'profile':<16}{'rendered':>10}{'launch ms':>12}{'table ms':>12}{'peak RSS MB':>14}")
+    for name, s in summary.items():
+        logger.info(
+            f"{name:<16}{s['rendered']:>5}/{s['runs']:<4}{s['launch_ms_p50'] or '-':>12}"
+            f"{s['time_to_table_ms_p50'] or '-':>12}{s['peak_rss_mb_p50'] or '-':>14}"
+        )
+    logger.info(f"Cheapest profile that rendered the table every time: {recommended or 'none'}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'results': results, 'summary': summary, 'recommended': recommended}, f, indent=2)
+    return 0 if recommended else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
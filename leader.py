@@ -0,0 +1,320 @@
+"""
+Leader election and snapshot publication for several API replicas.
+
+Every replica runs the scheduler, but only the one holding the scraper
+lease scrapes. The lease is a record with a holder, an expiry and a term
+(incremented on every change of holder). It is renewed every
+LEASE_RENEW_SECONDS and expires LEASE_TTL_SECONDS after the last renewal,
+so a dead leader is replaced within a TTL.
+
+Backends (COORDINATION):
+
+    none   single replica, always the leader (default)
+    file   lease file under SHARED_DIR, updated under a POSIX record lock
+           (fcntl.lockf, which NFS supports); replicas need synced clocks
+    local  in-process stand-in with the same semantics, for development
+
+The leader publishes each snapshot to SHARED_DIR: the normalized snapshot
+as Parquet, the export files, and a manifest (published.json) written
+last. Followers poll the manifest and load every snapshot published since
+their own latest one into their data directory, oldest first, so every
+replica serves the same files, history and queries without scraping. A
+follower that falls further behind than PUBLISHED_KEEP snapshots misses the
+older ones.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+COORDINATION = os.getenv('COORDINATION', 'none').lower()
+SHARED_DIR = Path(os.getenv('SHARED_DIR', 'data/shared'))
+LEASE_TTL_SECONDS = float(os.getenv('LEASE_TTL_SECONDS', '30'))
+LEASE_RENEW_SECONDS = float(os.getenv('LEASE_RENEW_SECONDS', '10'))
+FOLLOW_INTERVAL_SECONDS = float(os.getenv('FOLLOW_INTERVAL_SECONDS', '15'))
+REPLICA_ID = os.getenv('REPLICA_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+# Published snapshots kept in SHARED_DIR for followers that fell behind
+PUBLISHED_KEEP = 48
+
+MANIFEST_NAME = 'published.json'
+
+
+@dataclass
+class Lease:
+    holder: str
+    term: int
+    expires: float      # epoch seconds
+    acquired: float
+
+    def valid(self, now=None):
+        return self.expires > (time.time() if now is None else now)
+
+
+def _take(lease, holder, ttl, now):
+    """The lease after holder's attempt: renewed, taken over, or unchanged"""
+    if lease is not None and lease.holder == holder and lease.valid(now):
+        return Lease(holder, lease.term, now + ttl, lease.acquired)
+    if lease is None or not lease.valid(now):
+        return Lease(holder, (lease.term if lease else 0) + 1, now + ttl, now)
+    return lease
+
+
+class LocalLeaseBackend:
+    """In-process lease (development and tests)"""
+
+    def __init__(self):
+        self._lease = None
+        self._lock = threading.Lock()
+
+    def acquire(self, holder, ttl):
+        """Take or renew the lease. Returns the current lease (held by someone)."""
+        with self._lock:
+            self._lease = _take(self._lease, holder, ttl, time.time())
+            return self._lease
+
+    def release(self, holder):
+        with self._lock:
+            if self._lease is not None and self._lease.holder == holder:
+                self._lease = Lease(holder, self._lease.term, 0.0, self._lease.acquired)
+
+    def current(self):
+        with self._lock:
+            return self._lease
+
+
+class FileLeaseBackend:
+    """Lease record in a JSON file on shared storage, changed under an exclusive record lock"""
+
+    def __init__(self, root=SHARED_DIR):
+        self.root = Path(root)
+        self.path = self.root / 'lease.json'
+        self.lock_path = self.root / 'lease.lock'
+
+    def _locked(self, change):
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, 'a+') as lock:
+            fcntl.lockf(lock, fcntl.LOCK_EX)
+            try:
+                lease = self._read()
+                updated = change(lease)
+                if updated is not lease:
+                    tmp_path = self.path.with_name(f'.{self.path.name}.{os.getpid()}.tmp')
+                    tmp_path.write_text(json.dumps(asdict(updated)))
+                    os.replace(tmp_path, self.path)
+                return updated
+            finally:
+                fcntl.lockf(lock, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            return Lease(**json.loads(self.path.read_text()))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def acquire(self, holder, ttl):
+        return self._locked(lambda lease: _take(lease, holder, ttl, time.time()))
+
+    def release(self, holder):
+        def change(lease):
+            if lease is not None and lease.holder == holder:
+                return Lease(holder, lease.term, 0.0, lease.acquired)
+            return lease
+        self._locked(change)
+
+    def current(self):
+        return self._read()
+
+
+_local_backend = LocalLeaseBackend()
+
+
+def make_backend(kind=COORDINATION, root=SHARED_DIR):
+    """Lease backend for COORDINATION, or None for a single replica"""
+    if kind == 'none':
+        return None
+    if kind == 'file':
+        return FileLeaseBackend(root)
+    if kind == 'local':
+        return _local_backend
+    raise ValueError(f"Unknown COORDINATION backend {kind!r}, expected none, file or local")
+
+
+class LeaderElector:
+    """
+    Keeps trying to hold the lease in a background task. on_change(is_leader)
+    is awaited after every change of role. Lease calls are blocking and go
+    through run(fn, *args) (a thread by default).
+    """
+
+    def __init__(self, backend, identity=REPLICA_ID, ttl=LEASE_TTL_SECONDS, renew=LEASE_RENEW_SECONDS,
+                 on_change=None, run=asyncio.to_thread):
+        self.backend = backend
+        self.identity = identity
+        self.ttl = ttl
+        self.renew = renew
+        self.on_change = on_change
+        self.run = run
+        self.lease = None
+        self.elections = 0
+        self._task = None
+
+    @property
+    def is_leader(self):
+        # Stop acting as leader a renewal early, before another replica can take over
+        return (
+            self.lease is not None and self.lease.holder == self.identity
+            and self.lease.expires - self.renew > time.time()
+        )
+
+    async def _attempt(self):
+        was_leader = self.is_leader
+        try:
+            self.lease = await self.run(self.backend.acquire, self.identity, self.ttl)
+        except OSError as e:
+            logger.warning(f"Lease renewal failed: {str(e)}")
+        if self.is_leader != was_leader:
+            if self.is_leader:
+                self.elections += 1
+                logger.info(f"{self.identity} is now the scraper leader (term {self.lease.term})")
+            else:
+                holder = self.lease.holder if self.lease else 'nobody'
+                logger.info(f"{self.identity} is a follower (leader: {holder})")
+            if self.on_change is not None:
+                await self.on_change(self.is_leader)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.renew)
+            await self._attempt()
+
+    async def start(self):
+        """First election attempt (so the role is known on return), then renew in the background"""
+        await self._attempt()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.is_leader:
+            await self.run(self.backend.release, self.identity)
+        self.lease = None
+
+    def confirm(self):
+        """
+        Re-read the lease: True while this replica still holds it in the same
+        term. Any takeover bumps the term, so the expiry is not compared with
+        the local clock (a skewed clock would reject a lease still held).
+        """
+        current = self.backend.current()
+        return (
+            current is not None and self.lease is not None and current.holder == self.identity
+            and current.term == self.lease.term
+        )
+
+    def info(self):
+        lease = self.lease
+        return {
+            'identity': self.identity,
+            'role': 'leader' if self.is_leader else 'follower',
+            'leader': lease.holder if lease and lease.valid() else None,
+            'term': lease.term if lease else None,
+            'lease_expires': pd.Timestamp(lease.expires, unit='s', tz='UTC').isoformat() if lease else None,
+            'elections': self.elections,
+        }
+
+
+# Publication
+
+def _atomic_copy(source, destination):
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = destination.with_name(f'.{destination.name}.{os.getpid()}.tmp')
+    shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def publish(snapshot, header_text, export_paths, term=None, root=SHARED_DIR, keep=PUBLISHED_KEEP):
+    """
+    Leader: write a snapshot and its export files to shared storage. The
+    manifest is replaced last, so followers never see a partial publication.
+    """
+    root = Path(root)
+    snapshot_id = str(snapshot['snapshot_id'].iloc[0])
+    snapshots_dir = root / 'snapshots'
+    snapshots_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = snapshots_dir / f'.{snapshot_id}.{os.getpid()}.tmp'
+    snapshot.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, snapshots_dir / f'{snapshot_id}.parquet')
+
+    files = []
+    for path in export_paths:
+        path = Path(path)
+        if path.exists():
+            _atomic_copy(path, root / 'exports' / path.name)
+            files.append(path.name)
+
+    manifest = {
+        'snapshot_id': snapshot_id,
+        'snapshot_ts': pd.Timestamp(snapshot['snapshot_ts'].iloc[0]).isoformat(),
+        'header_text': header_text,
+        'rows': len(snapshot),
+        'files': files,
+        'publisher': REPLICA_ID,
+        'term': term,
+        'published_at': pd.Timestamp.now().isoformat(),
+    }
+    tmp_path = root / f'.{MANIFEST_NAME}.{os.getpid()}.tmp'
+    tmp_path.write_text(json.dumps(manifest, ensure_ascii=False))
+    os.replace(tmp_path, root / MANIFEST_NAME)
+
+    for old in sorted(snapshots_dir.glob('*.parquet'))[:-keep]:
+        old.unlink(missing_ok=True)
+    return manifest
+
+
+def read_manifest(root=SHARED_DIR):
+    try:
+        return json.loads((Path(root) / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def load_published(manifest, data_dir, after=None, root=SHARED_DIR):
+    """
+    Follower: copy a publication's export files into data_dir and return the
+    published snapshots after the `after` snapshot id, up to the manifest's,
+    oldest first (normalized frames)
+    """
+    root = Path(root)
+    latest = manifest['snapshot_id']
+    # Snapshot ids sort by time
+    missed = sorted(
+        path.stem for path in (root / 'snapshots').glob('*.parquet')
+        if (after is None or path.stem > after) and path.stem < latest
+    )
+    snapshots = []
+    for snapshot_id in missed:
+        try:
+            snapshots.append(pd.read_parquet(root / 'snapshots' / f'{snapshot_id}.parquet'))
+        except FileNotFoundError:
+            # Pruned by the leader while we read
+            logger.warning(f"Published snapshot {snapshot_id} is gone, skipping it")
+    snapshots.append(pd.read_parquet(root / 'snapshots' / f'{latest}.parquet'))
+    for name in manifest['files']:
+        _atomic_copy(root / 'exports' / name, Path(data_dir) / name)
+    return snapshots
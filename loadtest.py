@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Local load test of the API.
+
+Starts main.py under uvicorn in a child process, with the scraper replaced
+by a stub that sleeps through the usual phases (launch, navigate, click,
+table, extract) in a worker thread and returns a synthetic snapshot. Then
+it drives concurrent traffic at the dashboard, /status, /download and
+/trigger-scraping, and reports p50/p99 latency and throughput separately
+for idle periods and for periods with a scrape in flight. Results are
+written as JSON so runs can be compared against a baseline.
+
+Usage:
+    python loadtest.py [--concurrency 32] [--duration 60] [--scrape-every 20]
+                       [--output loadtest_baseline.json] [--compare old.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = Path(__file__).resolve().parent
+
+# Simulated scrape phases in seconds (roughly a real run, compressed)
+DEFAULT_PHASES = "launch=1.5,navigate=3,click=0.5,table=6,extract=1"
+
+# Relative weights of the endpoints in the traffic mix
+DEFAULT_MIX = "/=4,/status=4,/download=2,/query=2,/trigger-scraping=0.01"
+
+DOWNLOAD_PATH = "/download/egx_stocks_latest.xlsx"
+QUERY_PATH = "/query?where=change_pct:gt:1&sort=-market_cap&limit=20"
+
+
+def parse_pairs(text, cast=float):
+    pairs = {}
+    for item in text.split(','):
+        key, _, value = item.partition('=')
+        if key.strip():
+            pairs[key.strip()] = cast(value)
+    return pairs
+
+
+# Server side (child process)
+
+def serve(port, phases, rows, scrape_log):
+    """Run main.py with the scraper stubbed out"""
+    sys.path.insert(0, str(REPO_DIR))
+    import main
+    from fixtures import synthetic_prices
+
+    runs = 0
+
+    def simulated_scrape(run_stats):
+        timings = {}
+        for phase, seconds in phases.items():
+            started = time.perf_counter()
+            time.sleep(seconds)
+            timings[phase] = round(time.perf_counter() - started, 3)
+        if run_stats is not None:
+            run_stats['engine'] = 'stub'
+            run_stats['phases'] = timings
+        return synthetic_prices(rows, seed=0, drift=runs * 0.1)
+
+    async def stub_run_scraper(run_stats=None):
+        nonlocal runs
+        runs += 1
+        started = time.time()
+        try:
+            df = await asyncio.to_thread(simulated_scrape, run_stats)
+            return {main.EGX_PRICES.name: (df, "synthetic")}
+        finally:
+            with open(scrape_log, 'a') as f:
+                f.write(json.dumps({'start': started, 'end': time.time()}) + "\n")
+
+    main.run_scraper = stub_run_scraper
+
+    import uvicorn
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# Client side
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def summarize(latencies, seconds):
+    if not latencies:
+        return {'requests': 0}
+    values = np.array(latencies) * 1000
+    return {
+        'requests': len(values),
+        'throughput_rps': round(len(values) / seconds, 1) if seconds else None,
+        'p50_ms': round(float(np.percentile(values, 50)), 2),
+        'p99_ms': round(float(np.percentile(values, 99)), 2),
+        'max_ms': round(float(values.max()), 2),
+    }
+
+
+def in_scrape(ts, intervals):
+    return any(start <= ts <= end for start, end in intervals)
+
+
+def build_report(samples, intervals, window, config):
+    """Split samples into idle and scraping periods, per endpoint and overall"""
+    start, end = window
+    scraping_seconds = sum(max(0.0, min(e, end) - max(s, start)) for s, e in intervals)
+    periods = {'idle': end - start - scraping_seconds, 'scraping': scraping_seconds}
+
+    report = {'config': config, 'periods': {}}
+    for period, seconds in periods.items():
+        selected = [s for s in samples if in_scrape(s['start'], intervals) == (period == 'scraping')]
+        endpoints = {}
+        for endpoint in sorted({s['endpoint'] for s in selected}):
+            endpoints[endpoint] = summarize([s['latency'] for s in selected if s['endpoint'] == endpoint], seconds)
+        report['periods'][period] = {
+            'seconds': round(seconds, 1),
+            'overall': summarize([s['latency'] for s in selected], seconds),
+            'errors': sum(1 for s in selected if s['status'] >= 500 or s['status'] == 0),
+            'endpoints': endpoints,
+        }
+    report['scrapes'] = len(intervals)
+    return report
+
+
+async def drive(base_url, concurrency, duration, scrape_every, mix):
+    import httpx
+
+    endpoints = list(mix)
+    weights = [mix[e] for e in endpoints]
+    paths = {'/download': DOWNLOAD_PATH, '/query': QUERY_PATH}
+    samples = []
+    deadline = time.time() + duration
+
+    async def request(client, endpoint):
+        started = time.time()
+        t0 = time.perf_counter()
+        try:
+            if endpoint == '/trigger-scraping':
+                response = await client.post(endpoint)
+            else:
+                response = await client.get(paths.get(endpoint, endpoint))
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        samples.append({
+            'endpoint': endpoint,
+            'start': started,
+            'latency': time.perf_counter() - t0,
+            'status': status,
+        })
+
+    async def user(client):
+        while time.time() < deadline:
+            await request(client, random.choices(endpoints, weights)[0])
+
+    async def trigger(client):
+        # Guarantees scrape periods even when the mix rarely triggers
+        while time.time() + scrape_every < deadline:
+            await asyncio.sleep(scrape_every)
+            await request(client, '/trigger-scraping')
+
+    limits = httpx.Limits(max_connections=concurrency + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await asyncio.gather(trigger(client), *(user(client) for _ in range(concurrency)))
+    return samples
+
+
+def wait_until_ready(base_url, process, timeout=120):
+    import httpx
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(base_url + "/status", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+
+def compare(report, baseline):
+    """Print p50/p99 changes against a previous report"""
+    for period in ('idle', 'scraping'):
+        old = baseline.get('periods', {}).get(period, {}).get('endpoints', {})
+        new = report['periods'].get(period, {}).get('endpoints', {})
+        for endpoint in sorted(set(old) & set(new)):
+            parts = []
+            for metric in ('p50_ms', 'p99_ms'):
+                if metric in old[endpoint] and metric in new[endpoint]:
+                    before, after = old[endpoint][metric], new[endpoint][metric]
+                    change = (after - before) / before * 100 if before else 0.0
+                    parts.append(f"{metric} {before} -> {after} ({change:+.0f}%)")
+            logger.info(f"[{period}] {endpoint}: " + ", ".join(parts))
+
+
+def run(args):
+    phases = parse_pairs(args.phases)
+    mix = parse_pairs(args.mix)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+
+    with tempfile.TemporaryDirectory(prefix="egx-loadtest-") as workdir:
+        scrape_log = Path(workdir) / "scrapes.jsonl"
+        env = dict(os.environ, PYTHONPATH=str(REPO_DIR), SCRAPER_ISOLATION="thread")
+        process = subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve()), "--serve", str(port),
+             "--phases", args.phases, "--rows", str(args.rows), "--scrape-log", str(scrape_log)],
+            cwd=workdir, env=env,
+        )
+        try:
+            # The first scrape runs during startup, before the server answers
+            startup_began = time.perf_counter()
+            wait_until_ready(base_url, process)
+            startup_seconds = time.perf_counter() - startup_began
+
+            window_start = time.time()
+            samples = asyncio.run(drive(base_url, args.concurrency, args.duration, args.scrape_every, mix))
+            window_end = time.time()
+            # Let a scrape triggered at the end finish so its interval is logged
+            time.sleep(sum(phases.values()) + 1)
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+        intervals = []
+        if scrape_log.exists():
+            for line in scrape_log.read_text().splitlines():
+                entry = json.loads(line)
+                intervals.append((entry['start'], entry['end']))
+
+    config = {
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'scrape_every': args.scrape_every,
+        'rows': args.rows,
+        'phases': phases,
+        'mix': mix,
+    }
+    report = build_report(samples, intervals, (window_start, window_end), config)
+    report['startup_seconds'] = round(startup_seconds, 2)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the API with a stubbed scraper")
+    parser.add_argument('--concurrency', type=int, default=32, help="Concurrent clients")
+    parser.add_argument('--duration', type=float, default=60, help="Seconds of traffic")
+    parser.add_argument('--scrape-every', type=float, default=20, help="Seconds between triggered scrapes")
+    parser.add_argument('--phases', default=DEFAULT_PHASES, help="Simulated phase durations, name=seconds,...")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Endpoint weights, path=weight,...")
+    parser.add_argument('--rows', type=int, default=220, help="Rows in the synthetic snapshot")
+    parser.add_argument('--output', default="loadtest_baseline.json", help="Where to write the JSON report")
+    parser.add_argument('--compare', help="Previous report to compare against")
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--scrape-log', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.serve, parse_pairs(args.phases), args.rows, args.scrape_log)
+        return 0
+
+    report = run(args)
+    Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    for period, data in report['periods'].items():
+        logger.info(f"{period} ({data['seconds']}s): {data['overall']}, errors: {data['errors']}")
+    logger.info(f"Startup took {report['startup_seconds']}s; report written to {args.output}")
+
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+Event-loop lag monitor.
+
+A sampler task sleeps for a fixed interval and records how late it wakes up
+(the loop lag) in a fixed-bucket histogram. A watchdog thread checks the
+sampler's heartbeat; when the loop has not run for longer than the stall
+threshold it grabs the loop thread's current stack, which is whatever is
+blocking it. Stalls are grouped by stack into a table of offenders.
+
+The steady-state cost is one short timer callback per interval on the loop
+and one thread wakeup per half threshold; stacks are only taken on stalls.
+
+With LOOP_SLOW_CALLBACKS on, the loop also runs in asyncio debug mode with
+slow_callback_duration set to the stall threshold. asyncio then reports
+every callback or task step that ran longer, naming the coroutine rather
+than the blocked frame, and those reports are counted per callback. Debug
+mode adds overhead to every task, so this is off by default.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR = os.getenv('LOOP_MONITOR', 'true').lower() in ('1', 'true', 'yes')
+LOOP_STALL_MS = float(os.getenv('LOOP_STALL_MS', '100'))
+LOOP_SLOW_CALLBACKS = os.getenv('LOOP_SLOW_CALLBACKS', 'false').lower() in ('1', 'true', 'yes')
+
+# Seconds between sampler wakeups
+SAMPLE_INTERVAL = 0.25
+
+# Upper bounds (ms) of the lag histogram buckets; the last bucket is open
+BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# Frames kept per offender stack
+STACK_DEPTH = 12
+
+MAX_OFFENDERS = 50
+
+REPO_DIR = str(Path(__file__).resolve().parent)
+
+# asyncio's report of a slow callback (base_events, debug mode only)
+SLOW_CALLBACK_MESSAGE = 'Executing %s took %.3f seconds'
+
+
+def _callback_key(handle):
+    """
+    Group reports by coroutine (and where it ran or was defined), dropping
+    task names, states, results and addresses that differ between runs.
+    """
+    text = str(handle)
+    coro = re.search(r"coro=<(.*?)>", text)
+    if coro:
+        return coro.group(1).replace(' done,', '')
+    return re.sub(r" at 0x[0-9a-f]+", '', text.split(' created at ')[0]).strip('<>')
+
+
+def _stack_key(frames):
+    """
+    Group stalls by the innermost application frame (plus the frame that
+    actually blocked), so different call paths into e.g. to_excel stay apart.
+    """
+    own = [f for f in frames if f.filename.startswith(REPO_DIR) and not f.filename.endswith('loopmon.py')]
+    anchor = own[-1] if own else frames[-1]
+    leaf = frames[-1]
+    return (
+        f"{Path(anchor.filename).name}:{anchor.lineno} in {anchor.name}",
+        f"{Path(leaf.filename).name}:{leaf.lineno} in {leaf.name}",
+    )
+
+
+class _SlowCallbackFilter(logging.Filter):
+    """Passes asyncio's slow-callback reports on to the monitor"""
+
+    def __init__(self, monitor):
+        super().__init__()
+        self.monitor = monitor
+
+    def filter(self, record):
+        if record.msg == SLOW_CALLBACK_MESSAGE and len(record.args or ()) == 2:
+            self.monitor._record_slow_callback(*record.args)
+        return True
+
+
+class LoopMonitor:
+    """Lag histogram and stall sampler for one event loop"""
+
+    def __init__(self, stall_ms=LOOP_STALL_MS, interval=SAMPLE_INTERVAL, slow_callbacks=LOOP_SLOW_CALLBACKS):
+        self.stall_ms = stall_ms
+        self.interval = interval
+        self.slow_callbacks = slow_callbacks
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.samples = 0
+        self.total_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.stalls = 0
+        self.offenders = {}
+        self.slow = {}
+        self.slow_count = 0
+        self.started_at = None
+
+        self._beat = None
+        self._pending = None  # offender key captured during the current stall
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._loop_thread_id = None
+        self._lock = threading.Lock()
+        self._filter = _SlowCallbackFilter(self)
+        self._debug_was = None
+
+    def start(self):
+        """Start sampling the running loop"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self.started_at = time.time()
+        self._stop.clear()
+        loop = asyncio.get_running_loop()
+        if self.slow_callbacks:
+            self._debug_was = loop.get_debug()
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.stall_ms / 1000
+            logging.getLogger('asyncio').addFilter(self._filter)
+        self._task = loop.create_task(self._sample())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Event loop monitor started (stall threshold {self.stall_ms:.0f} ms"
+            + (", slow callback reports on)" if self.slow_callbacks else ")")
+        )
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._debug_was is not None:
+            logging.getLogger('asyncio').removeFilter(self._filter)
+            asyncio.get_running_loop().set_debug(self._debug_was)
+            self._debug_was = None
+        await asyncio.to_thread(self._thread.join, 1)
+        self._thread = None
+
+    async def _sample(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            self._record(max(0.0, (now - expected) * 1000))
+
+    def _record(self, lag_ms):
+        with self._lock:
+            self.counts[bisect.bisect_left(BUCKETS_MS, lag_ms)] += 1
+            self.samples += 1
+            self.total_lag_ms += lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            key, self._pending = self._pending, None
+            if lag_ms >= self.stall_ms:
+                self.stalls += 1
+                if key is not None:
+                    offender = self.offenders[key]
+                    offender['total_ms'] += lag_ms
+                    offender['max_ms'] = max(offender['max_ms'], lag_ms)
+                if lag_ms >= self.stall_ms * 10:
+                    logger.warning(f"Event loop blocked for {lag_ms:.0f} ms" + (f" at {key[0]}" if key else ""))
+
+    def _record_slow_callback(self, handle, seconds):
+        """A callback asyncio reported as slower than slow_callback_duration"""
+        key = _callback_key(handle)
+        ms = seconds * 1000
+        with self._lock:
+            self.slow_count += 1
+            entry = self.slow.get(key)
+            if entry is None:
+                if len(self.slow) >= MAX_OFFENDERS:
+                    del self.slow[min(self.slow, key=lambda k: self.slow[k]['total_ms'])]
+                entry = self.slow[key] = {'callback': key, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            entry['count'] += 1
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+            entry['last_seen'] = time.time()
+
+    def _watch(self):
+        """Watchdog thread: sample the loop thread's stack while it is stuck"""
+        limit = (self.interval * 1000 + self.stall_ms) / 1000
+        while not self._stop.wait(self.stall_ms / 2000):
+            if self._pending is not None or time.monotonic() - self._beat < limit:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            frames = traceback.extract_stack(frame)[-STACK_DEPTH:]
+            key = _stack_key(frames)
+            with self._lock:
+                offender = self.offenders.get(key)
+                if offender is None:
+                    if len(self.offenders) >= MAX_OFFENDERS:
+                        # Forget the least costly offender to stay bounded
+                        del self.offenders[min(self.offenders, key=lambda k: self.offenders[k]['total_ms'])]
+                    offender = self.offenders[key] = {
+                        'where': key[0],
+                        'blocked_in': key[1],
+                        'count': 0,
+                        'total_ms': 0.0,
+                        'max_ms': 0.0,
+                        'stack': ''.join(traceback.format_list(frames)),
+                    }
+                offender['count'] += 1
+                offender['last_seen'] = time.time()
+                self._pending = key
+
+    def _percentile(self, q):
+        """Upper bucket bound holding the q-th percentile"""
+        if not self.samples:
+            return None
+        target = q * self.samples
+        seen = 0
+        for bound, count in zip(BUCKETS_MS + [None], self.counts):
+            seen += count
+            if seen >= target:
+                return bound if bound is not None else round(self.max_lag_ms, 1)
+        return None
+
+    def info(self, top=10):
+        with self._lock:
+            histogram = {
+                (f"le_{bound}ms" if bound is not None else f"gt_{BUCKETS_MS[-1]}ms"): count
+                for bound, count in zip(BUCKETS_MS + [None], self.counts)
+            }
+            offenders = sorted(self.offenders.values(), key=lambda o: o['total_ms'], reverse=True)[:top]
+            slow = sorted(self.slow.values(), key=lambda s: s['total_ms'], reverse=True)[:top]
+            return {
+                'running': self._task is not None,
+                'since': self.started_at,
+                'interval_ms': self.interval * 1000,
+                'stall_threshold_ms': self.stall_ms,
+                'samples': self.samples,
+                'mean_lag_ms': round(self.total_lag_ms / self.samples, 2) if self.samples else None,
+                'p50_lag_ms': self._percentile(0.50),
+                'p99_lag_ms': self._percentile(0.99),
+                'max_lag_ms': round(self.max_lag_ms, 1),
+                'stalls': self.stalls,
+                'histogram': histogram,
+                'top_offenders': [
+                    {**o, 'total_ms': round(o['total_ms'], 1), 'max_ms': round(o['max_ms'], 1)}
+                    for o in offenders
+                ],
+                'slow_callbacks': {
+                    'enabled': self.slow_callbacks,
+                    'count': self.slow_count,
+                    'top': [
+                        {**s, 'total_ms': round(s['total_ms'], 1), 'max_ms': round(s['max_ms'], 1)}
+                        for s in slow
+                    ],
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(BUCKETS_MS) + 1)
+            self.samples = 0
+            self.total_lag_ms = 0.0
+            self.max_lag_ms = 0.0
+            self.stalls = 0
+            self.offenders = {}
+            self.slow = {}
+            self.slow_count = 0
+            self._pending = None
@@ -1,15 +1,38 @@
-from fastapi import FastAPI, BackgroundTasks
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, BackgroundTasks, Request, Query
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 import os
 import json
 from datetime import datetime, timedelta
+from typing import List, Optional
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 import asyncio
 from pathlib import Path
 import logging
-from scraper import scrape_egx_stocks
+import threading
+import time
+from contextlib import aclosing
+from scraper import run_targets
+from async_scraper import async_run_targets
+from targets import EGX_PRICES, get_targets
+from history import HistoryStore, normalize_snapshot, snapshot_id_for
+from scrape_worker import ScrapeWorker
+from artifacts import publish_artifact, get_artifact, cached_artifact, artifact_response
+from query import SnapshotIndex, QueryError, DEFAULT_LIMIT, resolve_column
+from loopmon import LoopMonitor, LOOP_MONITOR
+from journal import RunJournal, SUCCESS, FAILED
+from alerts import AlertEngine, WebhookDispatcher, load_rules, ALERT_RULES_PATH
+from sql import SQLQuery, SQLError, SQLBusy, SQL_MAX_ROWS
+from indicators import IndicatorState, load_or_build, INDICATORS_PATH
+from ringbuffer import SnapshotRing
+import archive
+from resultcache import ResultCache, normalize_key
+from history_queries import parse_range, company_history, sector_turnover, encode, DEFAULT_FIELDS
+from history_export import export_chunks, FORMATS as EXPORT_FORMATS
+from leader import LeaderElector, make_backend, publish, read_manifest, load_published, FOLLOW_INTERVAL_SECONDS
+from runtime import Runtime
+import pandas as pd
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -29,49 +52,236 @@ class ScrapingState:
     next_update: datetime = None
     is_scraping: bool = False
     error_message: str = None
+    last_run_stats: dict = None
+    current_run_id: int = None
+    snapshot_id: str = None
 
 state = ScrapingState()
 
+# Durable journal of every run; the state above is rebuilt from it at startup
+journal = RunJournal(DATA_DIR / "journal.sqlite3")
+
 # Scheduler
 scheduler = AsyncIOScheduler()
 
+# Snapshot history (Parquet, partitioned by day)
+history_store = HistoryStore(DATA_DIR / "history")
+
+# Indexed latest snapshot behind /query
+snapshot_index = SnapshotIndex()
+
+# Price alert rules evaluated on every snapshot
+alert_engine = AlertEngine(store=history_store, dispatcher=WebhookDispatcher())
+
+# Cached results of /history queries, invalidated per published snapshot
+result_cache = ResultCache()
+
+# Last week of snapshots in memory for intraday series (/recent)
+snapshot_ring = SnapshotRing()
+
+# Rolling technical indicators, updated per snapshot and checkpointed
+indicator_state = IndicatorState()
+
+# Event-loop lag and stall sampling (/diagnostics/loop)
+loop_monitor = LoopMonitor()
+
+# Sized pools and per-stage limits for all blocking work (see runtime.py)
+runtime = Runtime()
+
+# Scraper leadership across replicas (COORDINATION); without a backend this replica always scrapes
+lease_backend = make_backend()
+elector = None
+follow_task = None
+
 # Paths
-EXCEL_FILENAME = "egx_stocks_latest.xlsx"
+XLSX_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+EXCEL_FILENAME = EGX_PRICES.output_filename
 EXCEL_PATH = DATA_DIR / EXCEL_FILENAME
 
+# Scraping engine: "selenium" (runs in a worker thread) or "async" (DevTools from the event loop)
+SCRAPER_ENGINE = os.getenv("SCRAPER_ENGINE", "selenium")
+
+# Registered targets scraped together on every run (see targets.py); prices always included
+SCRAPE_TARGETS = [name.strip() for name in os.getenv("SCRAPE_TARGETS", EGX_PRICES.name).split(",") if name.strip()]
+if EGX_PRICES.name not in SCRAPE_TARGETS:
+    SCRAPE_TARGETS.insert(0, EGX_PRICES.name)
+TARGET_FILENAMES = {target.output_filename for target in get_targets(SCRAPE_TARGETS)}
+
+# Scrape isolation: "process" runs the browser in a supervised worker process,
+# "thread" runs it inside the API process
+SCRAPER_ISOLATION = os.getenv("SCRAPER_ISOLATION", "process")
+scrape_worker = ScrapeWorker(run=runtime.runner("scrape"))
+
+async def run_scraper(run_stats=None):
+    """
+    Scrape all configured targets through one browser session.
+    Returns: {target name: (DataFrame, header_text)}
+    """
+    # Row counts of the previous snapshot let the scraper detect truncated tables
+    expected_rows = (state.last_run_stats or {}).get("rows")
+    
+    if SCRAPER_ISOLATION == "process":
+        return await scrape_worker.run(SCRAPE_TARGETS, SCRAPER_ENGINE, stats=run_stats, expected_rows=expected_rows)
+    
+    targets = get_targets(SCRAPE_TARGETS)
+    if SCRAPER_ENGINE == "async":
+        return await async_run_targets(targets, stats=run_stats, expected_rows=expected_rows, run=runtime.runner("files"))
+    return await runtime.run("scrape", run_targets, targets, None, run_stats, expected_rows)
+
+def write_export(df, path):
+    """Write an Excel export atomically and publish its download variants"""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    df.to_excel(tmp_path, index=False, engine='openpyxl')
+    os.replace(tmp_path, path)
+    publish_artifact(path)
+
+async def export_available():
+    """Whether the prices export exists; no disk access once its artifact is in memory"""
+    if cached_artifact(EXCEL_PATH) is not None:
+        return True
+    return await runtime.run("files", EXCEL_PATH.exists)
+
+def scheduled_next_update():
+    """Next run of the hourly job, or an hour from now before it is scheduled"""
+    job = scheduler.get_job('scraping_job')
+    if job is not None and job.next_run_time is not None:
+        return job.next_run_time.astimezone().replace(tzinfo=None)
+    return datetime.now() + timedelta(hours=1)
+
+def is_leader():
+    """Whether this replica scrapes; followers load the leader's published snapshots"""
+    return elector is None or elector.is_leader
+
 async def background_scraping():
     """Background scraping job - runs 2 minutes before the update completes"""
+    if not is_leader():
+        return
     logger.info("Background scraping started (2 minutes before update deadline)")
+    run_id = await runtime.run("journal", journal.start_run, "background")
     try:
         # Run scraper silently in background
-        df, header_text = await asyncio.to_thread(scrape_egx_stocks)
+        run_stats = {}
+        results = await run_scraper(run_stats)
+        df, header_text = results[EGX_PRICES.name]
+        # Index the archived tables too, or nothing could reach them
+        snapshot_ts = datetime.now()
+        for name, page in run_stats.get('archive', {}).items():
+            try:
+                await runtime.run(
+                    "files", archive.record, snapshot_id_for(snapshot_ts) + archive.BACKGROUND_SUFFIX, snapshot_ts,
+                    name, page, results[name][1]
+                )
+            except OSError as e:
+                logger.warning(f"Archive index not updated for {name}: {str(e)}")
+        await runtime.run("journal", journal.finish_run, run_id, SUCCESS, rows=len(df), stats=run_stats)
         logger.info("Background scraping completed successfully")
     except Exception as e:
+        await runtime.run("journal", journal.finish_run, run_id, FAILED, error=str(e))
         logger.warning(f"Background scraping failed (non-critical): {str(e)}")
 
-async def scheduled_scraping():
+async def scheduled_scraping(trigger="scheduled"):
     """Execute scraping every 1 hours"""
     global state
     
     if state.is_scraping:
         logger.warning("Scraping already in progress, skipping this run")
+        await runtime.run("journal", journal.record_skipped, trigger, "Scraping already in progress")
+        return
+    
+    if not is_leader():
+        logger.info(f"Not the scraper leader, skipping the {trigger} run")
         return
     
+    run_id = None
+    run_stats = {}
+    phases = {}
     try:
         state.is_scraping = True
         state.error_message = None
-        logger.info("Starting scheduled scraping...")
+        run_id = state.current_run_id = await runtime.run("journal", journal.start_run, trigger)
+        logger.info(f"Starting scraping run {run_id} ({trigger})...")
+        
+        # Run scraper
+        started = time.perf_counter()
+        results = await run_scraper(run_stats)
+        phases['scrape'] = time.perf_counter() - started
+        state.last_run_stats = run_stats
+        
+        # A replica that lost the lease mid-run must not publish over the new leader
+        if elector is not None and not await runtime.run("files", elector.confirm):
+            raise RuntimeError("Scraper lease lost during the run, results discarded")
+        
+        snapshot_ts = datetime.now()
         
-        # Run scraper (convert to async if needed)
-        df, header_text = await asyncio.to_thread(scrape_egx_stocks)
+        # Save one file per target
+        started = time.perf_counter()
+        for target in get_targets(SCRAPE_TARGETS):
+            df, header_text = results[target.name]
+            await runtime.run("export", write_export, df, DATA_DIR / target.output_filename)
+        phases['save'] = time.perf_counter() - started
         
-        # Save file
-        df.to_excel(EXCEL_PATH, index=False, engine='openpyxl')
+        # Link the archived tables to this snapshot for offline re-parsing
+        for name, page in run_stats.get('archive', {}).items():
+            try:
+                await runtime.run(
+                    "files", archive.record, snapshot_id_for(snapshot_ts), snapshot_ts, name, page, results[name][1]
+                )
+            except OSError as e:
+                logger.warning(f"Archive index not updated for {name}: {str(e)}")
+        
+        # Keep the prices snapshot in the history store and index it for /query
+        started = time.perf_counter()
+        df, header_text = results[EGX_PRICES.name]
+        snapshot = await runtime.run("snapshot", normalize_snapshot, df, snapshot_ts)
+        await runtime.run("history", history_store.append, snapshot)
+        result_cache.publish(snapshot_ts)
+        phases['history'] = time.perf_counter() - started
+        started = time.perf_counter()
+        await runtime.run("snapshot", snapshot_index.rebuild, snapshot)
+        await runtime.run("snapshot", snapshot_ring.append, snapshot)
+        phases['index'] = time.perf_counter() - started
+        
+        # Alerts must not fail the run
+        started = time.perf_counter()
+        try:
+            run_stats['alerts'] = await runtime.run("snapshot", alert_engine.process, snapshot)
+        except Exception as e:
+            logger.warning(f"Alert evaluation failed: {str(e)}")
+        phases['alerts'] = time.perf_counter() - started
+        
+        # Indicators are derived data and must not fail the run either
+        started = time.perf_counter()
+        try:
+            if await runtime.run("snapshot", indicator_state.update, snapshot):
+                await runtime.run("files", indicator_state.save, INDICATORS_PATH)
+        except Exception as e:
+            logger.warning(f"Indicator update failed: {str(e)}")
+        phases['indicators'] = time.perf_counter() - started
+        
+        # Hand the snapshot to the followers; they catch up on the next run if this fails
+        if elector is not None:
+            started = time.perf_counter()
+            try:
+                await runtime.run(
+                    "files", publish, snapshot, header_text,
+                    [DATA_DIR / target.output_filename for target in get_targets(SCRAPE_TARGETS)],
+                    elector.lease.term,
+                )
+            except Exception as e:
+                logger.warning(f"Publishing the snapshot failed: {str(e)}")
+            phases['publish'] = time.perf_counter() - started
         
         # Update state
         state.current_file = EXCEL_FILENAME
-        state.last_update = datetime.now()
-        state.next_update = datetime.now() + timedelta(hours=1)
+        state.last_update = snapshot_ts
+        state.snapshot_id = snapshot_id_for(snapshot_ts)
+        state.next_update = scheduled_next_update()
+        
+        await runtime.run(
+            "journal", journal.finish_run, run_id, SUCCESS,
+            rows=len(df), snapshot_id=snapshot_id_for(snapshot_ts), filename=EXCEL_FILENAME,
+            stats=run_stats, phases={name: round(seconds, 3) for name, seconds in phases.items()}
+        )
         
         logger.info(f"Scraping completed successfully. File saved: {EXCEL_PATH}")
         logger.info(f"Next update scheduled for: {state.next_update}")
@@ -79,31 +289,182 @@ async def scheduled_scraping():
     except Exception as e:
         logger.error(f"Scraping failed: {str(e)}", exc_info=True)
         state.error_message = str(e)
+        if run_id is not None:
+            await runtime.run(
+                "journal", journal.finish_run, run_id, FAILED, error=str(e), stats=run_stats,
+                phases={name: round(seconds, 3) for name, seconds in phases.items()}
+            )
         
     finally:
         state.is_scraping = False
+        state.current_run_id = None
+
+async def follow_published():
+    """
+    Follower: load the snapshots the leader published since our latest one,
+    oldest first, as if they had been scraped here (minus alerts, which the
+    leader sends)
+    """
+    manifest = await runtime.run("files", read_manifest)
+    if manifest is None or manifest['snapshot_id'] == state.snapshot_id:
+        return False
+    
+    run_id = await runtime.run("journal", journal.start_run, "follow")
+    try:
+        snapshots = await runtime.run("files", load_published, manifest, DATA_DIR, state.snapshot_id)
+        for name in manifest['files']:
+            await runtime.run("files", publish_artifact, DATA_DIR / name)
+        await runtime.run("history", history_store.append, snapshots)
+        for snapshot in snapshots:
+            result_cache.publish(snapshot['snapshot_ts'].iloc[0])
+            await runtime.run("snapshot", snapshot_ring.append, snapshot)
+        await runtime.run("snapshot", snapshot_index.rebuild, snapshots[-1])
+        try:
+            updated = False
+            for snapshot in snapshots:
+                updated = await runtime.run("snapshot", indicator_state.update, snapshot) or updated
+            if updated:
+                await runtime.run("files", indicator_state.save, INDICATORS_PATH)
+        except Exception as e:
+            logger.warning(f"Indicator update failed: {str(e)}")
+    except Exception as e:
+        await runtime.run("journal", journal.finish_run, run_id, FAILED, error=str(e))
+        raise
+    
+    snapshot_ts = pd.Timestamp(manifest['snapshot_ts']).to_pydatetime()
+    if EXCEL_FILENAME in manifest['files']:
+        state.current_file = EXCEL_FILENAME
+    state.last_update = snapshot_ts
+    state.next_update = snapshot_ts + timedelta(hours=1)
+    state.snapshot_id = manifest['snapshot_id']
+    state.error_message = None
+    await runtime.run(
+        "journal", journal.finish_run, run_id, SUCCESS, rows=manifest['rows'], snapshot_id=manifest['snapshot_id'],
+        filename=state.current_file,
+        stats={'published_by': manifest['publisher'], 'term': manifest['term'], 'snapshots': len(snapshots)},
+    )
+    logger.info(
+        f"Loaded snapshot {manifest['snapshot_id']} published by {manifest['publisher']}"
+        f" ({len(snapshots)} snapshot(s) caught up)"
+    )
+    return True
+
+async def follow_loop():
+    """Poll shared storage for new snapshots while this replica is a follower"""
+    while True:
+        await asyncio.sleep(FOLLOW_INTERVAL_SECONDS)
+        if is_leader():
+            continue
+        try:
+            await follow_published()
+        except Exception as e:
+            logger.warning(f"Could not load the published snapshot: {str(e)}")
+
+async def leadership_changed(leader):
+    """A replica taking over catches up and scrapes at once if the last snapshot is over an hour old"""
+    if not leader:
+        return
+    try:
+        await follow_published()
+    except Exception as e:
+        logger.warning(f"Could not load the published snapshot: {str(e)}")
+    if state.last_update is None or state.last_update + timedelta(hours=1) <= datetime.now():
+        # The scheduler keeps the job referenced and logs its failures
+        scheduler.add_job(
+            scheduled_scraping,
+            args=["takeover"],
+            id='takeover_scraping_job',
+            name='EGX Stock Scraping (takeover)',
+            replace_existing=True
+        )
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize scheduler on startup"""
-    global state
+    global state, indicator_state, elector, follow_task
     
     logger.info("Starting up application...")
     
-    # Check if file exists from previous run
-    if EXCEL_PATH.exists():
+    if LOOP_MONITOR:
+        loop_monitor.start()
+    
+    try:
+        alert_engine.set_rules(load_rules(ALERT_RULES_PATH))
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not load alert rules from {ALERT_RULES_PATH}: {str(e)}")
+    
+    # Rebuild state from the run journal
+    await runtime.run("journal", journal.recover)
+    restored = await runtime.run("journal", journal.restore_state)
+    state.last_update = restored['last_update']
+    state.current_file = restored['current_file']
+    state.last_run_stats = restored['last_run_stats']
+    state.error_message = restored['error_message']
+    state.snapshot_id = restored['snapshot_id']
+    anchor = await runtime.run("journal", journal.last_cadence_start)
+    
+    # Deployments without a journal yet: fall back to the file from the previous run
+    excel_exists = await runtime.run("files", EXCEL_PATH.exists)
+    if state.last_update is None and excel_exists:
         state.current_file = EXCEL_FILENAME
-        state.last_update = datetime.fromtimestamp(EXCEL_PATH.stat().st_mtime)
-        state.next_update = state.last_update + timedelta(hours=1)
+        state.last_update = datetime.fromtimestamp((await runtime.run("files", EXCEL_PATH.stat)).st_mtime)
+        anchor = anchor or state.last_update
+    
+    if state.current_file and excel_exists:
+        try:
+            df = await runtime.run("export", pd.read_excel, EXCEL_PATH, dtype=str, engine='openpyxl')
+            await runtime.run("snapshot", snapshot_index.rebuild_from_export, df, state.last_update)
+        except Exception as e:
+            logger.warning(f"Could not index existing snapshot: {str(e)}")
+    
+    try:
+        loaded = await runtime.run("history", snapshot_ring.load_recent, history_store)
+        logger.info(f"Loaded {loaded} recent snapshot(s) into memory")
+        newest = snapshot_ring.info()['newest']
+        if newest:
+            result_cache.publish(newest)
+    except Exception as e:
+        logger.warning(f"Could not load recent snapshots: {str(e)}")
+    
+    # Rules that matched before the restart should not fire again
+    try:
+        seeded = await runtime.run("history", alert_engine.load_previous)
+        if seeded:
+            logger.info(f"Alert matches resume from snapshot {seeded}")
+    except Exception as e:
+        logger.warning(f"Could not restore alert matches: {str(e)}")
+    
+    # Indicators resume from their checkpoint and only read newer snapshots
+    try:
+        indicator_state = await runtime.run("history", load_or_build, history_store, INDICATORS_PATH)
+    except Exception as e:
+        logger.warning(f"Could not restore indicators: {str(e)}")
+    
+    # Join the election before deciding whether to scrape
+    if lease_backend is not None:
+        elector = LeaderElector(lease_backend, run=runtime.runner("files"))
+        await elector.start()
+        elector.on_change = leadership_changed
+        follow_task = asyncio.create_task(follow_loop())
+        logger.info(f"Coordination: {elector.info()['role']} ({elector.identity})")
+    
+    if not is_leader():
+        # Followers serve the leader's snapshots and never scrape
+        try:
+            await follow_published()
+        except Exception as e:
+            logger.warning(f"Could not load the published snapshot: {str(e)}")
+    elif anchor is None or anchor + timedelta(hours=1) <= datetime.now():
+        # First run, or the scheduled run was missed while stopped: run immediately
+        anchor = datetime.now()
+        await scheduled_scraping("startup")
     else:
-        # First run immediately
-        await scheduled_scraping()
-        state.next_update = datetime.now() + timedelta(hours=1)
+        logger.info(f"Resuming hourly cadence from run started at {anchor}")
     
-    # Start main scheduler (runs every 1 hour)
+    # Start main scheduler (runs every 1 hour, aligned with the last run)
     scheduler.add_job(
         scheduled_scraping,
-        IntervalTrigger(hours=1),
+        IntervalTrigger(hours=1, start_date=anchor),
         id='scraping_job',
         name='EGX Stock Scraping',
         replace_existing=True
@@ -123,6 +484,8 @@ async def startup_event():
     if not scheduler.running:
         scheduler.start()
         logger.info("Scheduler started - Updates every 1 hour with 2-minute pre-scraping")
+    
+    state.next_update = scheduled_next_update()
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -130,6 +493,16 @@ async def shutdown_event():
     if scheduler.running:
         scheduler.shutdown()
         logger.info("Scheduler stopped")
+    
+    if follow_task is not None:
+        follow_task.cancel()
+    if elector is not None:
+        # Hand the lease over now instead of after its TTL
+        await elector.stop()
+    await runtime.run("scrape", scrape_worker.stop)
+    await loop_monitor.stop()
+    runtime.shutdown()
+    journal.close()
 
 @app.get("/", response_class=HTMLResponse)
 async def get_dashboard():
@@ -156,7 +529,7 @@ async def get_dashboard():
     if state.last_update:
         last_update_text = state.last_update.strftime("%Y-%m-%d %H:%M:%S")
     
-    if state.current_file and EXCEL_PATH.exists():
+    if state.current_file and await export_available():
         download_enabled = ""
         download_link = f"/download/{state.current_file}"
     
@@ -464,31 +837,301 @@ async def get_status():
         "next_update": state.next_update.isoformat() if state.next_update else None,
         "is_scraping": state.is_scraping,
         "error_message": state.error_message,
-        "file_exists": EXCEL_PATH.exists()
+        "file_exists": await export_available(),
+        "last_run": state.last_run_stats,
+        "worker": scrape_worker.info() if SCRAPER_ISOLATION == "process" else None,
+        "query_index": snapshot_index.info(),
+        "recent_snapshots": snapshot_ring.info(),
+        "result_cache": result_cache.info(),
+        "runtime": runtime.info(),
+        "coordination": dict(elector.info(), snapshot_id=state.snapshot_id) if elector else None
     }
 
-@app.get("/download/{filename}")
-async def download_file(filename: str):
-    """Download the Excel file"""
-    if filename != EXCEL_FILENAME:
-        return {"error": "Invalid filename"}, 404
+@app.api_route("/download/{filename}", methods=["GET", "HEAD"])
+async def download_file(filename: str, request: Request):
+    """Download the Excel file of a scrape target (compressed, cacheable, resumable)"""
+    if filename not in TARGET_FILENAMES:
+        return JSONResponse({"error": "Invalid filename"}, status_code=404)
     
-    if not EXCEL_PATH.exists():
-        return {"error": "File not found"}, 404
+    file_path = DATA_DIR / filename
+    meta = cached_artifact(file_path) or await runtime.run("files", get_artifact, file_path)
+    if meta is None:
+        return JSONResponse({"error": "File not found"}, status_code=404)
     
-    return FileResponse(
-        path=EXCEL_PATH,
-        filename=filename,
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    # Clients may reuse the file until the next scheduled update
+    max_age = (state.next_update - datetime.now()).total_seconds() if state.next_update else 0
+    return artifact_response(request, file_path, meta, filename, XLSX_MEDIA_TYPE, max_age)
+
+@app.get("/query")
+async def query_snapshot(
+    where: Optional[List[str]] = Query(None, description="Filters like change_pct:gt:3 or sector:eq:بنوك"),
+    sort: Optional[str] = Query(None, description="Column to sort by, '-' prefix for descending"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1),
+    cursor: Optional[str] = None
+):
+    """Filter, sort, project and page through the latest snapshot"""
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    try:
+        return snapshot_index.query(where or (), sort, field_list, limit, cursor)
+    except QueryError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except LookupError as e:
+        return JSONResponse({"error": str(e)}, status_code=503)
+
+SQL_FORMATS = {
+    "csv": ("text/csv", "iter_csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "iter_arrow"),
+}
+
+@app.api_route("/sql", methods=["GET", "POST"])
+async def run_sql(
+    request: Request,
+    q: Optional[str] = Query(None, description="A single SELECT over the snapshots/prices views"),
+    format: str = Query("csv", pattern="^(csv|arrow|json)$"),
+    limit: int = Query(SQL_MAX_ROWS, ge=1, le=SQL_MAX_ROWS),
+    explain: bool = Query(False, description="Return the query plan instead of rows"),
+    analyze: bool = Query(False, description="With explain, run the query and include operator timings")
+):
+    """
+    Read-only SQL over the snapshot history. The query comes from q or the
+    POST body; results stream as CSV or Arrow IPC, or return as JSON.
+    """
+    if q is None and request.method == "POST":
+        q = (await request.body()).decode("utf-8")
+    if not q or not q.strip():
+        return JSONResponse({"error": "No query given"}, status_code=400)
+    try:
+        sql_query = await runtime.run("sql", SQLQuery, history_store.root, q, limit)
+        if explain or analyze:
+            return await runtime.run("sql", sql_query.explain, analyze)
+        if format == "json":
+            return await runtime.run("sql", sql_query.fetch_json)
+        await runtime.run("sql", sql_query.open)
+    except SQLBusy as e:
+        return JSONResponse({"error": str(e)}, status_code=429)
+    except SQLError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    media_type, method = SQL_FORMATS[format]
+    return StreamingResponse(
+        getattr(sql_query, method)(),
+        media_type=media_type,
+        headers={"X-Row-Limit": str(limit), "X-Query-Timeout": f"{sql_query.timeout:g}"},
     )
 
+@app.get("/indicators")
+async def get_indicators(company: Optional[List[str]] = Query(None, description="Company names (repeatable)")):
+    """Current SMA, VWAP, RSI and volatility of the last price per company"""
+    frame = indicator_state.values(company)
+    return {
+        **indicator_state.info(),
+        "companies": frame.astype(object).where(frame.notna(), None).to_dict("records"),
+    }
+
+def _parse_since(since):
+    """'today' or an ISO timestamp"""
+    if since is None:
+        return None
+    if since == "today":
+        return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return datetime.fromisoformat(since)
+
+def _json_floats(values):
+    return [None if v != v else float(v) for v in values]
+
+@app.get("/recent")
+async def recent_market(
+    field: str = "last",
+    since: Optional[str] = Query(None, description="'today' or an ISO timestamp"),
+    last: Optional[int] = Query(None, ge=1),
+    sector: Optional[str] = None
+):
+    """One numeric field for every company over the snapshots held in memory"""
+    started = time.perf_counter()
+    try:
+        names, timestamps, values = snapshot_ring.market(field, _parse_since(since), last, sector)
+    except (QueryError, ValueError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return {
+        "field": field,
+        "timestamps": [str(ts) for ts in timestamps],
+        "companies": {name: _json_floats(row) for name, row in zip(names, values)},
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+@app.get("/recent/{company}")
+async def recent_company(
+    company: str,
+    fields: Optional[str] = Query(None, description="Comma-separated numeric fields (default: all)"),
+    since: Optional[str] = Query(None, description="'today' or an ISO timestamp"),
+    last: Optional[int] = Query(None, ge=1)
+):
+    """Intraday/recent time series of one company from the snapshots held in memory"""
+    started = time.perf_counter()
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    try:
+        series = snapshot_ring.company_series(company, field_list, _parse_since(since), last)
+    except KeyError:
+        return JSONResponse({"error": "Company not found"}, status_code=404)
+    except (QueryError, ValueError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    timestamps = series.pop("timestamps")
+    return {
+        "company": company,
+        "timestamps": [str(ts) for ts in timestamps],
+        "fields": {name: _json_floats(values) for name, values in series.items()},
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+def _history_lookup(key, start, end, compute):
+    # Imports by import_history.py rewrite past days, which no publish covers
+    if result_cache.sync(history_store.import_marker()):
+        logger.info("History was backfilled, result cache cleared")
+    return result_cache.get_or_compute(key, start, end, lambda: encode(compute()))
+
+async def _cached_history(kind, params, start, end, compute):
+    """Serve a /history result from the cache, computing it off the loop on a miss"""
+    key = normalize_key(kind, dict(params, start=start, end=end))
+    body, hit = await runtime.run("history_query", _history_lookup, key, start, end, compute)
+    return Response(body, media_type="application/json", headers={"X-Cache": "hit" if hit else "miss"})
+
+async def _stream_export(chunks, stop, label):
+    """Produce export chunks in the bulk_export stage; a disconnect cancels this and stops the generator"""
+    sent = 0
+    finished = False
+    try:
+        async with aclosing(runtime.iterate("bulk_export", chunks)) as produced:
+            async for chunk in produced:
+                if chunk:
+                    sent += len(chunk)
+                    yield chunk
+        finished = True
+    finally:
+        # A pool thread may still be inside the generator; it returns before the next day
+        stop.set()
+        if finished:
+            logger.info(f"Export {label} finished: {sent} bytes")
+        else:
+            logger.info(f"Export {label} cancelled after {sent} bytes")
+
+@app.get("/history/export")
+async def history_export(
+    format: str = Query("csv", description="csv, parquet or zip (per-day CSV files)"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns (default: all)"),
+    start: Optional[str] = Query(None, description="ISO date or time"),
+    end: Optional[str] = Query(None, description="ISO date (whole day) or time"),
+    days: Optional[int] = Query(None, ge=1, description="Last N days instead of start")
+):
+    """Stream the stored snapshots of a range, produced a day at a time as the client reads"""
+    if format not in EXPORT_FORMATS:
+        return JSONResponse({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, status_code=400)
+    try:
+        start_ts, end_ts = parse_range(start, end, days)
+        columns = [resolve_column(f.strip()) for f in fields.split(",") if f.strip()] if fields else None
+    except QueryError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    
+    stop = threading.Event()
+    chunks = export_chunks(history_store, format, start_ts, end_ts, columns, stop)
+    media_type, extension = EXPORT_FORMATS[format]
+    first = start_ts.strftime('%Y%m%d') if start_ts is not None else 'start'
+    last = end_ts.strftime('%Y%m%d') if end_ts is not None else 'latest'
+    filename = f"egx_history_{first}_{last}.{extension}"
+    return StreamingResponse(
+        _stream_export(chunks, stop, filename),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/history/sector-turnover")
+async def history_sector_turnover(
+    start: Optional[str] = Query(None, description="ISO date or time"),
+    end: Optional[str] = Query(None, description="ISO date (whole day) or time"),
+    days: Optional[int] = Query(None, ge=1, description="Last N days instead of start")
+):
+    """Traded value per sector and day over a range of the history"""
+    try:
+        start_ts, end_ts = parse_range(start, end, days)
+    except QueryError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return await _cached_history(
+        "sector_turnover", {}, start_ts, end_ts, lambda: sector_turnover(history_store, start_ts, end_ts)
+    )
+
+@app.get("/history/{company}")
+async def history_company(
+    company: str,
+    fields: Optional[str] = Query(None, description="Comma-separated numeric fields (default: last,volume)"),
+    start: Optional[str] = Query(None, description="ISO date or time"),
+    end: Optional[str] = Query(None, description="ISO date (whole day) or time"),
+    days: Optional[int] = Query(None, ge=1, description="Last N days instead of start")
+):
+    """Every stored snapshot of one company over a range of the history"""
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    try:
+        start_ts, end_ts = parse_range(start, end, days)
+        # Aliases and stored names of the same fields share a cache entry
+        columns = [resolve_column(f) for f in field_list or DEFAULT_FIELDS]
+    except QueryError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    try:
+        return await _cached_history(
+            "company", {"company": company, "fields": columns}, start_ts, end_ts,
+            lambda: company_history(history_store, company, field_list, start_ts, end_ts),
+        )
+    except QueryError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+@app.get("/runs")
+async def list_runs(limit: int = Query(50, ge=1, le=1000), status: Optional[str] = None, trigger: Optional[str] = None):
+    """Most recent runs from the journal, newest first"""
+    return {"runs": await runtime.run("journal", journal.recent_runs, limit, status, trigger)}
+
+@app.get("/runs/summary")
+async def runs_summary():
+    """Run counts, success rates and durations for the last 24 hours, 7 days and overall"""
+    return await runtime.run("journal", journal.summary)
+
+@app.get("/runs/{run_id}")
+async def get_run(run_id: int):
+    """One run with its phase timings and scraper stats"""
+    run = await runtime.run("journal", journal.get_run, run_id)
+    if run is None:
+        return JSONResponse({"error": "Run not found"}, status_code=404)
+    return run
+
+@app.get("/alerts")
+async def get_alerts(recent: int = Query(50, ge=0, le=200)):
+    """Loaded alert rules, the last evaluation, delivery counters and recent matches"""
+    return alert_engine.info(recent)
+
+@app.post("/alerts/reload")
+async def reload_alerts():
+    """Reload and recompile the alert rules file"""
+    try:
+        rules = await runtime.run("files", load_rules, ALERT_RULES_PATH)
+    except (OSError, ValueError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    await runtime.run("snapshot", alert_engine.set_rules, rules)
+    return {"rules": len(rules)}
+
+@app.get("/diagnostics/loop")
+async def loop_diagnostics(top: int = 10, reset: bool = False):
+    """Event-loop lag histogram and the stacks that blocked the loop the longest"""
+    info = loop_monitor.info(top)
+    if reset:
+        loop_monitor.reset()
+    return info
+
 @app.post("/trigger-scraping")
 async def trigger_scraping(background_tasks: BackgroundTasks):
     """Manually trigger scraping (for testing)"""
     if state.is_scraping:
-        return {"error": "Scraping already in progress"}, 409
+        return JSONResponse({"error": "Scraping already in progress"}, status_code=409)
+    if not is_leader():
+        return JSONResponse({"error": "Not the scraper leader", "leader": elector.info()['leader']}, status_code=409)
     
-    background_tasks.add_task(scheduled_scraping)
+    background_tasks.add_task(scheduled_scraping, "manual")
     return {"message": "Scraping triggered"}
 
 if __name__ == "__main__":
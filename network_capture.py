@@ -0,0 +1,332 @@
+"""
+Table extraction from the network layer.
+
+After the tab click the page fetches the prices table with an ASP.NET
+postback. That is either a partial update (UpdatePanel delta:
+"length|type|id|content|" records) or a full page. In the network
+extraction mode (EXTRACTION_MODE=network) the scraper follows the DevTools
+network events of the click. When a postback response has finished
+loading, its body is fetched with Network.getResponseBody and the table is
+parsed from it with the archive's HTML parser. The response itself signals
+completion, so there is no polling of the DOM and no fixed wait.
+
+If no response carrying a recognisable table arrives (unknown payload
+format, a browser without DevTools, or a timeout), the caller falls back
+to waiting for and reading the DOM.
+"""
+import asyncio
+import base64
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import archive
+from validation import bad_cells
+
+logger = logging.getLogger(__name__)
+
+# dom: wait for the rendered table and read it; network: parse the postback response
+EXTRACTION_MODE = os.getenv('EXTRACTION_MODE', 'dom').lower()
+
+# Seconds between reads of the performance log while waiting
+POLL_INTERVAL = 0.05
+
+# Resource types that can carry the table after a click
+PAYLOAD_TYPES = {'XHR', 'Fetch', 'Document'}
+
+
+@dataclass
+class CapturedTable:
+    rows: List[list]
+    table_html: str
+    header_text: Optional[str]
+    format: str          # 'delta' or 'html'
+    url: str
+    bytes: int
+    wait_ms: float
+
+    def report(self):
+        return {
+            'mode': 'network',
+            'format': self.format,
+            'url': self.url,
+            'bytes': self.bytes,
+            'wait_ms': self.wait_ms,
+            'rows': len(self.rows),
+        }
+
+
+def network_extraction_enabled():
+    return EXTRACTION_MODE == 'network'
+
+
+def parse_delta(body):
+    """
+    Records of an UpdatePanel delta response as (type, id, content), or None
+    if the body is not in that format
+    """
+    records = []
+    i = 0
+    while i < len(body):
+        bar = body.find('|', i)
+        if bar < 0 or not body[i:bar].isdigit():
+            return None
+        type_end = body.find('|', bar + 1)
+        id_end = body.find('|', type_end + 1) if type_end >= 0 else -1
+        if id_end < 0:
+            return None
+        start = id_end + 1
+        end = start + int(body[i:bar])
+        if body[end:end + 1] != '|':
+            return None
+        records.append((body[bar + 1:type_end], body[type_end + 1:id_end], body[start:end]))
+        i = end + 1
+    return records or None
+
+
+def _score(rows, columns):
+    """Rows that pass validation"""
+    return sum(1 for cells in rows if bad_cells(cells, columns) == [])
+
+
+def _header_path(target):
+    """Header XPath relative to the table, when the header sits inside it"""
+    prefix = target.table_xpath.rstrip('/') + '/'
+    if target.header_xpath and target.header_xpath.startswith(prefix):
+        return target.header_xpath[len(prefix):]
+    return None
+
+
+def extract_table(body, target):
+    """
+    Find the target's table in a response body. Returns (format, rows,
+    table_html, header_text), or None if no table with valid rows is found.
+    """
+    records = parse_delta(body)
+    if records is not None:
+        documents = [content for kind, _, content in records if kind == 'updatePanel']
+        payload_format = 'delta'
+    elif '<table' in body.lower():
+        documents = [body]
+        payload_format = 'html'
+    else:
+        return None
+
+    best = None
+    for document in documents:
+        root = archive.parse_html(document)
+        # The XPath only matches a full page; other tables (and fragments) are searched by content
+        located = archive.select_path(root, target.table_xpath)
+        candidates = archive.find_all(root, 'table')
+        if located is not None and located.tag == 'table':
+            candidates.sort(key=lambda table: table is not located)
+        for table in candidates:
+            rows = archive.table_rows(table, target)
+            score = _score(rows, target.columns)
+            if score and (best is None or score > best[0]):
+                best = (score, table, rows)
+    if best is None:
+        return None
+
+    _, table, rows = best
+    header_text = None
+    relative = _header_path(target)
+    if relative:
+        node = archive.select_path(table, relative)
+        header_text = node.text() if node is not None else None
+    return payload_format, rows, _outer_html(table), header_text
+
+
+def _outer_html(node):
+    from html import escape
+
+    if isinstance(node, str):
+        return escape(node, quote=False)
+    attrs = ''.join(f' {k}' if v is None else f' {k}="{escape(v)}"' for k, v in node.attrs.items())
+    if node.tag in archive.VOID_ELEMENTS:
+        return f'<{node.tag}{attrs}>'
+    return f"<{node.tag}{attrs}>{''.join(_outer_html(c) for c in node.children)}</{node.tag}>"
+
+
+def _decode(result):
+    body = result.get('body', '')
+    if result.get('base64Encoded'):
+        body = base64.b64decode(body).decode('utf-8', errors='replace')
+    return body
+
+
+class _Tracker:
+    """Follows the requests started after a click until one carries the table"""
+
+    def __init__(self, target):
+        self.target = target
+        self.requests = {}   # request id -> (url, type)
+        self.unrecognised = []
+
+    def started(self, params):
+        request = params.get('request', {})
+        kind = params.get('type')
+        # A full postback is a POST document; partial updates are XHR/fetch
+        if kind in PAYLOAD_TYPES and (kind != 'Document' or request.get('method') == 'POST'):
+            self.requests[params['requestId']] = (request.get('url'), kind)
+
+    def finished_payload(self, params):
+        """The request if it is one of ours, else None"""
+        return self.requests.pop(params.get('requestId'), None)
+
+    def failed(self, params):
+        self.requests.pop(params.get('requestId'), None)
+
+    def parse(self, body, url, started):
+        found = extract_table(body, self.target)
+        if found is None:
+            self.unrecognised.append(url)
+            logger.info(f"[{self.target.name}] Response from {url} has no recognisable table")
+            return None
+        payload_format, rows, table_html, header_text = found
+        captured = CapturedTable(
+            rows, table_html, header_text, payload_format, url, len(body.encode('utf-8')),
+            round((time.perf_counter() - started) * 1000, 1),
+        )
+        logger.info(
+            f"[{self.target.name}] Table captured from the network ({payload_format}, {len(rows)} rows, "
+            f"{captured.bytes} bytes) {captured.wait_ms:.0f} ms after the click"
+        )
+        return captured
+
+    def settled(self):
+        """Every payload seen so far was unrecognised and nothing else is in flight"""
+        return bool(self.unrecognised) and not self.requests
+
+
+class NetworkCapture:
+    """
+    Selenium side: reads the Chrome performance log (shared with the run's
+    NetworkAccounting, so request accounting is unchanged).
+    """
+
+    def __init__(self, target, network):
+        self.target = target
+        self.network = network
+        self.result = None
+        self.fallback_reason = None
+        self._tracker = None
+        self._started = None
+
+    def arm(self, driver):
+        """Call right before the click: drops events of earlier requests"""
+        self.network.collect(driver)
+        self.result = self.fallback_reason = None
+        self._tracker = _Tracker(self.target)
+        self._started = time.perf_counter()
+
+    def wait(self, driver, timeout):
+        """Wait for the table's response. Returns a CapturedTable or None (fall back to the DOM)."""
+        if not hasattr(driver, 'execute_cdp_cmd'):
+            self.fallback_reason = 'browser has no DevTools access'
+            return None
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for event in self.network.collect(driver):
+                method = event.get('method')
+                params = event.get('params', {})
+                if method == 'Network.requestWillBeSent':
+                    self._tracker.started(params)
+                elif method == 'Network.loadingFailed':
+                    self._tracker.failed(params)
+                elif method == 'Network.loadingFinished':
+                    request = self._tracker.finished_payload(params)
+                    if request is None:
+                        continue
+                    try:
+                        result = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': params['requestId']})
+                    except Exception as e:
+                        logger.info(f"[{self.target.name}] Response body unavailable: {str(e).splitlines()[0]}")
+                        continue
+                    self.result = self._tracker.parse(_decode(result), request[0], self._started)
+                    if self.result:
+                        return self.result
+            if self._tracker.settled():
+                self.fallback_reason = 'unrecognised payload'
+                return None
+            time.sleep(POLL_INTERVAL)
+        self.fallback_reason = 'no table response before timeout'
+        return None
+
+    def report(self):
+        if self.result:
+            return self.result.report()
+        return {'mode': 'dom', 'fallback_reason': self.fallback_reason}
+
+
+class AsyncNetworkCapture:
+    """Async engine side: the same tracking, driven by CDP events on the page's session"""
+
+    def __init__(self, page, target):
+        self.page = page
+        self.target = target
+        self.result = None
+        self.fallback_reason = None
+        self._tracker = None
+        self._finished = None
+        self._started = None
+        self._handlers = (
+            ('Network.requestWillBeSent', self._on_request),
+            ('Network.loadingFailed', self._on_failed),
+            ('Network.loadingFinished', self._on_finished),
+        )
+
+    def _on_request(self, params):
+        self._tracker.started(params)
+
+    def _on_failed(self, params):
+        self._tracker.failed(params)
+        self._finished.put_nowait(None)
+
+    def _on_finished(self, params):
+        self._finished.put_nowait(params)
+
+    def arm(self):
+        """Call right before the click"""
+        self.result = self.fallback_reason = None
+        self._tracker = _Tracker(self.target)
+        self._finished = asyncio.Queue()
+        for method, handler in self._handlers:
+            self.page.conn.on(method, handler, session_id=self.page.session_id)
+        self._started = time.perf_counter()
+
+    def disarm(self):
+        for method, handler in self._handlers:
+            self.page.conn.off(method, handler, session_id=self.page.session_id)
+
+    async def wait(self, timeout):
+        """Wait for the table's response. Returns a CapturedTable or None (fall back to the DOM)."""
+        try:
+            async with asyncio.timeout(timeout):
+                while True:
+                    params = await self._finished.get()
+                    request = self._tracker.finished_payload(params) if params else None
+                    if request is not None:
+                        try:
+                            result = await self.page.send('Network.getResponseBody', {'requestId': params['requestId']})
+                        except Exception as e:
+                            logger.info(f"[{self.target.name}] Response body unavailable: {e}")
+                            continue
+                        self.result = self._tracker.parse(_decode(result), request[0], self._started)
+                        if self.result:
+                            return self.result
+                    if self._tracker.settled():
+                        self.fallback_reason = 'unrecognised payload'
+                        return None
+        except TimeoutError:
+            self.fallback_reason = 'no table response before timeout'
+            return None
+        finally:
+            self.disarm()
+
+    def report(self):
+        if self.result:
+            return self.result.report()
+        return {'mode': 'dom', 'fallback_reason': self.fallback_reason}
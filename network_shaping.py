@@ -0,0 +1,215 @@
+"""
+Request blocking and network accounting for the Chromium scraping session.
+
+The EGX prices page pulls in images, fonts, stylesheets, analytics and
+third-party widgets that the prices table does not need. These are dropped
+through the Chrome DevTools Protocol (Network.setBlockedURLs) and every run
+reports how many requests and bytes that saved.
+"""
+import fnmatch
+import json
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# URL patterns blocked by default ('*' is the only wildcard Chrome supports)
+DEFAULT_BLOCKED_URLS = [
+    # Images
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.ico', '*.webp', '*.bmp',
+    # Fonts
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    # Stylesheets
+    '*.css',
+    # Media
+    '*.mp4', '*.webm', '*.mp3',
+    # Analytics and third-party widgets
+    '*google-analytics.com*',
+    '*googletagmanager.com*',
+    '*doubleclick.net*',
+    '*facebook.net*',
+    '*facebook.com/plugins*',
+    '*platform.twitter.com*',
+    '*youtube.com*',
+    '*addthis.com*',
+    '*sharethis.com*',
+    '*hotjar.com*',
+    '*fonts.googleapis.com*',
+    '*fonts.gstatic.com*',
+]
+
+# Baseline of an unblocked run, used to compute the bytes saved
+NETWORK_BASELINE_PATH = Path("data") / "network_baseline.json"
+
+
+def _split_patterns(value):
+    return [p.strip() for p in value.split(',') if p.strip()] if value else []
+
+
+def resource_blocking_enabled():
+    """Resource blocking is on unless BLOCK_RESOURCES is set to false"""
+    return os.getenv('BLOCK_RESOURCES', 'true').lower() not in ('0', 'false', 'no')
+
+
+def get_blocked_urls():
+    """
+    Effective block list: defaults plus BLOCKED_URLS, minus anything allowed.
+
+    BLOCKED_URLS and ALLOWED_URLS are comma separated URL patterns. An allowed
+    pattern drops every block pattern equal to it or matching it, so a single
+    URL can be let through without editing the defaults.
+    """
+    blocked = DEFAULT_BLOCKED_URLS + _split_patterns(os.getenv('BLOCKED_URLS'))
+    allowed = _split_patterns(os.getenv('ALLOWED_URLS'))
+
+    effective = []
+    for pattern in blocked:
+        if any(pattern == a or fnmatch.fnmatch(a, pattern) for a in allowed):
+            continue
+        if pattern not in effective:
+            effective.append(pattern)
+    return effective
+
+
+def apply_resource_blocking(driver):
+    """
+    Install the URL block list on a Chromium driver via CDP.
+    Returns the list of patterns applied (empty when disabled or unsupported).
+    """
+    if not resource_blocking_enabled():
+        logger.info("Resource blocking disabled (baseline run)")
+        return []
+
+    if not hasattr(driver, 'execute_cdp_cmd'):
+        logger.warning("Driver does not support CDP, resource blocking skipped")
+        return []
+
+    patterns = get_blocked_urls()
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+    logger.info(f"Resource blocking enabled ({len(patterns)} URL patterns)")
+    return patterns
+
+
+def get_browser_rss_mb(driver):
+    """Resident memory of the browser process tree in MB, or None if unknown"""
+    try:
+        import psutil
+        root = psutil.Process(driver.service.process.pid)
+        processes = [root] + root.children(recursive=True)
+        total = 0
+        for proc in processes:
+            try:
+                total += proc.memory_info().rss
+            except psutil.Error:
+                pass
+        return round(total / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+
+def get_page_load_ms(driver):
+    """Navigation duration of the current document as reported by the browser"""
+    try:
+        value = driver.execute_script("""
+            const nav = performance.getEntriesByType('navigation')[0];
+            return nav ? nav.duration : null;
+        """)
+        return round(value, 1) if value is not None else None
+    except Exception:
+        return None
+
+
+class NetworkAccounting:
+    """
+    Accumulates request counts and transferred bytes from the Chrome
+    performance log. Each call to collect() drains the log, so it can be
+    called at any point of the run without double counting.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.blocked = 0
+        self.failed = 0
+        self.bytes_transferred = 0
+
+    def collect(self, driver):
+        try:
+            entries = driver.get_log('performance')
+        except Exception:
+            return []
+
+        events = []
+        for entry in entries:
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            events.append(message)
+
+            method = message.get('method')
+            params = message.get('params', {})
+            if method == 'Network.requestWillBeSent':
+                self.requests += 1
+            elif method == 'Network.loadingFinished':
+                self.bytes_transferred += int(params.get('encodedDataLength', 0))
+            elif method == 'Network.loadingFailed':
+                if params.get('blockedReason'):
+                    self.blocked += 1
+                else:
+                    self.failed += 1
+        return events
+
+    def summary(self, blocking_enabled=True, page_load_ms=None, browser_rss_mb=None):
+        """
+        Per-run report. Savings are measured against the last unblocked run
+        (BLOCK_RESOURCES=false), which refreshes the stored baseline.
+        """
+        report = {
+            'requests': self.requests,
+            'requests_blocked': self.blocked,
+            'requests_failed': self.failed,
+            'requests_saved': None,
+            'bytes_transferred': self.bytes_transferred,
+            'bytes_saved': None,
+            'page_load_ms': page_load_ms,
+            'page_load_saved_ms': None,
+            'browser_rss_mb': browser_rss_mb,
+            'browser_rss_saved_mb': None,
+        }
+
+        if not blocking_enabled:
+            _save_baseline(report)
+            return report
+
+        baseline = _load_baseline()
+        if baseline:
+            if baseline.get('requests') is not None:
+                report['requests_saved'] = baseline['requests'] - self.requests
+            report['bytes_saved'] = baseline['bytes_transferred'] - self.bytes_transferred
+            if page_load_ms is not None and baseline.get('page_load_ms') is not None:
+                report['page_load_saved_ms'] = round(baseline['page_load_ms'] - page_load_ms, 1)
+            if browser_rss_mb is not None and baseline.get('browser_rss_mb') is not None:
+                report['browser_rss_saved_mb'] = round(baseline['browser_rss_mb'] - browser_rss_mb, 1)
+        return report
+
+
+def _load_baseline():
+    try:
+        return json.loads(NETWORK_BASELINE_PATH.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _save_baseline(report):
+    try:
+        NETWORK_BASELINE_PATH.parent.mkdir(exist_ok=True)
+        NETWORK_BASELINE_PATH.write_text(json.dumps({
+            'requests': report['requests'],
+            'bytes_transferred': report['bytes_transferred'],
+            'page_load_ms': report['page_load_ms'],
+            'browser_rss_mb': report['browser_rss_mb'],
+        }))
+    except OSError as e:
+        logger.warning(f"Could not save network baseline: {e}")
@@ -0,0 +1,266 @@
+"""
+Query engine over the latest snapshot.
+
+The latest snapshot is held as a typed frame (see history.normalize_snapshot)
+and indexed once when it is published: every numeric column gets a sorted
+order with its sorted values, and sectors get a position index. Filters then
+become binary searches and index lookups that produce boolean masks, sorting
+reuses the precomputed orders, and identical queries are memoized until the
+next snapshot replaces the index.
+"""
+import base64
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from history import NUMERIC_COLUMNS, normalize_snapshot
+from targets import COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# English names accepted for the scraped columns
+COLUMN_ALIASES = dict(zip(
+    [
+        'name', 'sector', 'prev_close', 'open', 'close', 'change_pct', 'last',
+        'high', 'low', 'value', 'volume', 'trades', 'market_cap',
+    ],
+    COLUMNS,
+))
+
+OPERATORS = {'eq', 'ne', 'gt', 'ge', 'lt', 'le', 'in', 'contains'}
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+# Memoized results kept per snapshot
+MEMO_SIZE = 256
+
+
+class QueryError(ValueError):
+    """The query is malformed or refers to unknown columns"""
+
+
+def resolve_column(name):
+    """Arabic column name or English alias -> Arabic column name"""
+    if name in COLUMN_ALIASES:
+        return COLUMN_ALIASES[name]
+    if name in COLUMNS:
+        return name
+    raise QueryError(f"Unknown column: {name}")
+
+
+def parse_filter(expression):
+    """
+    'change_pct:gt:3' -> (column, 'gt', value). Values of numeric columns
+    are parsed as floats; 'in' takes a '|' separated list.
+    """
+    parts = expression.split(':', 2)
+    if len(parts) != 3:
+        raise QueryError(f"Filter must look like column:op:value, got {expression!r}")
+    column, op, raw = parts
+    column = resolve_column(column.strip())
+    op = op.strip().lower()
+    if op not in OPERATORS:
+        raise QueryError(f"Unknown operator {op!r} (use one of {', '.join(sorted(OPERATORS))})")
+
+    values = raw.split('|') if op == 'in' else [raw]
+    if column in NUMERIC_COLUMNS:
+        if op == 'contains':
+            raise QueryError("'contains' only applies to text columns")
+        try:
+            values = [float(v) for v in values]
+        except ValueError:
+            raise QueryError(f"Not a number in filter {expression!r}")
+    else:
+        values = [v.strip() for v in values]
+        if op in ('gt', 'ge', 'lt', 'le'):
+            raise QueryError(f"{op!r} only applies to numeric columns")
+    return column, op, tuple(values) if op == 'in' else values[0]
+
+
+def encode_cursor(snapshot_id, offset):
+    raw = json.dumps({'s': snapshot_id, 'o': offset}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        return data['s'], int(data['o'])
+    except (ValueError, KeyError, TypeError):
+        raise QueryError("Invalid cursor")
+
+
+class _IndexedSnapshot:
+    """One snapshot and its indexes; never modified once built"""
+
+    def __init__(self, frame):
+        self.frame = frame.reset_index(drop=True)
+        self.snapshot_id = self.frame['snapshot_id'].iat[0] if len(self.frame) else None
+        self.sorted = {}
+        for column in NUMERIC_COLUMNS:
+            values = self.frame[column].to_numpy(dtype='float64')
+            # NaN sorts last, so the valid part is a prefix
+            order = np.argsort(values, kind='stable')
+            valid = int(np.count_nonzero(~np.isnan(values)))
+            self.sorted[column] = (values, order, values[order[:valid]], valid)
+        self.sectors = self.frame.groupby(COLUMNS[1], sort=False).indices
+        self.memo = OrderedDict()
+
+    def numeric_mask(self, column, op, value):
+        _, order, sorted_values, valid = self.sorted[column]
+        mask = np.zeros(len(self.frame), dtype=bool)
+        if op in ('eq', 'ne', 'in'):
+            for v in (value if op == 'in' else (value,)):
+                lo = np.searchsorted(sorted_values, v, side='left')
+                hi = np.searchsorted(sorted_values, v, side='right')
+                mask[order[lo:hi]] = True
+            return ~mask if op == 'ne' else mask
+        if op == 'gt':
+            positions = order[np.searchsorted(sorted_values, value, side='right'):valid]
+        elif op == 'ge':
+            positions = order[np.searchsorted(sorted_values, value, side='left'):valid]
+        elif op == 'lt':
+            positions = order[:np.searchsorted(sorted_values, value, side='left')]
+        else:
+            positions = order[:np.searchsorted(sorted_values, value, side='right')]
+        mask[positions] = True
+        return mask
+
+    def text_mask(self, column, op, value):
+        if column == COLUMNS[1] and op in ('eq', 'ne', 'in'):
+            mask = np.zeros(len(self.frame), dtype=bool)
+            for v in (value if op == 'in' else (value,)):
+                positions = self.sectors.get(v)
+                if positions is not None:
+                    mask[positions] = True
+            return ~mask if op == 'ne' else mask
+
+        series = self.frame[column]
+        if op == 'contains':
+            return series.str.contains(value, case=False, regex=False).to_numpy()
+        if op == 'in':
+            return series.isin(value).to_numpy()
+        mask = (series == value).to_numpy()
+        return ~mask if op == 'ne' else mask
+
+    def ordered_positions(self, mask, sort):
+        """Row positions passing the mask, in the requested order"""
+        if sort is None:
+            return np.flatnonzero(mask)
+        column, descending = sort
+        if column in NUMERIC_COLUMNS:
+            values, order, _, valid = self.sorted[column]
+            if descending:
+                # Reverse the valid part, keeping ties in row order and NaN last
+                head = order[:valid]
+                head = head[np.lexsort((head, -values[head]))]
+                order = np.concatenate([head, order[valid:]])
+            return order[mask[order]]
+        positions = np.flatnonzero(mask)
+        codes, _ = pd.factorize(self.frame[column].to_numpy()[positions], sort=True)
+        return positions[np.argsort(-codes if descending else codes, kind='stable')]
+
+    def run(self, filters, sort, columns, limit, offset):
+        mask = np.ones(len(self.frame), dtype=bool)
+        for column, op, value in filters:
+            if column in NUMERIC_COLUMNS:
+                mask &= self.numeric_mask(column, op, value)
+            else:
+                mask &= self.text_mask(column, op, value)
+
+        positions = self.ordered_positions(mask, sort)
+        rows = self.frame.iloc[positions[offset:offset + limit]][list(columns)]
+        rows = rows.astype(object).where(rows.notna(), None)
+        more = offset + limit < len(positions)
+        return {
+            'snapshot_id': self.snapshot_id,
+            'total': int(len(positions)),
+            'offset': offset,
+            'rows': rows.to_dict(orient='records'),
+            'next_cursor': encode_cursor(self.snapshot_id, offset + limit) if more else None,
+        }
+
+
+class SnapshotIndex:
+    """Typed, indexed copy of the latest snapshot with a per-snapshot memo"""
+
+    def __init__(self):
+        self._current = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def snapshot_id(self):
+        return self._current.snapshot_id if self._current else None
+
+    def rebuild(self, frame):
+        """
+        Index a normalized snapshot and swap it in. Meant to run in a worker
+        thread; queries keep using the previous snapshot until the swap.
+        """
+        indexed = _IndexedSnapshot(frame)
+        self._current = indexed
+        logger.info(f"Query index rebuilt: {len(indexed.frame)} rows, {len(indexed.sectors)} sectors")
+
+    def rebuild_from_export(self, df, snapshot_ts):
+        """Index a raw (all text) export, e.g. the Excel file found at startup"""
+        self.rebuild(normalize_snapshot(df, snapshot_ts))
+
+    def query(self, filters=(), sort=None, fields=None, limit=DEFAULT_LIMIT, cursor=None):
+        """
+        Run a query against the current snapshot.
+
+        filters: 'column:op:value' expressions, combined with AND
+        sort: column name, '-' prefix for descending
+        fields: columns to return (default: all 13)
+        cursor: opaque next_cursor of a previous page
+        """
+        current = self._current
+        if current is None:
+            raise LookupError("No snapshot available yet")
+
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        parsed = tuple(sorted(parse_filter(f) for f in filters or ()))
+        sort_key = None
+        if sort:
+            sort_key = (resolve_column(sort.lstrip('-+')), sort.startswith('-'))
+        columns = tuple(resolve_column(f) for f in fields) if fields else tuple(COLUMNS)
+
+        offset = 0
+        if cursor:
+            cursor_snapshot, offset = decode_cursor(cursor)
+            if cursor_snapshot != current.snapshot_id:
+                raise QueryError("Cursor refers to an older snapshot; restart the query")
+
+        key = (parsed, sort_key, columns, limit, offset)
+        with self._lock:
+            result = current.memo.get(key)
+            if result is not None:
+                current.memo.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        result = current.run(parsed, sort_key, columns, limit, offset)
+        with self._lock:
+            current.memo[key] = result
+            while len(current.memo) > MEMO_SIZE:
+                current.memo.popitem(last=False)
+        return result
+
+    def info(self):
+        current = self._current
+        return {
+            'snapshot_id': current.snapshot_id if current else None,
+            'rows': len(current.frame) if current else 0,
+            'memo_entries': len(current.memo) if current else 0,
+            'memo_hits': self.hits,
+            'memo_misses': self.misses,
+        }
@@ -0,0 +1,177 @@
+"""
+Result cache for queries over the snapshot history.
+
+Results are cached as their encoded response bodies. The key is the
+normalized query (kind plus sorted, canonical parameters) and the data
+version it was computed from. Memory is bounded by the total size of the
+bodies (RESULT_CACHE_BYTES), and the least recently used entries are
+evicted first.
+
+Invalidation follows the time range of the query:
+
+- closed ranges end before the newest snapshot, so new snapshots cannot
+  change them and they are cached without a version (never invalidated);
+- open ranges (no end, or an end at or after the newest snapshot) are keyed
+  by the current data version. When a snapshot is published the version
+  is bumped, every open entry whose range contains the new snapshot is
+  dropped, and the other open entries move to the new version.
+
+Backfills change past days, closed ranges included. The cache is told
+the state of the store's import manifest (sync); when it changes, every
+entry is dropped.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+RESULT_CACHE_BYTES = int(os.getenv('RESULT_CACHE_BYTES', str(64 * 1024 * 1024)))
+
+
+def _canonical(value):
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted(_canonical(v) for v in value))
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def normalize_key(kind, params):
+    """Hashable, order-independent key; None parameters are dropped"""
+    return (kind, tuple(sorted((k, _canonical(v)) for k, v in params.items() if v is not None)))
+
+
+class ResultCache:
+    def __init__(self, max_bytes=RESULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.version = 0
+        self.newest = None          # timestamp of the newest snapshot
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rejected = 0
+        self.generation = 0         # bumped when every entry is dropped
+        self._marker = None
+        self._entries = OrderedDict()    # (query key, version) -> (body, start, end)
+        self._lock = threading.Lock()
+
+    def is_open(self, end):
+        """Whether a range ending at end can still gain snapshots"""
+        return end is None or self.newest is None or pd.Timestamp(end) >= self.newest
+
+    def version_for(self, end):
+        """Data version a range depends on (None for closed ranges)"""
+        return self.version if self.is_open(end) else None
+
+    def get(self, key, end):
+        with self._lock:
+            full_key = (key, self.version_for(end))
+            entry = self._entries.get(full_key)
+            if entry is None:
+                self.misses += 1
+                return None, full_key[1]
+            self._entries.move_to_end(full_key)
+            self.hits += 1
+            return entry[0], full_key[1]
+
+    def put(self, key, version, body, start, end, generation=None):
+        """Store a body computed at version; results of a superseded version are dropped"""
+        size = len(body)
+        with self._lock:
+            if version is not None and version != self.version:
+                return False
+            if generation is not None and generation != self.generation:
+                return False
+            if size > self.max_bytes:
+                self.rejected += 1
+                return False
+            full_key = (key, version)
+            old = self._entries.pop(full_key, None)
+            if old is not None:
+                self.bytes -= len(old[0])
+            self._entries[full_key] = (body, start, end)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+            return True
+
+    def get_or_compute(self, key, start, end, compute):
+        """Cached body of a query, else compute() -> bytes and cache it. Returns (body, hit)."""
+        generation = self.generation
+        body, version = self.get(key, end)
+        if body is not None:
+            return body, True
+        body = compute()
+        self.put(key, version, body, start, end, generation)
+        return body, False
+
+    def sync(self, marker):
+        """
+        Drop every entry when the store's import marker changed since the
+        last call (history was backfilled). Returns the number dropped.
+        """
+        with self._lock:
+            if marker == self._marker:
+                return 0
+            self._marker = marker
+            dropped = len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+            self.generation += 1
+            self.invalidations += dropped
+            return dropped
+
+    def publish(self, snapshot_ts):
+        """
+        A snapshot was added: bump the version, drop open entries whose range
+        contains it and carry the other open entries over to the new version
+        """
+        snapshot_ts = pd.Timestamp(snapshot_ts)
+        with self._lock:
+            self.version += 1
+            if self.newest is None or snapshot_ts > self.newest:
+                self.newest = snapshot_ts
+            entries = OrderedDict()
+            stale = 0
+            for (key, version), (body, start, end) in self._entries.items():
+                if version is not None:
+                    starts_before = start is None or pd.Timestamp(start) <= snapshot_ts
+                    if starts_before and (end is None or pd.Timestamp(end) >= snapshot_ts):
+                        self.bytes -= len(body)
+                        stale += 1
+                        continue
+                    version = self.version_for(end)
+                entries[(key, version)] = (body, start, end)
+            self._entries = entries
+            self.invalidations += stale
+            return stale
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self.generation += 1
+
+    def info(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'version': self.version,
+                'newest_snapshot': self.newest.isoformat() if self.newest is not None else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'rejected': self.rejected,
+            }
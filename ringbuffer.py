@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+In-memory ring buffer of recent snapshots.
+
+The last RING_SNAPSHOTS snapshots are kept in one preallocated NumPy
+structured array of shape (companies, snapshots). Each record holds the 11
+numeric fields, so one company's history is a contiguous row and one
+snapshot is a column. Companies map to fixed row numbers, and snapshot
+slots are reused round-robin. An append writes one column per field and
+creates no per-row Python objects. Reading a company's series or a field
+for the whole market is a slice plus a reorder of the slots, with no file
+I/O.
+
+Usage:
+    python ringbuffer.py bench [--rows 220] [--snapshots 168]
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from history import NUMERIC_COLUMNS
+from query import COLUMN_ALIASES, QueryError
+
+logger = logging.getLogger(__name__)
+
+# A trading week (5 days) of hourly runs around the clock, with margin
+RING_SNAPSHOTS = int(os.getenv('RING_SNAPSHOTS', '168'))
+RING_MAX_COMPANIES = int(os.getenv('RING_MAX_COMPANIES', '512'))
+
+NAME = COLUMN_ALIASES['name']
+SECTOR = COLUMN_ALIASES['sector']
+
+# English alias -> stored column, for the numeric fields
+FIELDS = {alias: column for alias, column in COLUMN_ALIASES.items() if column in NUMERIC_COLUMNS}
+
+# Prices and ratios fit in float32; traded value, volume and market cap need float64
+WIDE_FIELDS = {'value', 'volume', 'market_cap'}
+RECORD_DTYPE = np.dtype([(alias, 'f8' if alias in WIDE_FIELDS else 'f4') for alias in FIELDS])
+
+
+def resolve_field(name):
+    """English alias or Arabic column name -> field name"""
+    if name in FIELDS:
+        return name
+    for alias, column in FIELDS.items():
+        if column == name:
+            return alias
+    raise QueryError(f"Unknown numeric field: {name}")
+
+
+class SnapshotRing:
+    """Fixed-capacity buffer of the most recent snapshots, companies x time"""
+
+    def __init__(self, snapshots=RING_SNAPSHOTS, max_companies=RING_MAX_COMPANIES):
+        self.capacity = snapshots
+        self.max_companies = max_companies
+        self.data = np.full((max_companies, snapshots), np.nan, dtype=RECORD_DTYPE)
+        self.timestamps = np.full(snapshots, np.datetime64('NaT'), dtype='datetime64[s]')
+        self.sector_codes = np.full(max_companies, -1, dtype=np.int16)
+        self.names = []
+        self.sectors = []
+        self._name_index = pd.Index([], dtype=object)
+        self._sector_index = {}
+        self.head = 0      # next slot to write
+        self.count = 0     # filled slots
+        self.dropped_companies = 0
+        self._lock = threading.Lock()
+
+    # Writes
+
+    def _rows_for(self, names):
+        """Row numbers of the companies, registering new ones (-1 when full)"""
+        rows = self._name_index.get_indexer(names)
+        new = rows < 0
+        if new.any():
+            unseen = list(dict.fromkeys(names[new]))
+            room = self.max_companies - len(self.names)
+            self.names.extend(unseen[:room])
+            self._name_index = pd.Index(self.names, dtype=object)
+            rows = self._name_index.get_indexer(names)
+        self.dropped_companies = int((rows < 0).sum())
+        return rows
+
+    def append(self, frame):
+        """Write a normalized snapshot into the next slot, overwriting the oldest when full"""
+        frame = frame.drop_duplicates(NAME, keep='last')
+        names = frame[NAME].to_numpy(dtype=object)
+        with self._lock:
+            rows = self._rows_for(names)
+            kept = rows >= 0
+            rows = rows[kept]
+            slot = self.head
+            self.data[:, slot] = np.nan
+            for alias, column in FIELDS.items():
+                self.data[alias][rows, slot] = frame[column].to_numpy(dtype=np.float64)[kept]
+            unseen = self.sector_codes[rows] < 0
+            for row, sector in zip(rows[unseen], frame[SECTOR].to_numpy()[kept][unseen]):
+                self.sector_codes[row] = self._sector_code(sector)
+            self.timestamps[slot] = np.datetime64(pd.Timestamp(frame['snapshot_ts'].iloc[0]), 's')
+            self.head = (slot + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def _sector_code(self, sector):
+        code = self._sector_index.get(sector)
+        if code is None:
+            code = self._sector_index[sector] = len(self.sectors)
+            self.sectors.append(sector)
+        return code
+
+    def load_recent(self, store):
+        """Fill the buffer with the latest snapshots of a history store"""
+        # Count snapshots per day from the timestamp column only, newest day first
+        total = 0
+        first_day = None
+        for day, _ in reversed(store.partitions()):
+            end = pd.Timestamp(day) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+            for _, frame in store.iter_days(start=day, end=end, columns=['snapshot_ts']):
+                total += frame['snapshot_ts'].nunique()
+            first_day = day
+            if total >= self.capacity:
+                break
+        if first_day is None:
+            return 0
+        frames = []
+        for _, frame in store.iter_days(start=first_day):
+            frames.extend(group for _, group in frame.groupby('snapshot_ts', sort=True))
+        for frame in frames[-self.capacity:]:
+            self.append(frame)
+        return min(len(frames), self.capacity)
+
+    # Reads
+
+    def _order(self, since=None, last=None):
+        """Slots in time order (oldest first), optionally only since a time or the last n"""
+        slots = (self.head - self.count + np.arange(self.count)) % self.capacity
+        if since is not None:
+            slots = slots[self.timestamps[slots] >= np.datetime64(pd.Timestamp(since), 's')]
+        if last is not None:
+            slots = slots[-last:] if last > 0 else slots[:0]
+        return slots
+
+    def company_series(self, name, fields=None, since=None, last=None):
+        """Time series of one company: {'timestamps': [...], field: array}"""
+        fields = [resolve_field(f) for f in fields] if fields else list(FIELDS)
+        with self._lock:
+            row = self._name_index.get_indexer([name])[0]
+            if row < 0:
+                raise KeyError(name)
+            slots = self._order(since, last)
+            records = self.data[row, slots]
+            result = {'timestamps': self.timestamps[slots].copy()}
+            for field in fields:
+                result[field] = records[field].astype(np.float64)
+        return result
+
+    def market(self, field, since=None, last=None, sector=None):
+        """One field for every company: (names, timestamps, companies x time array)"""
+        field = resolve_field(field)
+        with self._lock:
+            slots = self._order(since, last)
+            n = len(self.names)
+            rows = np.arange(n)
+            if sector is not None:
+                code = self._sector_index.get(sector, -2)
+                rows = rows[self.sector_codes[:n] == code]
+            values = self.data[field][rows[:, None], slots[None, :]].astype(np.float64)
+            names = [self.names[i] for i in rows]
+            timestamps = self.timestamps[slots].copy()
+        return names, timestamps, values
+
+    def memory(self):
+        """Bytes held by the buffer, by part"""
+        names = sum(sys.getsizeof(n) for n in self.names) + sys.getsizeof(self.names)
+        parts = {
+            'records': self.data.nbytes,
+            'timestamps': self.timestamps.nbytes,
+            'sector_codes': self.sector_codes.nbytes,
+            'company_names': names,
+            'name_index': int(self._name_index.memory_usage(deep=True)),
+        }
+        parts['total'] = sum(parts.values())
+        return parts
+
+    def info(self):
+        with self._lock:
+            slots = self._order()
+            return {
+                'capacity': self.capacity,
+                'snapshots': self.count,
+                'companies': len(self.names),
+                'max_companies': self.max_companies,
+                'dropped_companies': self.dropped_companies,
+                'oldest': str(self.timestamps[slots[0]]) if len(slots) else None,
+                'newest': str(self.timestamps[slots[-1]]) if len(slots) else None,
+                'record_bytes': RECORD_DTYPE.itemsize,
+                'memory_bytes': self.memory(),
+            }
+
+
+def _synthetic_snapshots(rows, count, seed=0):
+    """Snapshots of the same companies with prices moving a little each hour"""
+    from fixtures import synthetic_prices
+    from history import normalize_snapshot
+
+    start = pd.Timestamp('2026-01-04 10:00')
+    base = normalize_snapshot(synthetic_prices(rows, seed), start.to_pydatetime())
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(count):
+        frame = base.copy()
+        ts = start + pd.Timedelta(hours=i)
+        frame['snapshot_ts'] = ts
+        frame['snapshot_id'] = ts.strftime('%Y%m%dT%H%M%S')
+        frame[NUMERIC_COLUMNS] = base[NUMERIC_COLUMNS].to_numpy() * rng.lognormal(0, 0.01, (rows, 1))
+        frames.append(frame)
+    return frames
+
+
+def bench(rows, snapshots, repeats=1000):
+    from fixtures import SECTORS
+
+    frames = _synthetic_snapshots(rows, snapshots * 2)
+    ring = SnapshotRing(snapshots)
+    started = time.perf_counter()
+    for frame in frames:
+        ring.append(frame)
+    append_ms = (time.perf_counter() - started) * 1000 / len(frames)
+
+    name = ring.names[0]
+    timings = {}
+    for label, call in (
+        ('company_series (all fields)', lambda: ring.company_series(name)),
+        ('company_series (last, 24)', lambda: ring.company_series(name, ['last'], last=24)),
+        ('market (last, all)', lambda: ring.market('last')),
+        ('market (volume, 24, sector)', lambda: ring.market('volume', last=24, sector=SECTORS[0])),
+    ):
+        started = time.perf_counter()
+        for _ in range(repeats):
+            call()
+        timings[label] = (time.perf_counter() - started) * 1000 / repeats
+
+    logger.info(f"Append: {append_ms:.3f} ms per snapshot ({rows} companies)")
+    for label, ms in timings.items():
+        logger.info(f"{label:<30} {ms * 1000:8.1f} us")
+    memory = ring.memory()
+    logger.info(
+        f"Memory: {memory['total'] / 1024 / 1024:.2f} MiB total, {memory['records'] / 1024 / 1024:.2f} MiB records "
+        f"({RECORD_DTYPE.itemsize} bytes x {ring.max_companies} companies x {ring.capacity} snapshots)"
+    )
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Snapshot ring buffer tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    benchmark = sub.add_parser('bench', help="Time appends and slices on synthetic snapshots")
+    benchmark.add_argument('--rows', type=int, default=220)
+    benchmark.add_argument('--snapshots', type=int, default=RING_SNAPSHOTS)
+    args = parser.parse_args(argv)
+    bench(args.rows, args.snapshots)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,379 @@
+"""
+Pipeline runtime: dedicated, bounded executors for blocking work.
+
+Blocking calls run on one of three thread pools, sized separately so one
+kind of work cannot take the threads of another:
+
+    browser  BROWSER_WORKERS  Selenium scrapes and scrape worker control
+    cpu      CPU_WORKERS      parsing, normalization, encoding, indexes, queries
+    io       IO_WORKERS       journal, history store, artifacts, shared storage, leases
+
+Each pool has a bounded queue (POOL_QUEUE_SIZE jobs on top of its
+workers). When a pool is full, further callers wait on the event loop
+until a slot frees up. That is backpressure: a slow stage makes its own
+callers wait, but it cannot pile up threads or memory. A slot is freed
+when the job's thread finishes, not when its caller stops waiting, so
+cancelled callers (e.g. a client disconnecting) cannot push a pool past
+its bound.
+
+Work is submitted through named stages (STAGES). A stage has a pool and
+a concurrency limit (override with STAGE_LIMITS=name=n,...), so a burst
+of bulk exports is limited to its own share of the CPU pool and history
+queries still get the rest. Stage.iterate hands the items of a blocking
+iterator, such as a streaming export, to the event loop through a bounded
+queue. The producer runs ahead of the consumer by at most that many items.
+When the consumer stops early, the iterator is closed on the pool once its
+in-flight item is done, so the files it holds are released.
+
+Queue depths, waiters, running jobs and time spent queued and busy are
+kept per pool and per stage (Runtime.info, shown under "runtime" in
+/status).
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+BROWSER_WORKERS = int(os.getenv('BROWSER_WORKERS', '2'))
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', str(min(4, os.cpu_count() or 1))))
+IO_WORKERS = int(os.getenv('IO_WORKERS', '8'))
+POOL_QUEUE_SIZE = int(os.getenv('POOL_QUEUE_SIZE', '32'))
+
+# Items a streaming stage produces ahead of its consumer
+STREAM_PREFETCH = int(os.getenv('STREAM_PREFETCH', '2'))
+
+# Stage -> (pool, concurrent jobs)
+STAGES = {
+    'scrape': ('browser', 2),           # the hourly run and the background pre-scrape
+    'export': ('cpu', 2),               # Excel exports of a run
+    'snapshot': ('cpu', 2),             # normalize, index, ring, alerts, indicators
+    'history': ('io', 2),               # history store appends and loads
+    'journal': ('io', 4),
+    'files': ('io', 4),                 # artifacts, file stats, shared storage, checkpoints
+    'history_query': ('cpu', 3),
+    'bulk_export': ('cpu', 2),
+    'sql': ('cpu', 2),
+}
+
+
+def parse_limits(text):
+    """STAGE_LIMITS value ("name=n,...") -> {name: n}"""
+    limits = {}
+    for item in (text or '').split(','):
+        name, _, value = item.partition('=')
+        if name.strip():
+            limits[name.strip()] = int(value)
+    return limits
+
+
+STAGE_LIMITS = parse_limits(os.getenv('STAGE_LIMITS', ''))
+
+
+class _LoopSemaphore:
+    """asyncio.Semaphore that is recreated if used from a new event loop"""
+
+    def __init__(self, value):
+        self.value = value
+        self._loop = None
+        self._semaphore = None
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.value)
+        return self._semaphore
+
+
+class Pool:
+    """A sized thread pool with a bounded queue in front of it"""
+
+    def __init__(self, name, workers, queue_size=POOL_QUEUE_SIZE):
+        self.name = name
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self._slots = _LoopSemaphore(self.workers + queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.queued = 0        # admitted, waiting for a thread
+        self.running = 0
+        self.waiting = 0       # waiting for admission (pool full)
+        self.max_queued = 0
+        self.max_waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.queue_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    def _get_executor(self):
+        # Threads are started on first use, so importing the app starts none
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix=f'{self.name}-pool')
+        return self._executor
+
+    async def _admit(self):
+        slots = self._slots.get()
+        if not slots.locked():
+            await slots.acquire()
+            return slots
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+        return slots
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on a pool thread; waits for a slot while the pool is full"""
+        return await self.submit(fn, args, kwargs)
+
+    async def submit(self, fn, args=(), kwargs=None, on_done=None):
+        """
+        Pool.run, calling on_done() on the loop once the job is over: when its
+        thread finishes, or at once if it never got to run.
+        """
+        try:
+            slots = await self._admit()
+        except BaseException:
+            if on_done is not None:
+                on_done()
+            raise
+        loop = asyncio.get_running_loop()
+        enqueued = time.perf_counter()
+        context = contextvars.copy_context()
+        if kwargs:
+            fn = functools.partial(fn, **kwargs)
+        job = {'started': False, 'cancelled': False}
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+        def call():
+            with self._lock:
+                if job['cancelled']:
+                    return None
+                job['started'] = True
+                started = time.perf_counter()
+                self.queued -= 1
+                self.running += 1
+                self.queue_seconds += started - enqueued
+            ok = False
+            try:
+                result = context.run(fn, *args)
+                ok = True
+                return result
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.busy_seconds += time.perf_counter() - started
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+
+        def release():
+            slots.release()
+            if on_done is not None:
+                on_done()
+
+        def finished(_):
+            try:
+                loop.call_soon_threadsafe(release)
+            except RuntimeError:
+                pass  # the loop is closed
+
+        try:
+            future = self._get_executor().submit(call)
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            release()
+            raise
+        # The slot stays taken until the thread is done, even if the caller is cancelled
+        future.add_done_callback(finished)
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            with self._lock:
+                # Cancelled before a thread picked it up: it will not run
+                if not job['started']:
+                    job['cancelled'] = True
+                    self.queued -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def info(self):
+        with self._lock:
+            done = self.completed + self.failed
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'running': self.running,
+                'queued': self.queued,
+                'waiting': self.waiting,
+                'max_queued': self.max_queued,
+                'max_waiting': self.max_waiting,
+                'completed': self.completed,
+                'failed': self.failed,
+                'avg_queue_ms': round(self.queue_seconds * 1000 / done, 2) if done else None,
+                'utilization_seconds': round(self.busy_seconds, 3),
+            }
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+_DONE = object()
+
+
+class Stage:
+    """A kind of work on a pool, with its own concurrency limit"""
+
+    def __init__(self, name, pool, limit):
+        self.name = name
+        self.pool = pool
+        self.limit = max(1, limit)
+        self._limit = _LoopSemaphore(self.limit)
+        self._buffers = set()
+        self.active = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.calls = 0
+        self.seconds = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the stage's pool, at most `limit` at a time"""
+        limit = self._limit.get()
+        if limit.locked():
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            try:
+                await limit.acquire()
+            finally:
+                self.waiting -= 1
+        else:
+            await limit.acquire()
+        started = time.perf_counter()
+        self.active += 1
+
+        def done():
+            # Like the pool slot, the stage slot is held until the job is over
+            self.active -= 1
+            self.calls += 1
+            self.seconds += time.perf_counter() - started
+            limit.release()
+
+        return await self.pool.submit(fn, args, kwargs, on_done=done)
+
+    async def iterate(self, iterator, prefetch=STREAM_PREFETCH):
+        """
+        Async iterator over a blocking iterator. Items are produced on the
+        pool, at most `prefetch` ahead of the consumer, through a bounded
+        queue; a slow consumer holds the producer without holding a thread.
+        """
+        buffer = asyncio.Queue(max(1, prefetch))
+        inflight = None
+
+        async def produce():
+            nonlocal inflight
+            try:
+                while True:
+                    # Shielded: cancelling the producer must not abandon a running next()
+                    inflight = asyncio.ensure_future(self.run(next, iterator, _DONE))
+                    item = await asyncio.shield(inflight)
+                    await buffer.put(item)
+                    if item is _DONE:
+                        return
+            except Exception as e:
+                await buffer.put(_Failure(e))
+
+        producer = asyncio.create_task(produce())
+        self._buffers.add(buffer)
+        try:
+            while True:
+                item = await buffer.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            producer.cancel()
+            self._buffers.discard(buffer)
+            await self._close(iterator, inflight)
+
+    async def _close(self, iterator, inflight):
+        """Close a blocking iterator on the pool once its in-flight next() is done"""
+        if inflight is not None:
+            await asyncio.wait([inflight])
+            if not inflight.cancelled():
+                inflight.exception()  # already reported to the consumer, if at all
+        close = getattr(iterator, 'close', None)
+        if close is None:
+            return
+        try:
+            await self.run(close)
+        except Exception as e:
+            logger.warning(f"Closing the {self.name} stream failed: {str(e)}")
+
+    def info(self):
+        return {
+            'pool': self.pool.name,
+            'limit': self.limit,
+            'active': self.active,
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting,
+            'streams': len(self._buffers),
+            'buffered': sum(buffer.qsize() for buffer in self._buffers),
+            'calls': self.calls,
+            'avg_ms': round(self.seconds * 1000 / self.calls, 2) if self.calls else None,
+        }
+
+
+class Runtime:
+    """The pools and stages of the app"""
+
+    def __init__(self, workers=None, stages=STAGES, limits=STAGE_LIMITS, queue_size=POOL_QUEUE_SIZE):
+        workers = workers or {'browser': BROWSER_WORKERS, 'cpu': CPU_WORKERS, 'io': IO_WORKERS}
+        self.pools = {name: Pool(name, count, queue_size) for name, count in workers.items()}
+        unknown = set(limits) - set(stages)
+        if unknown:
+            raise ValueError(f"Unknown stage(s) in STAGE_LIMITS: {', '.join(sorted(unknown))}")
+        self.stages = {
+            name: Stage(name, self.pools[pool], limits.get(name, limit))
+            for name, (pool, limit) in stages.items()
+        }
+
+    async def run(self, stage, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in a stage"""
+        return await self.stages[stage].run(fn, *args, **kwargs)
+
+    def runner(self, stage):
+        """run() bound to a stage, for code that takes a `run` callable for its blocking calls"""
+        return functools.partial(self.run, stage)
+
+    def iterate(self, stage, iterator, prefetch=STREAM_PREFETCH):
+        """Async iterator over a blocking iterator, produced in a stage"""
+        return self.stages[stage].iterate(iterator, prefetch)
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown()
+
+    def info(self):
+        return {
+            'pools': {name: pool.info() for name, pool in self.pools.items()},
+            'stages': {name: stage.info() for name, stage in self.stages.items()},
+        }
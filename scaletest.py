@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Scale test of the snapshot pipeline beyond the ~220 EGX listings.
+
+For each table size it renders a synthetic prices table (fixtures.py) and
+runs it through the stages a scrape goes through after the browser:
+
+    parse       table HTML -> rows (the archive/network capture parser; the
+                live DOM extraction, TABLE_ROWS_JS in the browser, is not
+                covered)
+    validate    row and cell checks (validation.find_issues)
+    dataframe   rows -> raw snapshot DataFrame (scraper.rows_to_dataframe)
+    normalize   raw snapshot -> history schema (history.normalize_snapshot)
+    excel       Excel export and its download variants (main.write_export)
+    history     append to a Parquet history store
+    index       /query index rebuild
+    ring        append to the in-memory snapshot ring
+    api_query   GET /query sorted over the whole snapshot
+    api_recent  GET /recent for the whole market
+
+Every stage is timed (median of --repeats runs) and its peak Python heap
+is measured with tracemalloc in a separate run. The growth exponent is
+the slope of time (and memory) against rows on a log-log scale: 1 is
+linear. A stage is reported as superlinear when its time grows faster
+than rows^1.2 between any two consecutive sizes, so a blow-up at the
+large end is not averaged away.
+
+The stages run with the production settings: the live target and its
+max_rows cap, and a ring of RING_MAX_COMPANIES companies. Past the cap the
+real pipeline keeps only the first max_rows companies, so every size also
+reports how many rows were truncated, how many companies the ring dropped
+and how many are missing from /recent. --uncapped lifts both caps to
+measure how the stages themselves scale.
+
+The API stages send requests to main.app in process, without a server.
+main keeps its data directory relative to the working directory, so the
+test runs in a temporary directory.
+
+Usage:
+    python scaletest.py [--rows 220,1000,2000,5000] [--repeats 5] [--uncapped] [--output scaletest.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = Path(__file__).resolve().parent
+
+DEFAULT_ROWS = "220,1000,2000,5000"
+
+# Growth exponent above which a stage is reported as superlinear
+SUPERLINEAR = 1.2
+
+# Snapshots in the ring behind /recent
+RING_SNAPSHOTS = 24
+
+
+def measure(call, repeats):
+    """(median seconds, peak traced bytes) of call()"""
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(times), peak
+
+
+def growth_exponent(rows, values):
+    """Slope of log(value) against log(rows)"""
+    rows = np.asarray(rows, dtype=float)
+    values = np.maximum(np.asarray(values, dtype=float), 1e-9)
+    if len(rows) < 2:
+        return None
+    return round(float(np.polyfit(np.log(rows), np.log(values), 1)[0]), 2)
+
+
+def step_exponents(rows, values):
+    """Growth exponent between each pair of consecutive sizes"""
+    return [growth_exponent(rows[i:i + 2], values[i:i + 2]) for i in range(len(rows) - 1)]
+
+
+def size_stages(main, rows, workdir, uncapped=False):
+    """
+    (stage name -> callable, close, coverage) for a table of `rows`
+    companies. coverage counts the rows the capped pipeline loses.
+    """
+    import httpx
+
+    import archive
+    from fixtures import prices_table_html, snapshot_stream
+    from history import HistoryStore, normalize_snapshot
+    from query import SnapshotIndex
+    from ringbuffer import SnapshotRing
+    from scraper import rows_to_dataframe
+    from targets import EGX_PRICES
+    from validation import find_issues
+
+    # The live target stops at 219 rows
+    target = replace(EGX_PRICES, max_rows=None) if uncapped else EGX_PRICES
+    stream = [(ts.to_pydatetime(), frame) for ts, frame in snapshot_stream(rows, RING_SNAPSHOTS)]
+    snapshot_ts, raw = stream[-1]
+    html = prices_table_html(raw, 'Scale test')
+
+    parsed = archive.parse_table(html, target)
+    kept = min(rows, target.max_rows or rows)
+    if len(parsed) != kept:
+        raise RuntimeError(f"Parsed {len(parsed)} rows from a table of {rows} (expected {kept})")
+    df = rows_to_dataframe(parsed, target.columns)
+    snapshot = normalize_snapshot(df, snapshot_ts)
+
+    # The ring only ever sees the rows the scraper kept
+    ring = SnapshotRing(RING_SNAPSHOTS, max_companies=rows) if uncapped else SnapshotRing(RING_SNAPSHOTS)
+    for ts, frame in stream:
+        ring.append(normalize_snapshot(frame.head(kept), ts))
+    index = SnapshotIndex()
+    index.rebuild(snapshot)
+    main.snapshot_index = index
+    main.snapshot_ring = ring
+
+    stores = itertools.count()
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url='http://scaletest')
+    loop = asyncio.new_event_loop()
+
+    def get(url):
+        def call():
+            response = loop.run_until_complete(client.get(url))
+            response.raise_for_status()
+            return response
+        return call
+
+    stages = {
+        'parse': lambda: archive.parse_table(html, target),
+        'validate': lambda: find_issues(parsed, target.columns),
+        'dataframe': lambda: rows_to_dataframe(parsed, target.columns),
+        'normalize': lambda: normalize_snapshot(df, snapshot_ts),
+        'excel': lambda: main.write_export(df, main.DATA_DIR / f'scale_{rows}.xlsx'),
+        'history': lambda: HistoryStore(Path(workdir) / 'history' / f'{rows}-{next(stores)}').append(snapshot),
+        'index': lambda: SnapshotIndex().rebuild(snapshot),
+        'ring': lambda: ring.append(snapshot),
+        'api_query': get('/query?sort=-market_cap&limit=1000'),
+        'api_recent': get('/recent?field=last'),
+    }
+
+    def close():
+        loop.run_until_complete(client.aclose())
+        loop.close()
+
+    recent = len(get('/recent?field=last')().json()['companies'])
+    coverage = {
+        'rows': rows,
+        'parsed': len(parsed),
+        'truncated': rows - len(parsed),
+        'ring_companies': len(ring.names),
+        'ring_dropped': ring.dropped_companies,
+        'recent_companies': recent,
+        'missing_from_recent': rows - recent,
+    }
+    return stages, close, coverage
+
+
+def run(sizes, repeats, uncapped=False):
+    # One log line per request would drown the report
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='egx-scaletest-') as workdir:
+        os.chdir(workdir)
+        try:
+            sys.path.insert(0, str(REPO_DIR))
+            import main
+
+            results = {}
+            coverage = []
+            for rows in sizes:
+                stages, close, lost = size_stages(main, rows, workdir, uncapped)
+                coverage.append(lost)
+                try:
+                    for name, call in stages.items():
+                        seconds, peak = measure(call, repeats)
+                        results.setdefault(name, {'seconds': [], 'peak_bytes': []})
+                        results[name]['seconds'].append(round(seconds, 6))
+                        results[name]['peak_bytes'].append(peak)
+                finally:
+                    close()
+                logger.info(f"{rows} rows done")
+        finally:
+            os.chdir(cwd)
+
+    for stage in results.values():
+        stage['time_exponent'] = growth_exponent(sizes, stage['seconds'])
+        stage['memory_exponent'] = growth_exponent(sizes, stage['peak_bytes'])
+        stage['time_step_exponents'] = step_exponents(sizes, stage['seconds'])
+        stage['superlinear'] = any(e > SUPERLINEAR for e in stage['time_step_exponents'])
+    return {'rows': sizes, 'repeats': repeats, 'uncapped': uncapped, 'coverage': coverage, 'stages': results}
+
+
+def log_report(report):
+    sizes = report['rows']
+    logger.info(f"{'stage':<11}" + ''.join(f"{n:>18}" for n in sizes) + f"{'time exp':>10}{'mem exp':>9}")
+    for name, stage in report['stages'].items():
+        cells = ''.join(
+            f"{seconds * 1000:>9.2f} ms {peak / 1e6:>5.1f} MB"
+            for seconds, peak in zip(stage['seconds'], stage['peak_bytes'])
+        )
+        flag = f"  superlinear (steps {stage['time_step_exponents']})" if stage['superlinear'] else ''
+        logger.info(f"{name:<11}{cells}{stage['time_exponent']:>10}{stage['memory_exponent']:>9}{flag}")
+    for lost in report['coverage']:
+        line = (
+            f"{lost['rows']} rows: {lost['parsed']} parsed ({lost['truncated']} truncated), "
+            f"{lost['ring_companies']} in the ring ({lost['ring_dropped']} dropped), "
+            f"{lost['recent_companies']} in /recent ({lost['missing_from_recent']} missing)"
+        )
+        if lost['truncated'] or lost['ring_dropped'] or lost['missing_from_recent']:
+            logger.warning(line)
+        else:
+            logger.info(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory of each pipeline stage against table size")
+    parser.add_argument('--rows', default=DEFAULT_ROWS, help="Comma-separated table sizes")
+    parser.add_argument('--repeats', type=int, default=5, help="Timed runs per stage and size (median)")
+    parser.add_argument('--uncapped', action='store_true',
+                        help="Lift the target's max_rows and the ring's company cap to measure the stages alone")
+    parser.add_argument('--output', help="Where to write the JSON report")
+    args = parser.parse_args(argv)
+
+    sizes = sorted({int(n) for n in args.rows.split(',') if n.strip()})
+    report = run(sizes, args.repeats, args.uncapped)
+    log_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
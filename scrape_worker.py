@@ -0,0 +1,279 @@
+"""
+Isolated scraper worker process.
+
+Scrapes run in a supervised child process, and the browser driver and
+virtual display live and die with it, so a leaking browser or a stuck
+driver.quit() cannot grow or hang the API process. The supervisor enforces
+an RSS ceiling over the whole process tree and a wall-clock timeout, and it
+recycles the worker after a number of runs. Results come back as Arrow IPC
+streams rather than pickled objects.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+WORKER_MAX_RSS_MB = int(os.getenv('WORKER_MAX_RSS_MB', '1536'))
+WORKER_TIMEOUT_SECONDS = int(os.getenv('WORKER_TIMEOUT_SECONDS', '300'))
+WORKER_MAX_RUNS = int(os.getenv('WORKER_MAX_RUNS', '10'))
+
+# How often the supervisor samples the worker's memory
+MONITOR_INTERVAL = 1.0
+
+
+class WorkerError(Exception):
+    """The worker failed, was killed or returned an error"""
+
+
+def _encode_frame(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _decode_frame(payload):
+    return pa.ipc.open_stream(pa.py_buffer(payload)).read_all().to_pandas()
+
+
+def _run_job(job):
+    from targets import get_targets
+
+    targets = get_targets(job['targets'])
+    expected_rows = job.get('expected_rows')
+    stats = {}
+    if job.get('engine') == 'async':
+        from async_scraper import async_run_targets
+        results = asyncio.run(async_run_targets(targets, stats=stats, expected_rows=expected_rows))
+    else:
+        from scraper import run_targets
+        results = run_targets(targets, stats=stats, expected_rows=expected_rows)
+    return results, stats
+
+
+def _worker_main(conn):
+    """Child process loop: one job in, one result out, until told to stop"""
+    logging.basicConfig(level=logging.INFO)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        try:
+            results, stats = _run_job(job)
+            names = list(results)
+            conn.send_bytes(json.dumps({
+                'ok': True,
+                'stats': stats,
+                'targets': [{'name': name, 'header': results[name][1]} for name in names],
+            }, default=str).encode())
+            for name in names:
+                conn.send_bytes(_encode_frame(results[name][0]))
+        except Exception as e:
+            conn.send_bytes(json.dumps({'ok': False, 'error': str(e)}).encode())
+
+
+def _kill_tree(pid):
+    """Kill a process and every descendant (driver and browser included)"""
+    import psutil
+    try:
+        root = psutil.Process(pid)
+    except psutil.NoSuchProcess:
+        return
+    processes = root.children(recursive=True) + [root]
+    for proc in processes:
+        try:
+            proc.kill()
+        except psutil.NoSuchProcess:
+            pass
+    psutil.wait_procs(processes, timeout=5)
+
+
+def _tree_rss_mb(pid):
+    import psutil
+    try:
+        root = psutil.Process(pid)
+        total = 0
+        for proc in [root] + root.children(recursive=True):
+            try:
+                total += proc.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total / (1024 * 1024)
+    except psutil.NoSuchProcess:
+        return 0.0
+
+
+class ScrapeWorker:
+    """Supervisor of one scraper child process"""
+
+    def __init__(self, max_rss_mb=WORKER_MAX_RSS_MB, timeout=WORKER_TIMEOUT_SECONDS, max_runs=WORKER_MAX_RUNS,
+                 run=asyncio.to_thread):
+        self.max_rss_mb = max_rss_mb
+        self.timeout = timeout
+        self.max_runs = max_runs
+        # Runs the blocking calls (pipe reads, stop, kill): run(fn, *args)
+        self._run = run
+        self.process = None
+        self.conn = None
+        self.runs = 0
+        self.restarts = 0
+        self.peak_rss_mb = 0.0
+        self.last_exit_reason = None
+        self._lock = asyncio.Lock()
+
+    def start(self):
+        ctx = multiprocessing.get_context('spawn')
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), name='scrape-worker', daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.runs = 0
+        self.peak_rss_mb = 0.0
+        logger.info(f"Scrape worker started (pid {self.process.pid})")
+
+    def stop(self, reason='stopped'):
+        if self.process is None:
+            return
+        try:
+            if self.process.is_alive():
+                self.conn.send(None)
+                self.process.join(timeout=5)
+        except (OSError, ValueError):
+            pass
+        if self.process.is_alive():
+            _kill_tree(self.process.pid)
+        self.conn.close()
+        logger.info(f"Scrape worker {self.process.pid} {reason} after {self.runs} run(s)")
+        self.last_exit_reason = reason
+        self.process = None
+        self.conn = None
+
+    def kill(self, reason):
+        if self.process is None:
+            return
+        logger.warning(f"Killing scrape worker {self.process.pid}: {reason}")
+        _kill_tree(self.process.pid)
+        self.process.join(timeout=1)
+        self.conn.close()
+        self.last_exit_reason = reason
+        self.process = None
+        self.conn = None
+        self.restarts += 1
+
+    async def _readable(self):
+        """Wait until the worker has sent something, without a thread"""
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = self.conn.fileno()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fd)
+
+    async def _watch(self):
+        """Raise when the worker exceeds its memory ceiling or dies"""
+        while True:
+            await asyncio.sleep(MONITOR_INTERVAL)
+            if not self.process.is_alive():
+                raise WorkerError(f"Worker exited with code {self.process.exitcode}")
+            rss = _tree_rss_mb(self.process.pid)
+            self.peak_rss_mb = max(self.peak_rss_mb, rss)
+            if rss > self.max_rss_mb:
+                raise WorkerError(f"Worker exceeded memory ceiling ({rss:.0f} MB > {self.max_rss_mb} MB)")
+
+    def _recv_frame(self):
+        return _decode_frame(self.conn.recv_bytes())
+
+    async def _receive(self):
+        # Payloads are whole Arrow tables: read and decode them off the loop
+        await self._readable()
+        header = json.loads(await self._run(self.conn.recv_bytes))
+        if not header['ok']:
+            raise WorkerError(header['error'])
+        results = {}
+        for entry in header['targets']:
+            await self._readable()
+            results[entry['name']] = (await self._run(self._recv_frame), entry['header'])
+        return results, header['stats']
+
+    async def run(self, target_names, engine='selenium', stats=None, expected_rows=None):
+        """
+        Run one scrape job in the worker.
+        Returns: {target name: (DataFrame, header_text)}
+        """
+        async with self._lock:
+            if self.process is not None and (self.runs >= self.max_runs or not self.process.is_alive()):
+                await self._run(self.stop, 'recycled')
+            if self.process is None:
+                self.start()
+
+            started = time.perf_counter()
+            self.conn.send({'targets': list(target_names), 'engine': engine, 'expected_rows': expected_rows})
+            self.runs += 1
+
+            receive = asyncio.ensure_future(self._receive())
+            watch = asyncio.ensure_future(self._watch())
+            try:
+                done, _ = await asyncio.wait(
+                    {receive, watch}, timeout=self.timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+            except asyncio.CancelledError:
+                # The worker is mid-job; its late result must not reach the next run.
+                # Shielded, so a second cancellation cannot leave it half killed.
+                receive.cancel()
+                await asyncio.shield(self._run(self.kill, "cancelled"))
+                raise
+            finally:
+                watch.cancel()
+                if not receive.done():
+                    receive.cancel()
+
+            if receive in done:
+                try:
+                    # A WorkerError here is a failed job; the worker stays usable
+                    results, worker_stats = receive.result()
+                except (EOFError, OSError) as e:
+                    await self._run(self.kill, f"lost connection: {e}")
+                    raise WorkerError(f"Worker connection lost: {e}")
+            elif watch in done:
+                error = watch.exception()
+                await self._run(self.kill, str(error))
+                raise error
+            else:
+                await self._run(self.kill, f"timed out after {self.timeout} seconds")
+                raise WorkerError(f"Scrape timed out after {self.timeout} seconds")
+
+            if stats is not None:
+                stats.update(worker_stats)
+                stats['worker'] = {
+                    'pid': self.process.pid,
+                    'run': self.runs,
+                    'seconds': round(time.perf_counter() - started, 3),
+                    'peak_rss_mb': round(self.peak_rss_mb, 1),
+                }
+            return results
+
+    def info(self):
+        return {
+            'pid': self.process.pid if self.process else None,
+            'alive': bool(self.process and self.process.is_alive()),
+            'runs': self.runs,
+            'restarts': self.restarts,
+            'peak_rss_mb': round(self.peak_rss_mb, 1),
+            'last_exit_reason': self.last_exit_reason,
+            'max_rss_mb': self.max_rss_mb,
+            'timeout_seconds': self.timeout,
+            'max_runs': self.max_runs,
+        }
@@ -3,71 +3,229 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from selenium.webdriver.remote.webdriver import WebDriver as RemoteWebDriver
 import pandas as pd
 import time
 import os
 import logging
 import subprocess
+from network_shaping import (
+    apply_resource_blocking,
+    resource_blocking_enabled,
+    get_browser_rss_mb,
+    get_page_load_ms,
+    NetworkAccounting,
+)
+from targets import EGX_PRICES, plan_navigation
+from validation import repair_table
+from grid import get_grid_driver, GridUnavailable
+from launch_profiles import get_profile, chrome_options
+import archive
+from network_capture import NetworkCapture, network_extraction_enabled
 
 logger = logging.getLogger(__name__)
 
-# Start virtual display for headless mode
-try:
-    from pyvirtualdisplay import Display
-    display = Display(visible=0, size=(1920, 1080))
-    display.start()
-    logger.info("Virtual display started")
-except ImportError:
-    logger.warning("pyvirtualdisplay not available, running without virtual display")
-except Exception as e:
-    logger.warning(f"Could not start virtual display: {e}")
+# Where browser sessions come from: "local" (Chromium in this container) or
+# "grid" (remote sessions on SELENIUM_GRID_URL, see grid.py)
+BROWSER_BACKEND = os.getenv('BROWSER_BACKEND', 'local').lower()
 
-def get_selenium_grid_driver():
+# Fall back to local Chromium when no grid session can be had
+GRID_FALLBACK_LOCAL = os.getenv('GRID_FALLBACK_LOCAL', 'true').lower() in ('1', 'true', 'yes')
+
+# Virtual display for the windowed browser, started on first use so that
+# only the process that launches the browser (e.g. the scrape worker) runs Xvfb
+display = None
+
+def ensure_virtual_display():
+    """Start the virtual display once per process"""
+    global display
+    if display is not None:
+        return display
+    try:
+        from pyvirtualdisplay import Display
+        display = Display(visible=0, size=(1920, 1080))
+        display.start()
+        logger.info("Virtual display started")
+    except ImportError:
+        display = False
+        logger.warning("pyvirtualdisplay not available, running without virtual display")
+    except Exception as e:
+        display = False
+        logger.warning(f"Could not start virtual display: {e}")
+    return display
+
+# Reads the data rows of a table in one round trip. Arguments: table XPath,
+# [cell index, CSS selector] per column, maximum number of rows.
+TABLE_ROWS_JS = """
+const [xpath, specs, maxRows] = arguments;
+const table = document.evaluate(xpath, document, null,
+    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!table) return null;
+const body = table.tBodies.length ? table.tBodies[0] : table;
+const end = maxRows ? Math.min(body.rows.length, maxRows + 1) : body.rows.length;
+const rows = [];
+for (let i = 1; i < end; i++) {
+    const tds = body.rows[i].cells;
+    rows.push(specs.map(([cell, selector]) => {
+        const td = tds[cell];
+        if (!td) return '';
+        const node = selector ? td.querySelector(selector) : null;
+        return ((node || td).innerText || '').trim();
+    }));
+}
+return rows;
+"""
+
+# Reads selected data rows (0-based, after the header row). Arguments: table
+# XPath, [cell index, CSS selector] per column, row positions.
+TABLE_CELLS_JS = """
+const [xpath, specs, positions] = arguments;
+const table = document.evaluate(xpath, document, null,
+    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!table) return null;
+const body = table.tBodies.length ? table.tBodies[0] : table;
+return positions.map(position => {
+    const row = body.rows[position + 1];
+    if (!row) return null;
+    return specs.map(([cell, selector]) => {
+        const td = row.cells[cell];
+        if (!td) return '';
+        const node = selector ? td.querySelector(selector) : null;
+        return ((node || td).innerText || '').trim();
+    });
+});
+"""
+
+# Remembers the table present before a click so TABLE_READY_JS only succeeds
+# once the postback has replaced it and its row count is stable.
+MARK_TABLE_JS = """
+const node = document.evaluate(arguments[0], document, null,
+    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+window.__egxPreviousTable = node;
+window.__egxRowCount = -1;
+return true;
+"""
+
+TABLE_READY_JS = """
+const node = document.evaluate(arguments[0], document, null,
+    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!node || node === window.__egxPreviousTable) return false;
+const count = node.rows.length;
+const stable = count > 1 && count === window.__egxRowCount;
+window.__egxRowCount = count;
+return stable;
+"""
+
+CLICK_JS = """
+const node = document.evaluate(arguments[0], document, null,
+    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!node) return false;
+node.click();
+return true;
+"""
+
+# Reads the outerHTML of a table for the page archive
+TABLE_HTML_JS = """
+const node = document.evaluate(arguments[0], document, null,
+    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+return node ? node.outerHTML : null;
+"""
+
+TEXT_JS = """
+const node = document.evaluate(arguments[0], document, null,
+    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+return node ? node.innerText.trim() : null;
+"""
+
+
+def column_specs(target):
+    """Column schema of a target in the form TABLE_ROWS_JS expects"""
+    return [[c.cell, c.selector] for c in target.columns]
+
+
+def rows_to_dataframe(rows, columns=EGX_PRICES.columns):
     """
-    Connect to local Chrome browser using Selenium in background mode
+    Build the snapshot DataFrame from raw table rows (lists of cell texts).
+    Empty rows are skipped and 5 consecutive empty rows end the table.
     """
-    logger.info("Initializing local Chrome driver")
+    names = [c.name for c in columns]
+    suffixes = [(c.name, c.suffix) for c in columns if c.suffix]
+    stock_data = []
+    consecutive_empty = 0
+    
+    for cells in rows:
+        cells = list(cells)[:len(names)]
+        cells += [""] * (len(names) - len(cells))
+        row_data = dict(zip(names, cells))
+        
+        # e.g. add % symbol to percentage change column (نسبة التغير%)
+        for name, suffix in suffixes:
+            value = row_data[name]
+            if value and not value.endswith(suffix):
+                row_data[name] = value + suffix
+        
+        if any(row_data.values()):
+            stock_data.append(row_data)
+            consecutive_empty = 0
+        else:
+            consecutive_empty += 1
+            if consecutive_empty > 5:
+                break
+    
+    return pd.DataFrame(stock_data, columns=names)
+
+def get_selenium_grid_driver(report=None):
+    """
+    A browser session from the configured backend: the Selenium Grid
+    (failing over between browser types, then optionally to local Chromium)
+    or local Chromium. If a dict is passed as report it receives the
+    backend, browser, node and session acquisition time.
+    """
+    report = report if report is not None else {}
+    driver = None
+    if BROWSER_BACKEND == 'grid':
+        try:
+            driver = get_grid_driver(report=report)
+        except GridUnavailable as e:
+            if not GRID_FALLBACK_LOCAL:
+                raise
+            logger.warning(f"{e}; falling back to local Chrome")
+            report['grid_error'] = str(e)
+    if driver is None:
+        started = time.perf_counter()
+        driver = get_local_driver()
+        report.update({
+            'backend': 'local',
+            'browser': 'chromium',
+            'profile': get_profile().name,
+            'node': None,
+            'acquire_ms': round((time.perf_counter() - started) * 1000, 1),
+        })
+    
+    # Drop images, fonts, stylesheets and third-party scripts
+    apply_resource_blocking(driver)
+    return driver
+
+def get_local_driver(profile=None):
+    """
+    Launch local Chromium with a launch profile (BROWSER_PROFILE by default,
+    see launch_profiles.py); only the windowed profile starts Xvfb
+    """
+    profile = get_profile(profile)
+    logger.info(f"Initializing local Chrome driver ({profile.name} profile)")
+    if profile.xvfb:
+        ensure_virtual_display()
     
     last_error = None
     
     # Try Chrome with local binary
     for attempt in range(3):  # Retry up to 3 times
         try:
-            chrome_options = webdriver.ChromeOptions()
-            
-            # Critical options for container stability
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')  # Critical for memory constraints
-            chrome_options.add_argument('--disable-gpu')
-            chrome_options.add_argument('--disable-software-rasterizer')
-            chrome_options.add_argument('--disable-extensions')
-            chrome_options.add_argument('--disable-plugins')
-            chrome_options.add_argument('--disable-default-apps')
-            chrome_options.add_argument('--disable-sync')
-            chrome_options.add_argument('--disable-translate')
-            chrome_options.add_argument('--disable-background-networking')
-            chrome_options.add_argument('--disable-breakpad')
-            chrome_options.add_argument('--disable-component-extensions-with-background-pages')
-            chrome_options.add_argument('--disable-default-apps')
-            chrome_options.add_argument('--disable-preconnect')
-            
-            # Memory and performance optimizations
-            chrome_options.add_argument('--memory-pressure-off')
-            chrome_options.add_argument('--metrics-recording-only')
-            chrome_options.add_argument('--mute-audio')
-            chrome_options.add_argument('--no-first-run')
-            chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-            
-            # Window size
-            chrome_options.add_argument('--window-size=1280,720')
-            
-            # Use chromium binary (Debian package name)
-            chrome_options.binary_location = '/usr/bin/chromium'
+            options = chrome_options(profile)
             
             logger.info(f"Chrome attempt {attempt + 1}: Creating webdriver...")
-            driver = webdriver.Chrome(options=chrome_options)
-            logger.info("Connected with local Chrome")
+            driver = webdriver.Chrome(options=options)
+            logger.info(f"Connected with local Chrome ({profile.name} profile)")
+            
             return driver
         except Exception as e:
             last_error = e
@@ -80,235 +238,259 @@ def get_selenium_grid_driver():
     logger.error(f"Failed to initialize Chrome after all attempts: {error_msg}")
     raise Exception(f"Could not initialize Chrome: {error_msg}")
 
-def scrape_egx_stocks():
-    """
-    Scrapes stock data from Egyptian Exchange website using Selenium Grid
-    Returns: (DataFrame, header_text)
+def _dismiss_alert(driver):
+    """Accept an open alert, returning True if there was one"""
+    try:
+        alert = driver.switch_to.alert
+        logger.info(f"Alert detected: {alert.text}")
+        alert.accept()
+        logger.info("Alert dismissed")
+        return True
+    except Exception:
+        return False
+
+def _wait_for_page(driver, timeout=20):
+    """Wait for the document and any pending jQuery requests to finish"""
+    try:
+        WebDriverWait(driver, timeout).until(lambda d: d.execute_script("""
+            return document.readyState === 'complete' &&
+                (typeof jQuery === 'undefined' || jQuery.active === 0);
+        """))
+    except TimeoutException:
+        logger.warning("Page did not settle, continuing")
+
+def _table_ready(driver, xpath):
+    try:
+        return driver.execute_script(TABLE_READY_JS, xpath)
+    except Exception:
+        # An alert blocks scripts until it is dismissed
+        _dismiss_alert(driver)
+        return False
+
+def perform_step(driver, step, table_xpath, capture=None):
     """
-    # URL to scrape
-    url = "https://www.egx.com.eg/ar/prices.aspx"
-    
-    # Column names in Arabic
-    columns = [
-        'اسم الشركة',
-        'القطاع',
-        'الإقفال السابق',
-        'سعر الفتح',
-        'سعر الاغلاق',
-        'نسبة التغير%',
-        'آخر سعر',
-        'اعلى سعر',
-        'اقل سعر',
-        'القيمة (جنيه)',
-        'الكمية',
-        'عدد العمليات',
-        'رأس المال السوقى (مليون جنيه)'
-    ]
+    Click a navigation step and wait until the target table has been
+    replaced by the postback (or step.wait seconds have passed).
     
-    # Initialize driver from Selenium Grid
-    logger.info("Initializing Selenium Grid driver...")
-    driver = get_selenium_grid_driver()
+    With a NetworkCapture the wait ends on the postback response instead,
+    and the table parsed from it is left in capture.result; the DOM wait
+    is only the fallback.
+    """
+    # Try multiple times in case of alert errors
+    max_attempts = 3
+    clicked = None
     
-    try:
-        # Navigate to the URL
-        logger.info(f"Navigating to {url}...")
-        driver.get(url)
-        
-        # Wait for page to fully load with JavaScript
-        logger.info("Waiting for page to load (15 seconds)...")
-        time.sleep(5)
-        
-        # Execute JavaScript to wait for jQuery if available
+    for attempt in range(max_attempts):
         try:
-            driver.execute_script("""
-                if (typeof jQuery !== 'undefined') {
-                    jQuery(document).ready(function() {});
-                }
-            """)
-            time.sleep(3)
-        except:
-            pass
-        
-        logger.info("Waiting for button element...")
-        time.sleep(5)
-        
-        # Click the button using XPath
-        button_xpath = "/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/table[1]/tbody/tr[2]/td/div/div/ul/li[1]/a"
-        logger.info("Clicking the button...")
-        
-        # Try multiple times in case of alert errors
-        max_attempts = 3
-        button_found = False
-        
-        for attempt in range(max_attempts):
-            try:
-                logger.info(f"Button click attempt {attempt + 1}...")
-                button = WebDriverWait(driver, 20).until(
-                    EC.element_to_be_clickable((By.XPATH, button_xpath))
-                )
-                button_found = True
-                
-                # Use JavaScript click as alternative
-                driver.execute_script("arguments[0].click();", button)
-                logger.info(f"Button clicked successfully")
+            logger.info(f"Button click attempt {attempt + 1}...")
+            button = WebDriverWait(driver, 20).until(
+                EC.element_to_be_clickable((By.XPATH, step.xpath))
+            )
+            
+            driver.execute_script(MARK_TABLE_JS, table_xpath)
+            if capture is not None:
+                capture.arm(driver)
+            
+            # Use JavaScript click as alternative
+            driver.execute_script("arguments[0].click();", button)
+            clicked = time.time()
+            logger.info(f"Button clicked successfully")
+            
+            # Wait a moment for any alerts or page updates
+            time.sleep(1)
+            
+            if not _dismiss_alert(driver):
+                logger.info("No alert detected, proceeding...")
+                break
+            time.sleep(2)
                 
-                # Wait a moment for any alerts or page updates
+        except TimeoutException:
+            logger.warning(f"Timeout waiting for button (attempt {attempt + 1}/{max_attempts})")
+            if attempt < max_attempts - 1:
+                logger.info("Retrying after delay...")
                 time.sleep(3)
-                
-                # Check for and dismiss any alerts
-                try:
-                    alert = driver.switch_to.alert
-                    alert_text = alert.text
-                    logger.info(f"Alert detected: {alert_text}")
-                    alert.accept()
-                    logger.info("Alert dismissed")
-                    time.sleep(2)
-                except:
-                    # No alert, success
-                    logger.info("No alert detected, proceeding...")
-                    break
-                    
-            except TimeoutException:
-                logger.warning(f"Timeout waiting for button (attempt {attempt + 1}/{max_attempts})")
-                if attempt < max_attempts - 1:
-                    logger.info("Retrying after delay...")
-                    time.sleep(3)
-            except Exception as e:
-                logger.warning(f"Button click failed (attempt {attempt + 1}): {str(e)}")
-                if attempt < max_attempts - 1:
-                    logger.info("Retrying after delay...")
-                    time.sleep(3)
-                else:
-                    raise
-        
-        if not button_found:
-            logger.error("Could not find button element after all attempts")
-            raise Exception("Button element not found")
-        
-        # Wait for table to appear with longer timeout
-        logger.info("Waiting for table to load (30 seconds)...")
-        time.sleep(30)
-        
-        # Check for any remaining alerts
-        try:
-            alert = driver.switch_to.alert
-            logger.info(f"Alert found: {alert.text}")
-            alert.accept()
-            time.sleep(2)
-        except:
-            pass
-        
-        # Scrape the header text
-        header_xpath = "/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table/tbody/tr[1]/td[2]/p"
+        except Exception as e:
+            logger.warning(f"Button click failed (attempt {attempt + 1}): {str(e)}")
+            if attempt < max_attempts - 1:
+                logger.info("Retrying after delay...")
+                time.sleep(3)
+            else:
+                raise
+    
+    # The button may have been found on one attempt and failed to click on every one
+    if clicked is None:
+        logger.error("Could not click the button after all attempts")
+        raise Exception("Button could not be clicked")
+    
+    if capture is not None:
+        logger.info(f"Waiting for the table response (up to {step.wait} seconds)...")
+        if capture.wait(driver, step.wait):
+            _dismiss_alert(driver)
+            return
+        logger.info(f"Network capture fell back to the DOM ({capture.fallback_reason})")
+    
+    # Wait for table to appear
+    wait = max(1, step.wait - (time.time() - clicked))
+    logger.info(f"Waiting for table to load (up to {wait:.0f} seconds)...")
+    started = time.time()
+    try:
+        WebDriverWait(driver, wait, poll_frequency=0.5).until(
+            lambda d: _table_ready(d, table_xpath)
+        )
+        logger.info(f"Table loaded after {time.time() - started:.1f} seconds")
+    except TimeoutException:
+        logger.warning(f"Table not confirmed after {wait:.0f} seconds, reading what is there")
+    
+    # Check for any remaining alerts
+    _dismiss_alert(driver)
+
+def read_target(driver, target, expected_rows=None, repair=None, page=None, captured=None):
+    """
+    Read a target's table from the current page. Rows failing validation
+    (or missing compared to expected_rows) are re-read; pass a dict as
+    repair to receive the repair report, and one as page to receive the
+    table's HTML ('html') for the page archive. A CapturedTable (from the
+    network capture) supplies the rows instead of the DOM; repairs still
+    re-read the DOM.
+    Returns: (DataFrame, header_text)
+    """
+    header_text = "Not found"
+    if captured is not None and captured.header_text:
+        header_text = captured.header_text
+        logger.info(f"Header text: {header_text}")
+    elif target.header_xpath:
         try:
-            header_text = driver.find_element(By.XPATH, header_xpath).text
+            header_text = driver.find_element(By.XPATH, target.header_xpath).text
             logger.info(f"Header text: {header_text}")
         except NoSuchElementException:
-            header_text = "Not found"
             logger.warning("Header text not found")
+    
+    specs = column_specs(target)
+    if captured is not None:
+        rows = captured.rows
+    else:
+        rows = driver.execute_script(TABLE_ROWS_JS, target.table_xpath, specs, target.max_rows)
+    rows, report = repair_table(
+        rows or [], target,
+        lambda positions: driver.execute_script(TABLE_CELLS_JS, target.table_xpath, specs, positions),
+        expected_rows,
+    )
+    if repair is not None:
+        repair.update(report)
+    if page is not None:
+        page['html'] = captured.table_html if captured is not None else driver.execute_script(
+            TABLE_HTML_JS, target.table_xpath
+        )
+    df = rows_to_dataframe(rows, target.columns)
+    
+    logger.info(f"[{target.name}] Total rows scraped: {len(df)}")
+    if len(df) == 0:
+        logger.error("No data was scraped! The table might not have loaded properly.")
+        logger.error("This could be due to:")
+        logger.error("- XPath selectors not matching the current page structure")
+        logger.error("- JavaScript not rendering the table")
+        logger.error("- Network issues loading the page")
+    else:
+        logger.info(f"First 5 rows:\n{df.head()}")
+    
+    return df, header_text
+
+def run_targets(targets, driver=None, stats=None, expected_rows=None):
+    """
+    Scrape several targets through one browser session. Targets on the same
+    page share its navigation (see targets.plan_navigation).
+    Returns: {target name: (DataFrame, header_text)}
+    
+    expected_rows maps target names to the row count of their previous
+    snapshot; shorter tables are completed by re-reading the missing rows.
+    
+    If a dict is passed as stats, it is filled with the run's network report
+    (requests/bytes saved, page load time and browser RSS), row counts,
+    the per-target repair reports, how each table was extracted (DOM or
+    network capture) and, with PAGE_ARCHIVE on, the archived table of each
+    target.
+    """
+    own_driver = driver is None
+    browser = {}
+    if own_driver:
+        # Initialize driver from the configured backend (local or Selenium Grid)
+        logger.info(f"Initializing {BROWSER_BACKEND} browser driver...")
+        driver = get_selenium_grid_driver(browser)
+    network = NetworkAccounting()
+    page_load_ms = None
+    results = {}
+    repairs = {}
+    archived = {}
+    extraction = {}
+    
+    try:
+        for target, steps, reload in plan_navigation(targets):
+            if reload:
+                # Navigate to the URL
+                logger.info(f"Navigating to {target.url}...")
+                driver.get(target.url)
+                network.collect(driver)
+                page_load_ms = get_page_load_ms(driver)
+                _wait_for_page(driver)
+            else:
+                logger.info(f"[{target.name}] Reusing loaded page")
+            
+            capture = NetworkCapture(target, network) if steps and network_extraction_enabled() else None
+            for step in steps:
+                perform_step(driver, step, target.table_xpath, capture)
+            extraction[target.name] = capture.report() if capture else {'mode': 'dom'}
+            
+            repairs[target.name] = {}
+            page = {} if archive.PAGE_ARCHIVE else None
+            results[target.name] = read_target(
+                driver, target, (expected_rows or {}).get(target.name), repairs[target.name], page,
+                capture.result if capture else None,
+            )
+            if page:
+                archive.capture(archived, target.name, page.get('html'))
         
-        # Initialize data storage
-        stock_data = []
-        
-        # Scrape rows from 2 to 220
-        logger.info("Scraping stock data...")
-        consecutive_empty = 0
-        rows_found = 0
-        
-        for i in range(2, 221):
-            try:
-                row_data = {}
-                
-                # Scrape company name (column 2)
-                company_xpath = f"/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table/tbody/tr[{i}]/td[2]/div/div[2]/a/span"
-                try:
-                    company_name = driver.find_element(By.XPATH, company_xpath).text
-                    row_data['اسم الشركة'] = company_name
-                    rows_found += 1
-                except NoSuchElementException:
-                    try:
-                        alt_company_xpath = f"/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table/tbody/tr[{i}]/td[2]"
-                        company_name = driver.find_element(By.XPATH, alt_company_xpath).text
-                        row_data['اسم الشركة'] = company_name
-                        rows_found += 1
-                    except:
-                        row_data['اسم الشركة'] = ""
-                
-                # Scrape sector (column 3)
-                sector_xpath = f"/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table/tbody/tr[{i}]/td[3]/div"
-                try:
-                    sector = driver.find_element(By.XPATH, sector_xpath).text
-                    row_data['القطاع'] = sector
-                except NoSuchElementException:
-                    try:
-                        alt_sector_xpath = f"/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table/tbody/tr[{i}]/td[3]"
-                        sector = driver.find_element(By.XPATH, alt_sector_xpath).text
-                        row_data['القطاع'] = sector
-                    except:
-                        row_data['القطاع'] = ""
-                
-                # Scrape remaining columns (4 to 14)
-                for col_num in range(4, 15):
-                    col_index = col_num - 2
-                    col_name = columns[col_index]
-                    
-                    cell_xpath = f"/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table/tbody/tr[{i}]/td[{col_num}]"
-                    try:
-                        cell_value = driver.find_element(By.XPATH, cell_xpath).text
-                        
-                        # Add % symbol to percentage change column (نسبة التغير%)
-                        if col_name == 'نسبة التغير%' and cell_value and not cell_value.endswith('%'):
-                            cell_value = cell_value + '%'
-                        
-                        row_data[col_name] = cell_value
-                    except NoSuchElementException:
-                        row_data[col_name] = ""
-                
-                # Check if row has any data
-                if row_data['اسم الشركة'] or any(row_data.get(col, "") for col in columns):
-                    stock_data.append(row_data)
-                    consecutive_empty = 0
-                    if len(stock_data) % 20 == 0:
-                        logger.info(f"Scraped {len(stock_data)} stocks... (current row: {i})")
-                else:
-                    consecutive_empty += 1
-                    if consecutive_empty > 5:
-                        logger.info(f"Reached end of table at row {i} (5 consecutive empty rows)")
-                        break
-                
-            except Exception as e:
-                consecutive_empty += 1
-                if consecutive_empty > 5:
-                    logger.info(f"Reached end of table at row {i}")
-                    break
-        
-        logger.info(f"Total stocks scraped: {len(stock_data)} (rows with company names found: {rows_found})")
-        
-        # Check if we got any data
-        if len(stock_data) == 0:
-            logger.error("No data was scraped! The table might not have loaded properly.")
-            logger.error("This could be due to:")
-            logger.error("- XPath selectors not matching the current page structure")
-            logger.error("- JavaScript not rendering the table")
-            logger.error("- Network issues loading the page")
-        
-        # Create DataFrame
-        df = pd.DataFrame(stock_data, columns=columns)
-        
-        logger.info(f"Data prepared. Total rows: {len(df)}")
-        if len(df) > 0:
-            logger.info(f"First 5 rows:\n{df.head()}")
+        # Network report for this run
+        network.collect(driver)
+        report = network.summary(
+            blocking_enabled=resource_blocking_enabled(),
+            page_load_ms=page_load_ms,
+            browser_rss_mb=get_browser_rss_mb(driver),
+        )
+        logger.info(
+            f"Network: {report['requests']} requests ({report['requests_saved']} saved), {report['requests_blocked']} blocked, "
+            f"{report['bytes_transferred']} bytes transferred ({report['bytes_saved']} saved), "
+            f"page load {report['page_load_ms']} ms ({report['page_load_saved_ms']} saved), "
+            f"browser RSS {report['browser_rss_mb']} MB ({report['browser_rss_saved_mb']} saved)"
+        )
+        if stats is not None:
+            stats['network'] = report
+            stats['rows'] = {name: len(df) for name, (df, _) in results.items()}
+            stats['repair'] = repairs
+            stats['repaired_rows'] = sum(r.get('repaired_rows', 0) for r in repairs.values())
+            stats['extraction'] = extraction
+            if browser:
+                stats['browser'] = browser
+            if archived:
+                stats['archive'] = archived
         
-        return df, header_text
+        return results
         
     except Exception as e:
         logger.error(f"An error occurred during scraping: {str(e)}")
         raise
         
     finally:
-        # Close the browser
-        logger.info("Closing Selenium Grid connection...")
-        driver.quit()
+        if own_driver:
+            # Close the browser (ends the grid session and frees its slot)
+            logger.info("Closing browser session...")
+            driver.quit()
+
+def scrape_egx_stocks(stats=None):
+    """
+    Scrapes stock data from Egyptian Exchange website using Selenium Grid
+    Returns: (DataFrame, header_text)
+    """
+    return run_targets([EGX_PRICES], stats=stats)[EGX_PRICES.name]
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -0,0 +1,276 @@
+"""
+Read-only SQL over the snapshot history.
+
+Each query gets its own in-memory DuckDB connection. The history store is
+registered as an Arrow dataset and exposed through views, so the connection
+itself never gets a path: external access is off entirely, and COPY or any
+other file access fails. Memory and threads are capped and the
+configuration is locked. Only a single SELECT statement is accepted; query
+plans come from the explain flag, which prefixes the checked SELECT with
+EXPLAIN (ANALYZE). A timer interrupts queries that run past
+the timeout, results are capped at a row limit, and rows are streamed out
+as CSV or Arrow IPC batches as DuckDB produces them.
+
+Views:
+    snapshots  - the stored columns (Arabic names), plus the `date` partition
+    prices     - the same rows with English column names (see query.py aliases)
+"""
+import io
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+
+from history import NUMERIC_COLUMNS, TEXT_COLUMNS
+from query import COLUMN_ALIASES
+
+logger = logging.getLogger(__name__)
+
+SQL_TIMEOUT_SECONDS = float(os.getenv('SQL_TIMEOUT_SECONDS', '30'))
+SQL_MAX_ROWS = int(os.getenv('SQL_MAX_ROWS', '100000'))
+SQL_MEMORY_LIMIT = os.getenv('SQL_MEMORY_LIMIT', '512MB')
+SQL_THREADS = int(os.getenv('SQL_THREADS', '2'))
+SQL_MAX_CONCURRENCY = int(os.getenv('SQL_MAX_CONCURRENCY', '2'))
+
+BATCH_ROWS = 10_000
+
+ALLOWED_STATEMENTS = {duckdb.StatementType.SELECT}
+
+# Stored columns plus the hive `date` partition; older files lacking a column read it as null
+HISTORY_SCHEMA = pa.schema(
+    [('snapshot_id', pa.string()), ('snapshot_ts', pa.timestamp('ns'))]
+    + [(c, pa.string()) for c in TEXT_COLUMNS]
+    + [(c, pa.float64()) for c in NUMERIC_COLUMNS]
+    + [('date', pa.date32())]
+)
+
+_slots = threading.BoundedSemaphore(SQL_MAX_CONCURRENCY)
+
+
+class SQLError(ValueError):
+    """The query was rejected or failed"""
+
+
+class SQLBusy(RuntimeError):
+    """All query slots are in use"""
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def connect(history_root):
+    """A locked-down connection with the history views defined"""
+    root = Path(history_root).resolve()
+    con = duckdb.connect(':memory:', config={
+        'memory_limit': SQL_MEMORY_LIMIT,
+        'threads': SQL_THREADS,
+        'autoinstall_known_extensions': False,
+        'autoload_known_extensions': False,
+    })
+    con.execute("SET enable_external_access = false")
+    files = sorted(str(path) for path in root.glob('date=*/*.parquet'))
+    if files:
+        # Scanned by Arrow, outside DuckDB's file system
+        dataset = ds.dataset(
+            files, schema=HISTORY_SCHEMA, format='parquet',
+            partitioning=ds.partitioning(pa.schema([('date', pa.date32())]), flavor='hive'),
+            partition_base_dir=str(root),
+        )
+        con.register('history_data', dataset)
+        con.execute("CREATE VIEW snapshots AS SELECT * FROM history_data")
+    else:
+        columns = ", ".join(
+            [f"NULL::VARCHAR AS {_quote(c)}" for c in TEXT_COLUMNS]
+            + [f"NULL::DOUBLE AS {_quote(c)}" for c in NUMERIC_COLUMNS]
+        )
+        con.execute(
+            f"CREATE VIEW snapshots AS SELECT NULL::VARCHAR AS snapshot_id, NULL::TIMESTAMP AS snapshot_ts, "
+            f"{columns}, NULL::DATE AS date WHERE false"
+        )
+    aliases = ", ".join(f"{_quote(arabic)} AS {english}" for english, arabic in COLUMN_ALIASES.items())
+    con.execute(f"CREATE VIEW prices AS SELECT snapshot_id, snapshot_ts, date, {aliases} FROM snapshots")
+    con.execute("SET lock_configuration = true")
+    return con
+
+
+def check_statement(con, sql):
+    """Reject anything but a single SELECT statement"""
+    try:
+        statements = con.extract_statements(sql)
+    except duckdb.Error as e:
+        raise SQLError(str(e))
+    if len(statements) != 1:
+        raise SQLError("Exactly one statement is allowed")
+    if statements[0].type == duckdb.StatementType.EXPLAIN:
+        raise SQLError("Use explain=true (and analyze=true) instead of an EXPLAIN statement")
+    if statements[0].type not in ALLOWED_STATEMENTS:
+        raise SQLError(f"Only SELECT queries are allowed, got {statements[0].type.name}")
+    return statements[0]
+
+
+class SQLQuery:
+    """
+    One query, executed when the results are iterated. Holds a concurrency
+    slot and a connection until closed.
+    """
+
+    def __init__(self, history_root, sql, max_rows=SQL_MAX_ROWS, timeout=SQL_TIMEOUT_SECONDS):
+        if not _slots.acquire(blocking=False):
+            raise SQLBusy("Too many SQL queries running, retry shortly")
+        try:
+            self.con = connect(history_root)
+            check_statement(self.con, sql)
+        except Exception:
+            _slots.release()
+            raise
+        self.sql = sql.strip().rstrip(';')
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self.rows = 0
+        self.timed_out = False
+        self.started = None
+        self.first_batch_ms = None
+        self.schema = None
+        self._reader = None
+        self._timer = None
+        self._closed = False
+
+    def _start(self):
+        self.started = time.perf_counter()
+
+        def interrupt():
+            self.timed_out = True
+            self.con.interrupt()
+
+        self._timer = threading.Timer(self.timeout, interrupt)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def open(self):
+        """
+        Start the query and its result reader, so bind and planning errors
+        surface before any output is sent
+        """
+        if self._reader is not None:
+            return self
+        self._start()
+        # The newline keeps a trailing -- comment from swallowing the parenthesis
+        sql = f"SELECT * FROM ({self.sql}\n) LIMIT {int(self.max_rows)}"
+        try:
+            self._reader = self.con.execute(sql).fetch_record_batch(BATCH_ROWS)
+        except duckdb.InterruptException:
+            self.close()
+            raise SQLError(f"Query timed out after {self.timeout:g} seconds")
+        except duckdb.Error as e:
+            self.close()
+            raise SQLError(str(e))
+        self.schema = self._reader.schema
+        return self
+
+    def batches(self):
+        """Yield Arrow record batches until the result or the row limit is exhausted"""
+        try:
+            self.open()
+            while True:
+                try:
+                    batch = self._reader.read_next_batch()
+                except StopIteration:
+                    break
+                if self.first_batch_ms is None:
+                    self.first_batch_ms = round((time.perf_counter() - self.started) * 1000, 2)
+                self.rows += batch.num_rows
+                yield batch
+        except duckdb.InterruptException:
+            raise SQLError(f"Query timed out after {self.timeout:g} seconds")
+        except duckdb.Error as e:
+            raise SQLError(str(e))
+        finally:
+            self.close()
+
+    def iter_csv(self):
+        """CSV chunks, header first"""
+        header = True
+        for batch in self.batches():
+            sink = io.BytesIO()
+            pa_csv.write_csv(pa.Table.from_batches([batch]), sink, pa_csv.WriteOptions(include_header=header))
+            header = False
+            yield sink.getvalue()
+        if header and self.schema is not None:
+            sink = io.BytesIO()
+            pa_csv.write_csv(self.schema.empty_table(), sink)
+            yield sink.getvalue()
+
+    def iter_arrow(self):
+        """Arrow IPC stream chunks (schema, then one message per batch)"""
+        sink = io.BytesIO()
+        writer = None
+        for batch in self.batches():
+            if writer is None:
+                writer = pa.ipc.new_stream(sink, self.schema)
+            writer.write_batch(batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+        if writer is None and self.schema is not None:
+            writer = pa.ipc.new_stream(sink, self.schema)
+        if writer is not None:
+            writer.close()
+            yield sink.getvalue()
+
+    def fetch_json(self):
+        """Whole (row-limited) result with timings, for small queries"""
+        batches = list(self.batches())
+        table = pa.Table.from_batches(batches, schema=self.schema)
+        return {
+            'columns': table.column_names,
+            'rows': [list(row.values()) for row in table.to_pylist()],
+            'row_count': table.num_rows,
+            'truncated': table.num_rows >= self.max_rows,
+            'elapsed_ms': round((time.perf_counter() - self.started) * 1000, 2),
+        }
+
+    def explain(self, analyze=False):
+        """Plan (and with analyze, per-operator timings) of the query"""
+        try:
+            sql = f"EXPLAIN {'ANALYZE ' if analyze else ''}{self.sql}"
+            self._start()
+            result = self.con.execute(sql).fetchall()
+            return {
+                'plan': "\n".join(row[-1] for row in result),
+                'elapsed_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            }
+        except duckdb.InterruptException:
+            raise SQLError(f"Query timed out after {self.timeout:g} seconds")
+        except duckdb.Error as e:
+            raise SQLError(str(e))
+        finally:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.started is not None:
+            logger.info(
+                f"SQL query finished: {self.rows} rows in {(time.perf_counter() - self.started) * 1000:.0f} ms"
+                + (" (timed out)" if self.timed_out else "")
+            )
+        try:
+            self.con.interrupt()
+            self.con.close()
+        finally:
+            _slots.release()
+
+    def __del__(self):
+        # A client that disconnects mid-stream leaves the generator unfinished
+        if not getattr(self, '_closed', True):
+            self.close()
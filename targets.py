@@ -0,0 +1,131 @@
+"""
+Scrape target definitions.
+
+A target describes one table to capture: the page URL, the navigation steps
+(clicks) that reveal it, the table locator and its column schema. Runners in
+scraper.py (Selenium) and async_scraper.py (DevTools) execute many targets
+through one browser, reusing navigation where targets share a page.
+"""
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Column:
+    """A column of the output, read from a table cell (0-based td index)"""
+    name: str
+    cell: int
+    selector: Optional[str] = None  # CSS selector inside the cell, falls back to the cell text
+    suffix: Optional[str] = None    # appended to non-empty values missing it
+    numeric: bool = False           # must parse as a number when present (see validation.py)
+    required: bool = False          # must not be blank
+
+
+@dataclass(frozen=True)
+class NavStep:
+    """Click an element after the page loads, then wait up to `wait` seconds for the table"""
+    xpath: str
+    wait: float = 30
+
+
+@dataclass(frozen=True)
+class ScrapeTarget:
+    name: str
+    url: str
+    table_xpath: str
+    columns: Tuple[Column, ...]
+    steps: Tuple[NavStep, ...] = ()
+    header_xpath: Optional[str] = None
+    filename: Optional[str] = None
+    max_rows: Optional[int] = None
+
+    @property
+    def column_names(self):
+        return [c.name for c in self.columns]
+
+    @property
+    def output_filename(self):
+        return self.filename or f"{self.name}_latest.xlsx"
+
+
+# URL to scrape
+EGX_PRICES_URL = "https://www.egx.com.eg/ar/prices.aspx"
+
+# Column names in Arabic
+COLUMNS = [
+    'اسم الشركة',
+    'القطاع',
+    'الإقفال السابق',
+    'سعر الفتح',
+    'سعر الاغلاق',
+    'نسبة التغير%',
+    'آخر سعر',
+    'اعلى سعر',
+    'اقل سعر',
+    'القيمة (جنيه)',
+    'الكمية',
+    'عدد العمليات',
+    'رأس المال السوقى (مليون جنيه)'
+]
+
+# Prices tab button, header paragraph and prices table
+BUTTON_XPATH = "/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/table[1]/tbody/tr[2]/td/div/div/ul/li[1]/a"
+HEADER_XPATH = "/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table/tbody/tr[1]/td[2]/p"
+TABLE_XPATH = "/html/body/form/table/tbody/tr[2]/td/center/center/div/table/tbody/tr[4]/td/div/div/table"
+
+EGX_PRICES = ScrapeTarget(
+    name='egx_prices',
+    url=EGX_PRICES_URL,
+    steps=(NavStep(BUTTON_XPATH, wait=30),),
+    table_xpath=TABLE_XPATH,
+    header_xpath=HEADER_XPATH,
+    filename='egx_stocks_latest.xlsx',
+    max_rows=219,
+    columns=(
+        # Company name sits in a nested link, sector in a div
+        Column(COLUMNS[0], 1, selector=':scope > div > div:nth-of-type(2) > a > span', required=True),
+        Column(COLUMNS[1], 2, selector=':scope > div'),
+        # Percentage change values are published without the % sign
+        *(Column(name, cell, suffix='%' if name == 'نسبة التغير%' else None, numeric=True)
+          for cell, name in enumerate(COLUMNS[2:], start=3)),
+    ),
+)
+
+TARGETS = {}
+
+
+def register_target(target):
+    """Make a target available to the runners and the scheduler by name"""
+    TARGETS[target.name] = target
+    return target
+
+
+def get_targets(names):
+    """Look up registered targets, raising KeyError for unknown names"""
+    return [TARGETS[name] for name in names]
+
+
+def plan_navigation(targets):
+    """
+    Order targets so those sharing a page run back to back, and return
+    (target, steps_to_run, reload) tuples. A target reuses the current page
+    when its URL matches and the steps already performed are a prefix of its
+    own steps; only the remaining steps are run.
+    """
+    ordered = sorted(targets, key=lambda t: (t.url, [step.xpath for step in t.steps]))
+    plan = []
+    current_url = None
+    current_steps = ()
+
+    for target in ordered:
+        same_page = target.url == current_url and target.steps[:len(current_steps)] == current_steps
+        if same_page:
+            plan.append((target, target.steps[len(current_steps):], False))
+        else:
+            plan.append((target, target.steps, True))
+        current_url = target.url
+        current_steps = target.steps
+    return plan
+
+
+register_target(EGX_PRICES)
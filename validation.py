@@ -0,0 +1,152 @@
+"""
+Row validation and targeted repair of scraped tables.
+
+Raw table rows (lists of cell texts, in table order) are checked against
+the target's column schema: required cells must be present, numeric cells
+must parse, blank rows inside the table and a row count well below the
+previous snapshot mean the table was read before it finished loading.
+Only the failing rows are then read again from the same page, a few times
+with a short pause, and their bad cells are replaced.
+"""
+import asyncio
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Attempts and pause (seconds) when re-reading failed rows
+REPAIR_ATTEMPTS = 3
+REPAIR_DELAY = 1.0
+
+# A table shorter than this fraction of the previous snapshot is incomplete
+ROW_COUNT_TOLERANCE = 0.95
+
+BLANK_VALUES = {'', '-', '--'}
+NUMBER_PATTERN = re.compile(r'^[+-]?(\d+(\.\d*)?|\.\d+)$')
+
+
+def is_number(value):
+    """'1,234.50', '-0.35%' and similar scraped numbers"""
+    return bool(NUMBER_PATTERN.match(re.sub(r'[,%\s]', '', value)))
+
+
+def bad_cells(cells, columns):
+    """Positions of invalid cells in a row, or None for a blank row"""
+    values = [(cells[i] if i < len(cells) else '') or '' for i in range(len(columns))]
+    if all(v.strip() in BLANK_VALUES for v in values):
+        return None
+    bad = []
+    numeric_present = False
+    for i, (value, column) in enumerate(zip(values, columns)):
+        value = value.strip()
+        if value in BLANK_VALUES:
+            if column.required:
+                bad.append(i)
+            continue
+        if column.numeric:
+            numeric_present = True
+            if not is_number(value):
+                bad.append(i)
+    # A row with text but no numbers at all was read half-rendered
+    if not numeric_present and any(c.numeric for c in columns):
+        bad.extend(i for i, c in enumerate(columns) if c.numeric and i not in bad)
+    return bad
+
+
+def find_issues(rows, columns, expected_rows=None, max_rows=None):
+    """
+    Returns (invalid, missing): invalid maps row position -> bad cell
+    positions (all cells for blank rows inside the table); missing lists row
+    positions expected from the previous snapshot but not read.
+    """
+    last = max((i for i, cells in enumerate(rows) if bad_cells(cells, columns) is not None), default=-1)
+    invalid = {}
+    for i in range(last + 1):
+        bad = bad_cells(rows[i], columns)
+        if bad is None:
+            invalid[i] = list(range(len(columns)))
+        elif bad:
+            invalid[i] = bad
+
+    missing = []
+    present = last + 1
+    if expected_rows and present < expected_rows * ROW_COUNT_TOLERANCE:
+        end = min(expected_rows, max_rows) if max_rows else expected_rows
+        missing = list(range(present, end))
+    return invalid, missing
+
+
+def merge_rows(rows, positions, fetched, invalid, columns):
+    """Replace bad cells (or whole missing rows) with re-read values that are valid"""
+    for position, cells in zip(positions, fetched or []):
+        if not cells:
+            continue
+        if position >= len(rows):
+            rows.extend([[''] * len(columns) for _ in range(position + 1 - len(rows))])
+        if position not in invalid:
+            rows[position] = list(cells)
+            continue
+        current = list(rows[position]) + [''] * (len(columns) - len(rows[position]))
+        fresh_bad = bad_cells(cells, columns)
+        if fresh_bad is None:
+            continue
+        for i in invalid[position]:
+            if i not in fresh_bad and i < len(cells):
+                current[i] = cells[i]
+        rows[position] = current
+    return rows
+
+
+def _plan(rows, target, expected_rows):
+    invalid, missing = find_issues(rows, target.columns, expected_rows, target.max_rows)
+    # Row positions are 0-based data rows; the page indexes them after the header row
+    return invalid, missing, sorted(invalid) + missing
+
+
+def _report(report, rows, target, expected_rows, attempts):
+    invalid, missing = find_issues(rows, target.columns, expected_rows, target.max_rows)
+    report['attempts'] = attempts
+    report['still_invalid'] = len(invalid)
+    report['still_missing'] = len(missing)
+    report['repaired_rows'] = max(0, report['invalid_rows'] - len(invalid)) + max(
+        0, report['missing_rows'] - len(missing)
+    )
+    if report['invalid_rows'] or report['missing_rows']:
+        logger.info(
+            f"[{target.name}] Repaired {report['repaired_rows']} row(s) "
+            f"({report['still_invalid']} invalid, {report['still_missing']} missing left)"
+        )
+    return report
+
+
+def repair_table(rows, target, fetch, expected_rows=None, attempts=REPAIR_ATTEMPTS, delay=REPAIR_DELAY):
+    """
+    Validate rows and re-read failing ones with fetch(row positions), which
+    returns the rows at those positions. Returns (rows, report).
+    """
+    rows = [list(cells) for cells in rows]
+    invalid, missing, positions = _plan(rows, target, expected_rows)
+    report = {'invalid_rows': len(invalid), 'missing_rows': len(missing)}
+    attempt = 0
+    while positions and attempt < attempts:
+        attempt += 1
+        time.sleep(delay)
+        merge_rows(rows, positions, fetch(positions), invalid, target.columns)
+        invalid, missing, positions = _plan(rows, target, expected_rows)
+    return rows, _report(report, rows, target, expected_rows, attempt)
+
+
+async def async_repair_table(rows, target, fetch, expected_rows=None, attempts=REPAIR_ATTEMPTS,
+                             delay=REPAIR_DELAY):
+    """repair_table for an async fetch coroutine function"""
+    rows = [list(cells) for cells in rows]
+    invalid, missing, positions = _plan(rows, target, expected_rows)
+    report = {'invalid_rows': len(invalid), 'missing_rows': len(missing)}
+    attempt = 0
+    while positions and attempt < attempts:
+        attempt += 1
+        await asyncio.sleep(delay)
+        merge_rows(rows, positions, await fetch(positions), invalid, target.columns)
+        invalid, missing, positions = _plan(rows, target, expected_rows)
+    return rows, _report(report, rows, target, expected_rows, attempt)